@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 # from decouple import config
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -47,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.instrumentation.RequestMetricsMiddleware',
+    # Compresses responses, so it comes before anything else that touches their content.
+    'app.responses.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,12 +60,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # After CorsMiddleware, so preflights pass and 401s carry CORS headers.
+    'app.firebase_auth.FirebaseAuthMiddleware',
 ]
 
 ROOT_URLCONF = 'Backend.urls'
 
+# Where the React app is served; the Google OAuth callback redirects back to it.
+FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173').rstrip('/')
+
 CORS_ALLOWED_ORIGINS = [
-    "http://localhost:5173",
+    FRONTEND_URL,
 ]
 # CORS_ALLOW_ALL_ORIGINS = True
 TEMPLATES = [
@@ -93,9 +102,26 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Keep connections open for this many seconds instead of one per request
+        # (0 closes them after every request), checked before each reuse.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# An optional read replica for the analysis dashboard's queries (see
+# app.routers). Reads stay on the primary for DB_REPLICA_LAG seconds after a
+# user's sync so they see its transactions.
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+DB_REPLICA_LAG = int(os.environ.get('DB_REPLICA_LAG', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -150,3 +176,139 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 GOOGLE_CLIENT_ID =  os.environ.get('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET =  os.environ.get('GOOGLE_CLIENT_SECRET')
 GOOGLE_REDIRECT_URI =  os.environ.get('GOOGLE_REDIRECT_URI')
+# Seconds the signed OAuth state from /app/api/google/state/ stays valid; the
+# user has that long to start connecting and finish on Google's consent page.
+GOOGLE_OAUTH_STATE_MAX_AGE = int(os.environ.get('GOOGLE_OAUTH_STATE_MAX_AGE', 600))
+
+# Gmail message fetching: messages per batch request (max 100) and how many
+# batches may be in flight at once.
+GMAIL_FETCH_BATCH_SIZE = int(os.environ.get('GMAIL_FETCH_BATCH_SIZE', 50))
+GMAIL_FETCH_CONCURRENCY = int(os.environ.get('GMAIL_FETCH_CONCURRENCY', 1))
+
+# Gmail listing allowlist, comma-separated. Unset means the senders with a
+# registered parser (SENDERS) or the built-in keyword list (KEYWORDS); set to
+# an empty string to drop that part of the filter.
+GMAIL_SYNC_SENDERS = os.environ.get('GMAIL_SYNC_SENDERS')
+GMAIL_SYNC_KEYWORDS = os.environ.get('GMAIL_SYNC_KEYWORDS')
+
+# Screen messages by From/Subject/snippet before downloading full bodies.
+GMAIL_METADATA_PREFILTER = os.environ.get('GMAIL_METADATA_PREFILTER', 'true').lower() == 'true'
+
+# Bytes of an email body part decoded for parsing; the rest is ignored.
+GMAIL_MAX_BODY_BYTES = int(os.environ.get('GMAIL_MAX_BODY_BYTES', 128 * 1024))
+
+# Async (ASGI) sync: Gmail API root, connection pool size, and requests in
+# flight per process and per user.
+GMAIL_API_ROOT_URL = os.environ.get('GMAIL_API_ROOT_URL', 'https://gmail.googleapis.com/')
+GMAIL_ASYNC_MAX_CONNECTIONS = int(os.environ.get('GMAIL_ASYNC_MAX_CONNECTIONS', 100))
+GMAIL_ASYNC_CONCURRENCY = int(os.environ.get('GMAIL_ASYNC_CONCURRENCY', 64))
+GMAIL_ASYNC_USER_CONCURRENCY = int(os.environ.get('GMAIL_ASYNC_USER_CONCURRENCY', 10))
+
+# Transaction categorization: descriptions per Gemini prompt, and size of the
+# in-process description -> category LRU.
+GEMINI_CATEGORY_CHUNK_SIZE = int(os.environ.get('GEMINI_CATEGORY_CHUNK_SIZE', 50))
+CATEGORY_CACHE_SIZE = int(os.environ.get('CATEGORY_CACHE_SIZE', 10000))
+
+# Local categorizer: probability needed to skip Gemini, and how often (in
+# seconds) it is retrained from categorized transactions.
+LOCAL_CATEGORY_MIN_CONFIDENCE = float(os.environ.get('LOCAL_CATEGORY_MIN_CONFIDENCE', 0.9))
+LOCAL_CATEGORY_MODEL_MAX_AGE = int(os.environ.get('LOCAL_CATEGORY_MODEL_MAX_AGE', 3600))
+
+# Analysis API: transactions per page by default, and the most a client may ask for.
+ANALYSIS_PAGE_SIZE = int(os.environ.get('ANALYSIS_PAGE_SIZE', 50))
+ANALYSIS_MAX_PAGE_SIZE = int(os.environ.get('ANALYSIS_MAX_PAGE_SIZE', 200))
+
+# AI insights: answers are cached by a hash of their prompt for
+# AI_INSIGHTS_CACHE_TIMEOUT seconds, in memory (least recently used evicted
+# past AI_INSIGHTS_CACHE_SIZE) or, if AI_INSIGHTS_CACHE_DIR is set, on disk so
+# they survive restarts. Misses are generated in the background by
+# AI_INSIGHTS_WORKERS threads (0 generates them in the request); a request
+# waits up to AI_INSIGHTS_WAIT seconds for one before answering with the
+# previous or placeholder text.
+AI_INSIGHTS_CACHE_TIMEOUT = int(os.environ.get('AI_INSIGHTS_CACHE_TIMEOUT', 24 * 3600))
+AI_INSIGHTS_CACHE_SIZE = int(os.environ.get('AI_INSIGHTS_CACHE_SIZE', 1000))
+AI_INSIGHTS_CACHE_DIR = os.environ.get('AI_INSIGHTS_CACHE_DIR')
+AI_INSIGHTS_WORKERS = int(os.environ.get('AI_INSIGHTS_WORKERS', 2))
+AI_INSIGHTS_WAIT = float(os.environ.get('AI_INSIGHTS_WAIT', 0))
+# Seconds a failed generation is remembered before the prompt is tried again.
+AI_INSIGHTS_FAILURE_TTL = int(os.environ.get('AI_INSIGHTS_FAILURE_TTL', 60))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'insights': {
+        'BACKEND': ('django.core.cache.backends.filebased.FileBasedCache' if AI_INSIGHTS_CACHE_DIR
+                    else 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': AI_INSIGHTS_CACHE_DIR or 'ai-insights',
+        'TIMEOUT': AI_INSIGHTS_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': AI_INSIGHTS_CACHE_SIZE},
+    },
+}
+
+# Google access tokens are refreshed when they have less than this many
+# seconds left, before a Gmail request can fail with 401.
+GOOGLE_TOKEN_REFRESH_MARGIN = int(os.environ.get('GOOGLE_TOKEN_REFRESH_MARGIN', 300))
+
+# Metrics for /metrics (per process); false turns spans and counters off.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# App logging: DEBUG, INFO, WARNING, ERROR or OFF, as JSON lines or plain text.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'app.instrumentation.JsonFormatter'},
+        'text': {'format': '[%(levelname)s] %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+        'null': {'class': 'logging.NullHandler'},
+    },
+    'loggers': {
+        'app': {
+            'handlers': ['null'] if LOG_LEVEL == 'OFF' else ['console'],
+            'level': logging.CRITICAL + 1 if LOG_LEVEL == 'OFF' else LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# Background sync scheduling (manage.py schedule_syncs): users whose last sync
+# is older than SYNC_SCHEDULE_INTERVAL minutes get a sync spread over the next
+# interval, and workers start at most SYNC_MAX_STARTS_PER_MINUTE syncs per
+# minute across all processes (0 for no limit), to stay within Gmail quota.
+SYNC_SCHEDULE_INTERVAL = int(os.environ.get('SYNC_SCHEDULE_INTERVAL', 60))
+SYNC_MAX_STARTS_PER_MINUTE = int(os.environ.get('SYNC_MAX_STARTS_PER_MINUTE', 60))
+
+# Syncs that fail to parse a message retry it this many times; after that it
+# stays failed in the ledger and no longer holds the sync cursor back.
+SYNC_MAX_PARSE_ATTEMPTS = int(os.environ.get('SYNC_MAX_PARSE_ATTEMPTS', 3))
+
+# Sync workers touch a running job every SYNC_HEARTBEAT_INTERVAL seconds and
+# re-queue jobs whose heartbeat is older than SYNC_STALE_AFTER seconds (their
+# worker died). Finished jobs are deleted after SYNC_JOB_RETENTION_DAYS.
+SYNC_HEARTBEAT_INTERVAL = int(os.environ.get('SYNC_HEARTBEAT_INTERVAL', 30))
+SYNC_STALE_AFTER = int(os.environ.get('SYNC_STALE_AFTER', 180))
+SYNC_JOB_RETENTION_DAYS = int(os.environ.get('SYNC_JOB_RETENTION_DAYS', 30))
+
+# Calendar months of history behind the trends on the analysis dashboard.
+ANALYTICS_MONTHS = int(os.environ.get('ANALYTICS_MONTHS', 12))
+
+# Firebase Authentication (see app.firebase_auth). With FIREBASE_PROJECT_ID set,
+# API requests must carry the user's Firebase ID token, verified locally with
+# Google's public certificates; without it the API trusts the `uid` requests
+# send, for local development. Profiles are cached per process for
+# FIREBASE_PROFILE_CACHE_TTL seconds; a save in one process only drops the
+# cached copy there, so keep this short (it bounds how long other workers
+# may show an outdated profile).
+FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID')
+FIREBASE_CERTS_URL = os.environ.get(
+    'FIREBASE_CERTS_URL',
+    'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com',
+)
+FIREBASE_TOKEN_CACHE_SIZE = int(os.environ.get('FIREBASE_TOKEN_CACHE_SIZE', 10000))
+FIREBASE_PROFILE_CACHE_TTL = int(os.environ.get('FIREBASE_PROFILE_CACHE_TTL', 30))
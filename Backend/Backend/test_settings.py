@@ -0,0 +1,27 @@
+"""
+Settings for the test suite, which needs no database server:
+
+    python manage.py test app --settings=Backend.test_settings
+
+Both aliases are SQLite, and the replica gets its own test database instead
+of mirroring the primary, so app.tests.ReplicaRoutingTests can tell which
+one each query went to.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import LOGGING
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+# Keep the app's JSON log lines, including the warnings that tests of failure
+# paths trigger on purpose, out of the test output. assertLogs installs its
+# own handler and level, so tests can still check what was logged.
+LOGGING['loggers']['app'].update(handlers=['null'], level='WARNING')
@@ -0,0 +1,107 @@
+"""
+Request parsing and transaction paging for the analysis API.
+
+A request selects a window of dates: `start_date`/`end_date` (ISO dates, both
+inclusive, either optional), or a calendar `month` and `year`, or `daily` for
+today; with none of these it covers the whole history. Transactions in the
+window are returned newest first, `limit` at a time, with keyset pagination
+on (date, id): each page carries an opaque `next_cursor` that the client
+sends back for the following page, so a page costs the same however deep
+into the history it is.
+"""
+import base64
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .rollups import month_range
+
+# Only what the dashboard renders.
+TRANSACTION_FIELDS = ('id', 'date', 'description', 'category', 'amount', 'transaction_type')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format.")
+
+
+def parse_window(data, today=None):
+    """
+    Returns the [start, end) dates selected by the request data; either may
+    be None for an open end. Raises ValueError for malformed values.
+    """
+    if data.get('start_date') or data.get('end_date'):
+        start = _parse_date(data['start_date'], 'start_date') if data.get('start_date') else None
+        end = _parse_date(data['end_date'], 'end_date') if data.get('end_date') else None
+        if start and end and start > end:
+            raise ValueError("start_date must not be after end_date.")
+        return start, end and end + datetime.timedelta(days=1)
+
+    if data.get('daily'):
+        today = today or timezone.localdate()
+        return today, today + datetime.timedelta(days=1)
+
+    if data.get('month') or data.get('year'):
+        try:
+            month, year = int(data.get('month')), int(data.get('year'))
+            return month_range(year, month)
+        except (TypeError, ValueError):
+            raise ValueError("month and year must be given together as numbers (month 1-12).")
+
+    return None, None
+
+
+def parse_limit(value):
+    """The page size requested, clamped to [1, ANALYSIS_MAX_PAGE_SIZE]."""
+    if value in (None, ''):
+        return settings.ANALYSIS_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be a number.")
+    return max(1, min(limit, settings.ANALYSIS_MAX_PAGE_SIZE))
+
+
+def encode_cursor(date, pk):
+    return base64.urlsafe_b64encode(f'{date.isoformat()}:{pk}'.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Returns the (date, id) a cursor points after. Raises ValueError if it is malformed."""
+    try:
+        date, _, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').partition(':')
+        return datetime.date.fromisoformat(date), int(pk)
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor.")
+
+
+def filter_window(transactions, start, end, category=None):
+    if start:
+        transactions = transactions.filter(date__gte=start)
+    if end:
+        transactions = transactions.filter(date__lt=end)
+    if category:
+        transactions = transactions.filter(category=category)
+    return transactions
+
+
+def transaction_page(transactions, cursor=None, limit=None):
+    """
+    Returns (rows, next_cursor): up to `limit` transactions as dicts of
+    TRANSACTION_FIELDS, newest first, starting after `cursor`. next_cursor
+    is None on the last page.
+    """
+    limit = limit or settings.ANALYSIS_PAGE_SIZE
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        transactions = transactions.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+    # One extra row tells whether there is a next page without a COUNT.
+    rows = list(transactions.order_by('-date', '-id').values(*TRANSACTION_FIELDS)[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['date'], rows[-1]['id'])
@@ -0,0 +1,364 @@
+"""
+Async Gmail sync for the ASGI application.
+
+AsyncGmailSyncEngine runs the same pipeline as GmailSyncEngine (list, ledger,
+metadata screening, full download, parse, save) on the event loop. Requests
+go over an httpx.AsyncClient whose connection pool is shared by every sync
+running on the loop; a global semaphore bounds the requests in flight for the
+whole process and a per-user semaphore keeps one mailbox from taking all of
+them. Database access goes through Django's async ORM; parsing, which is
+CPU-bound, runs off the loop.
+
+sync_user() runs each sync as a SyncJob, so it excludes queued and
+scheduled worker syncs of the same user like they exclude each other.
+"""
+import asyncio
+import email
+import json
+import os
+import random
+import re
+import socket
+import urllib.parse
+import weakref
+from collections import defaultdict
+
+import httplib2
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .gmail_client import user_credentials
+from .gmail_fetch import RETRYABLE_STATUSES, _chunks, _status_of
+from .instrumentation import span
+from .jobs import finish_job, start_job
+from .models import ProcessedMessage, SyncCursor, SyncJob
+from .prefilter import METADATA_HEADERS
+from .sync import LEDGER_CHUNK_SIZE, GmailSyncEngine, HistoryExpired
+
+API_PATH = 'gmail/v1/users/me/'
+BOUNDARY = 'async_gmail_batch'
+
+
+class _LoopResources:
+    """The connection pool and concurrency limits shared on one event loop."""
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=settings.GMAIL_ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=settings.GMAIL_ASYNC_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(30.0),
+        )
+        self.limit = asyncio.Semaphore(settings.GMAIL_ASYNC_CONCURRENCY)
+        self.user_limits = defaultdict(lambda: asyncio.Semaphore(settings.GMAIL_ASYNC_USER_CONCURRENCY))
+
+
+_resources = weakref.WeakKeyDictionary()
+
+
+def _loop_resources():
+    loop = asyncio.get_running_loop()
+    resources = _resources.get(loop)
+    if resources is None:
+        resources = _resources[loop] = _LoopResources()
+    return resources
+
+
+async def close_connections():
+    """Closes the running loop's connection pool (on ASGI shutdown, see Backend.asgi)."""
+    resources = _resources.pop(asyncio.get_running_loop(), None)
+    if resources is not None:
+        await resources.client.aclose()
+
+
+def release_user(user_key):
+    """Drops the user's semaphore once their sync is over, so idle users hold none."""
+    resources = _resources.get(asyncio.get_running_loop())
+    if resources is not None:
+        resources.user_limits.pop(user_key, None)
+
+
+class SyncInProgress(Exception):
+    """The user already has a sync running."""
+
+
+class AsyncGmailClient:
+    """
+    Minimal async client for the Gmail endpoints the sync uses.
+
+    Messages are fetched with multipart batch requests, like
+    GmailBatchFetcher. Errors are raised or reported as googleapiclient
+    HttpErrors so the engine handles them exactly like the synchronous path;
+    429/5xx responses, for single messages or whole batches, are retried
+    with exponential backoff up to `max_retries` times.
+    """
+
+    def __init__(self, access_token, user_key, root_url=None, batch_size=None, max_retries=4,
+                 backoff_base=0.5, sleep=asyncio.sleep):
+        resources = _loop_resources()
+        self.client = resources.client
+        self.limit = resources.limit
+        self.user_limit = resources.user_limits[user_key]
+        root_url = root_url or settings.GMAIL_API_ROOT_URL
+        self.base_url = root_url + API_PATH
+        self.batch_url = root_url + 'batch'
+        self.batch_size = batch_size or settings.GMAIL_FETCH_BATCH_SIZE
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.sleep = sleep
+
+    def _backoff(self, attempt):
+        return self.backoff_base * (2 ** attempt) + random.uniform(0, self.backoff_base)
+
+    async def get(self, path, **params):
+        attempt = 0
+        while True:
+            # Take the user's slot first so a user waiting on its own limit
+            # doesn't hold one of the global slots.
+            async with self.user_limit, self.limit:
+                response = await self.client.get(self.base_url + path, params=params, headers=self.headers)
+            if response.status_code < 400:
+                return response.json()
+            if response.status_code in RETRYABLE_STATUSES and attempt < self.max_retries:
+                await self.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            raise HttpError(httplib2.Response({'status': response.status_code}), response.content,
+                            uri=str(response.url))
+
+    async def fetch(self, message_ids, format='full', metadata_headers=None):
+        """
+        Fetches the messages in batch requests of `batch_size`, all batches
+        concurrently. Returns (messages, errors) like GmailBatchFetcher.fetch:
+        messages in input order, and a dict of message ID to the exception
+        that ended its retries.
+        """
+        message_ids = list(dict.fromkeys(message_ids))
+        params = {'format': format}
+        if metadata_headers:
+            params['metadataHeaders'] = list(metadata_headers)
+        query = urllib.parse.urlencode(params, doseq=True)
+
+        fetched, errors = {}, {}
+        for ok, failed in await asyncio.gather(*(
+            self._fetch_chunk(chunk, query) for chunk in _chunks(message_ids, self.batch_size)
+        )):
+            fetched.update(ok)
+            errors.update(failed)
+        return [fetched[msg_id] for msg_id in message_ids if msg_id in fetched], errors
+
+    async def _fetch_chunk(self, chunk, query):
+        fetched, errors, pending = {}, {}, list(chunk)
+        for attempt in range(self.max_retries + 1):
+            retry = []
+            try:
+                responses = await self._batch(pending, query)
+            except HttpError as e:
+                # The batch endpoint itself failed; none of its parts were processed.
+                for msg_id in pending:
+                    errors[msg_id] = e
+                if _status_of(e) not in RETRYABLE_STATUSES:
+                    return fetched, errors
+                retry = pending
+            except httpx.TransportError as e:
+                for msg_id in pending:
+                    errors[msg_id] = e
+                retry = pending
+            else:
+                for msg_id in pending:
+                    status, content = responses.get(msg_id, (500, b'Missing from batch response'))
+                    if status < 400:
+                        fetched[msg_id] = json.loads(content)
+                        errors.pop(msg_id, None)
+                        continue
+                    errors[msg_id] = HttpError(httplib2.Response({'status': status}), content)
+                    if status in RETRYABLE_STATUSES:
+                        retry.append(msg_id)
+
+            if not retry:
+                break
+            pending = retry
+            if attempt < self.max_retries:
+                await self.sleep(self._backoff(attempt))
+        return fetched, errors
+
+    async def _batch(self, message_ids, query):
+        """Sends one multipart batch of message GETs; returns {id: (status, content)}."""
+        body = ''.join(
+            f'--{BOUNDARY}\r\nContent-Type: application/http\r\nContent-ID: <{i}>\r\n\r\n'
+            f'GET /{API_PATH}messages/{urllib.parse.quote(msg_id)}?{query} HTTP/1.1\r\n\r\n'
+            for i, msg_id in enumerate(message_ids)
+        ) + f'--{BOUNDARY}--\r\n'
+        headers = dict(self.headers, **{'Content-Type': f'multipart/mixed; boundary={BOUNDARY}'})
+        async with self.user_limit, self.limit:
+            response = await self.client.post(self.batch_url, content=body.encode('utf-8'), headers=headers)
+        if response.status_code >= 400:
+            raise HttpError(httplib2.Response({'status': response.status_code}), response.content,
+                            uri=self.batch_url)
+
+        envelope = email.message_from_bytes(
+            f"Content-Type: {response.headers['Content-Type']}\r\n\r\n".encode('ascii') + response.content
+        )
+        results = {}
+        for part in envelope.get_payload():
+            index = int(part['Content-ID'].strip('<>').rpartition('-')[2])
+            status_line, _, rest = part.get_payload(decode=True).partition(b'\n')
+            content = re.split(rb'\r?\n\r?\n', rest, maxsplit=1)[-1]
+            results[message_ids[index]] = (int(status_line.split()[1]), content)
+        return results
+
+
+class AsyncGmailSyncEngine(GmailSyncEngine):
+    """
+    GmailSyncEngine on an AsyncGmailClient and the async ORM.
+
+    There are no async transactions, so transactions are saved before the
+    ledger is written: if the run dies in between, the next run downloads
+    those messages again and the gmail_message_id check drops them.
+    """
+
+    def __init__(self, client, user, page_size=500, on_progress=None, prefilter=None):
+        super().__init__(client, user, page_size=page_size, fetch=None, on_progress=on_progress, prefilter=prefilter)
+
+    async def alist_all_message_ids(self, query):
+        ids, page_token = [], None
+        while True:
+            params = {'q': query, 'maxResults': self.page_size, 'includeSpamTrash': 'false'}
+            if page_token:
+                params['pageToken'] = page_token
+            with span('gmail_list'):
+                results = await self.service.get('messages', **params)
+            ids.extend(msg['id'] for msg in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return ids
+
+    async def alist_history_message_ids(self, start_history_id):
+        ids, page_token, latest = [], None, start_history_id
+        while True:
+            params = {'startHistoryId': start_history_id, 'historyTypes': 'messageAdded',
+                      'maxResults': self.page_size}
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                with span('gmail_list'):
+                    results = await self.service.get('history', **params)
+            except HttpError as e:
+                if e.resp.status == 404:
+                    raise HistoryExpired(start_history_id) from e
+                raise
+            ids.extend(self._added_ids(results))
+            latest = results.get('historyId', latest)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return list(dict.fromkeys(ids)), latest
+
+    async def aunprocessed(self, message_ids):
+        seen = set()
+        for start in range(0, len(message_ids), LEDGER_CHUNK_SIZE):
+            chunk = message_ids[start:start + LEDGER_CHUNK_SIZE]
+            seen.update([msg_id async for msg_id in ProcessedMessage.objects.filter(
+                self._done(), user=self.user, message_id__in=chunk
+            ).values_list('message_id', flat=True)])
+        return [msg_id for msg_id in message_ids if msg_id not in seen]
+
+    async def amark_processed(self, message_ids):
+        await ProcessedMessage.objects.abulk_create(
+            self._ledger_rows(message_ids), update_conflicts=True,
+            unique_fields=['user', 'message_id'], update_fields=['status'],
+        )
+
+    async def arecord_failures(self, message_ids):
+        if not message_ids:
+            return 0
+        await ProcessedMessage.objects.abulk_create(self._ledger_rows(message_ids, ProcessedMessage.FAILED),
+                                                    ignore_conflicts=True)
+        failed = ProcessedMessage.objects.filter(user=self.user, message_id__in=message_ids,
+                                                 status=ProcessedMessage.FAILED)
+        await failed.aupdate(attempts=F('attempts') + 1)
+        return await failed.filter(attempts__gte=settings.SYNC_MAX_PARSE_ATTEMPTS).acount()
+
+    async def ascreen(self, message_ids):
+        self._report('screening')
+        with span('gmail_get_metadata'):
+            metadata, errors = await self.service.fetch(message_ids, format='metadata',
+                                                        metadata_headers=METADATA_HEADERS)
+        return self._select(metadata, errors)
+
+    async def arun(self):
+        """Performs one sync and returns the stats dict."""
+        cursor, _ = await SyncCursor.objects.aget_or_create(user=self.user)
+
+        message_ids, new_history_id = None, None
+        if cursor.history_id:
+            try:
+                message_ids, new_history_id = await self.alist_history_message_ids(cursor.history_id)
+                self.stats['mode'] = 'incremental'
+            except HistoryExpired:
+                message_ids = None
+
+        if message_ids is None:
+            profile = await self.service.get('profile')
+            new_history_id = profile.get('historyId')
+            message_ids = await self.alist_all_message_ids(self._full_scan_query())
+            self.stats['mode'] = 'full'
+
+        self.stats['listed'] = len(message_ids)
+        pending = await self.aunprocessed(list(dict.fromkeys(message_ids)))
+        self.stats['skipped'] = self.stats['listed'] - len(pending)
+
+        processed = []
+        if self.prefilter and pending:
+            pending, processed = await self.ascreen(pending)
+        self._report('fetching')
+
+        with span('gmail_get'):
+            messages, fetch_errors = await self.service.fetch(pending, format='full')
+        self._fetched(messages, fetch_errors, processed)
+        batch, failed = await sync_to_async(self._parse)(messages, processed)
+
+        self.stats['saved'] = await batch.asave()
+        await self.amark_processed(processed)
+        given_up = await self.arecord_failures(failed)
+
+        if self.stats['errors'] == given_up:
+            self._advance(cursor, new_history_id)
+            await cursor.asave()
+            await self.user.asave(update_fields=['last_email_sync'])
+        self._record()
+        return self.stats
+
+
+async def _heartbeat(job_id):
+    while True:
+        await asyncio.sleep(settings.SYNC_HEARTBEAT_INTERVAL)
+        await SyncJob.objects.filter(pk=job_id, status=SyncJob.RUNNING).aupdate(heartbeat_at=timezone.now())
+
+
+async def sync_user(user, root_url=None):
+    """
+    Runs an async Gmail sync for the user as a SyncJob and returns its stats.
+    Raises SyncInProgress if a sync of theirs is already running.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}:async"
+    job = await sync_to_async(start_job)(user, worker)
+    if job is None:
+        raise SyncInProgress(user.pk)
+
+    heartbeat = asyncio.create_task(_heartbeat(job.pk))
+    try:
+        creds = await sync_to_async(user_credentials)(user)
+        client = AsyncGmailClient(creds.token, user.pk, root_url=root_url)
+        stats = await AsyncGmailSyncEngine(client, user).arun()
+    except Exception as e:
+        await sync_to_async(finish_job)(job, error=e)
+        raise
+    finally:
+        heartbeat.cancel()
+        release_user(user.pk)
+    await sync_to_async(finish_job)(job, stats)
+    return stats
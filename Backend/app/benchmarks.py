@@ -0,0 +1,592 @@
+"""
+Performance benchmarks, run with `python manage.py benchmark [name ...]`.
+
+Each benchmark is a function registered with @benchmark that returns a dict
+of measurements. The command runs them against a throwaway test database.
+Gmail is replaced by FakeGmailServer and Gemini by FakeGenerativeModel (see
+the benchmarking package), so no Google account is needed; `--output` writes
+the results as JSON that a later run can be checked against with `--compare`.
+"""
+import asyncio
+import datetime
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from benchmarking.corpora import (
+    labeled_descriptions, legacy_extract_transaction_details, legacy_get_email_body, promotional_payload,
+    synthetic_alert_messages, synthetic_bank_emails, synthetic_categorized_descriptions, synthetic_inbox,
+)
+from benchmarking.fake_gemini import FakeGenerativeModel
+from benchmarking.fake_gmail import FakeGmailServer
+
+from .analysis import TRANSACTION_FIELDS
+from .async_sync import AsyncGmailClient, AsyncGmailSyncEngine, close_connections
+from .categorization import CATEGORIES, normalize_description
+from .extraction import default_extractor
+from .gmail_client import gmail_service_for
+from .instrumentation import recording
+from .local_categorizer import LocalCategorizer
+from .mime import extract_body
+from . import responses
+from .models import BasicInfo, Transaction
+from .rollups import rebuild
+from .sync import GmailSyncEngine, TransactionBatch, parse_message
+from .trends import compute_trends, load_columns, month_range, month_window
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def create_benchmark_user(uid):
+    return BasicInfo.objects.create(
+        firebase_uid=uid, full_name='Benchmark User', email=f'{uid}@example.com',
+        occupation='Engineer', salary=100000, marital_status='single', gender='other',
+    )
+
+
+def _per_message_ingest(user, messages):
+    """The ingestion path before batching: an exists() and a create() per message."""
+    saved = 0
+    for msg_data in messages:
+        candidate = parse_message(user, msg_data)
+        if candidate is None:
+            continue
+        window = datetime.timedelta(hours=24)
+        duplicate = Transaction.objects.filter(
+            user=user,
+            amount=candidate.amount,
+            date__range=(candidate.date - window, candidate.date + window),
+        ).exists()
+        if duplicate:
+            continue
+        candidate.save()
+        saved += 1
+    return saved
+
+
+def _batched_ingest(user, messages):
+    batch = TransactionBatch(user)
+    for msg_data in messages:
+        batch.add(msg_data)
+    return batch.save()
+
+
+@benchmark('ingest')
+def ingest_queries(messages=1000):
+    """Queries and time to store `messages` parsed alerts, per-message vs batched."""
+    corpus = synthetic_alert_messages(messages)
+    results = {'messages': messages}
+    for label, ingest in (('per_message', _per_message_ingest), ('batched', _batched_ingest)):
+        user = create_benchmark_user(f'ingest-{label}')
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            saved = ingest(user, corpus)
+            elapsed = time.perf_counter() - start
+        results[label] = {
+            'saved': saved,
+            'queries': len(queries),
+            'seconds': round(elapsed, 4),
+        }
+    return results
+
+
+@benchmark('extract')
+def extraction_throughput(emails=20000):
+    """Emails/second for the legacy extractor vs TransactionExtractor, plus a result diff."""
+    corpus = synthetic_bank_emails(emails)
+
+    start = time.perf_counter()
+    legacy = [legacy_extract_transaction_details(body, {'internalDate': ts}) for body, ts in corpus]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    current = [default_extractor.extract(body, ts) for body, ts in corpus]
+    current_seconds = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for old, new in zip(legacy, current)
+        if (old is None) != (new is None)
+        or (new is not None and (old['type'], old['amount'], old['date'], old['description']) != tuple(new))
+    )
+    return {
+        'emails': emails,
+        'transactions_found': sum(1 for r in current if r is not None),
+        'legacy_emails_per_second': round(emails / legacy_seconds),
+        'extractor_emails_per_second': round(emails / current_seconds),
+        'mismatches': mismatches,
+    }
+
+
+@benchmark('prefilter')
+def metadata_prefilter(messages=1000):
+    """Bytes and full downloads for one full sync of a typical inbox, with and without the prefilter."""
+    corpus = synthetic_inbox(messages)
+    results = {'messages': messages}
+    for label, prefilter in (('full_bodies', False), ('prefiltered', True)):
+        user = create_benchmark_user(f'prefilter-{label}')
+        with FakeGmailServer(corpus, page_size=500) as server:
+            start = time.perf_counter()
+            stats = GmailSyncEngine(server.build_service(), user, prefilter=prefilter).run()
+            elapsed = time.perf_counter() - start
+            results[label] = {
+                'bytes': server.bytes_sent,
+                'full_downloads': len(server.full_requested),
+                'saved': stats['saved'],
+                'seconds': round(elapsed, 4),
+            }
+    return results
+
+
+@benchmark('mime')
+def body_decoding(emails=20, size=1024 * 1024):
+    """Time and peak memory to decode and extract `emails` promotional emails of `size` bytes."""
+    payloads = [promotional_payload(size, seed=i) for i in range(emails)]
+    msg_data = {'internalDate': '1735689600000'}
+    results = {'emails': emails, 'bytes_per_email': size}
+    paths = (
+        ('legacy', lambda p: legacy_extract_transaction_details(legacy_get_email_body(p), msg_data)),
+        ('streaming', lambda p: default_extractor.extract(extract_body(p), msg_data['internalDate'])),
+    )
+    for label, run in paths:
+        tracemalloc.start()
+        start = time.perf_counter()
+        found = sum(1 for payload in payloads if run(payload))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = {
+            'transactions_found': found,
+            'ms_per_email': round(elapsed * 1000 / emails, 2),
+            'peak_kib': peak // 1024,
+        }
+    return results
+
+
+def _threaded_syncs(server, users, threads):
+    """The WSGI path: each request thread runs a blocking sync for one user."""
+    def run(user):
+        try:
+            return GmailSyncEngine(server.build_service(), user).run()
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(run, users))
+
+
+async def _async_syncs(server, users):
+    try:
+        return await asyncio.gather(*(
+            AsyncGmailSyncEngine(AsyncGmailClient('token', user.pk, root_url=server.root_url), user).arun()
+            for user in users
+        ))
+    finally:
+        await close_connections()
+
+
+@benchmark('async_sync')
+def async_sync_load(users=20, messages=100, latency=0.02, threads=8):
+    """
+    Messages/second for `users` simultaneous full syncs against a fake Gmail
+    server with `latency` per round-trip: `threads` request threads running
+    the blocking engine vs one event loop running the async engine.
+    """
+    corpus = synthetic_alert_messages(messages)
+    results = {'users': users, 'messages_per_user': messages, 'latency': latency}
+    paths = (
+        ('threaded', lambda server, accounts: _threaded_syncs(server, accounts, threads)),
+        ('async', lambda server, accounts: asyncio.run(_async_syncs(server, accounts))),
+    )
+    for label, run in paths:
+        accounts = [create_benchmark_user(f'{label}-{i}') for i in range(users)]
+        with FakeGmailServer(corpus, latency=latency, page_size=500) as server:
+            start = time.perf_counter()
+            stats = run(server, accounts)
+            elapsed = time.perf_counter() - start
+            close_old_connections()
+            results[label] = {
+                'seconds': round(elapsed, 3),
+                'messages_per_second': round(users * messages / elapsed),
+                'round_trips': server.round_trips,
+                'peak_in_flight': server.peak_in_flight,
+                'errors': sum(s['errors'] for s in stats),
+            }
+    return results
+
+
+@benchmark('categorize')
+def local_categorization(training=5000, batch=5000):
+    """
+    Training and scoring time of the local categorizer on synthetic
+    descriptions, and its accuracy on the hand-labeled fixture set: overall,
+    for rule matches, and for predictions confident enough to skip Gemini.
+    """
+    from django.conf import settings
+
+    train = synthetic_categorized_descriptions(training, seed=1)
+    start = time.perf_counter()
+    model = LocalCategorizer(CATEGORIES).fit([normalize_description(d) for d, _ in train], [c for _, c in train])
+    train_ms = (time.perf_counter() - start) * 1000
+
+    keys = [normalize_description(d) for d, _ in synthetic_categorized_descriptions(batch, seed=2)]
+    start = time.perf_counter()
+    model.predict(keys)
+    predict_ms = (time.perf_counter() - start) * 1000
+
+    fixture = labeled_descriptions()
+    predictions = model.predict([normalize_description(d) for d, _ in fixture])
+    threshold = settings.LOCAL_CATEGORY_MIN_CONFIDENCE
+
+    def accuracy(selected):
+        return round(sum(1 for p, (_, label) in selected if p[0] == label) / len(selected), 3) if selected else None
+
+    scored = list(zip(predictions, fixture))
+    rules = [item for item in scored if item[0][1] == 1.0]
+    confident = [item for item in scored if item[0][1] >= threshold]
+    per_category = {
+        category: accuracy([item for item in scored if item[1][1] == category]) for category in CATEGORIES
+    }
+    return {
+        'training_rows': training,
+        'train_ms': round(train_ms, 1),
+        'batch': batch,
+        'predict_ms': round(predict_ms, 1),
+        'fixture_rows': len(fixture),
+        'accuracy': accuracy(scored),
+        'rule_coverage': round(len(rules) / len(scored), 3),
+        'rule_accuracy': accuracy(rules),
+        'confidence_threshold': threshold,
+        'confident_coverage': round(len(confident) / len(scored), 3),
+        'confident_accuracy': accuracy(confident),
+        'sent_to_llm': len(scored) - len(confident),
+        'per_category_accuracy': per_category,
+    }
+
+
+@benchmark('gmail_client')
+def gmail_service_building(services=200):
+    """
+    Milliseconds to build a Gmail service per sync request: discovery.build()
+    (parses the discovery document every time) vs the cached document.
+    """
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build
+
+    creds = Credentials(token='token')
+    results = {'services': services}
+    paths = (
+        ('discovery_build', lambda: build('gmail', 'v1', credentials=creds)),
+        ('cached_document', lambda: gmail_service_for(creds)),
+    )
+    for label, run in paths:
+        start = time.perf_counter()
+        for _ in range(services):
+            run()
+        results[label] = {'ms_per_service': round((time.perf_counter() - start) * 1000 / services, 3)}
+    return results
+
+
+def percentile(values, q):
+    """The nearest-rank `q` percentile (0-1) of the values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def latency_summary(seconds):
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(seconds, 0.95) * 1000, 3),
+        'total_ms': round(sum(seconds) * 1000, 3),
+    }
+
+
+def stage_summary(spans):
+    """Per-stage latency of the spans recorded with instrumentation.recording()."""
+    return {name: latency_summary(durations) for name, durations in sorted(spans.items())}
+
+
+def peak_memory(run):
+    """Runs `run()` under tracemalloc and returns its peak traced allocation in KiB."""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+@benchmark('sync_pipeline')
+def sync_pipeline(messages=2000, runs=3, latency=0.0, transactional_share=0.3):
+    """
+    Full Gmail syncs of a `messages`-message inbox replayed from a fake Gmail
+    server: run time, throughput, queries, peak memory and per-stage latency
+    (listing, metadata and full downloads, decoding, extraction, dedup,
+    writes).
+    """
+    corpus = synthetic_inbox(messages, transactional_share=transactional_share, body_size=8000)
+
+    def sync(label):
+        user = create_benchmark_user(label)
+        with FakeGmailServer(corpus, latency=latency, page_size=500) as server:
+            return GmailSyncEngine(server.build_service(), user).run()
+
+    durations, queries = [], []
+    with recording() as spans:
+        for i in range(runs):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                stats = sync(f'sync-pipeline-{i}')
+                durations.append(time.perf_counter() - start)
+            queries.append(len(captured))
+    return {
+        'messages': messages,
+        'runs': runs,
+        'latency': latency,
+        'saved': stats['saved'],
+        'run': latency_summary(durations),
+        'messages_per_second': round(messages / percentile(durations, 0.5)),
+        'queries_per_run': max(queries),
+        'peak_kib': peak_memory(lambda: sync('sync-pipeline-memory')),
+        'stages': stage_summary(spans),
+    }
+
+
+def seed_history(user, count, uncategorized_share=0.02, seed=0):
+    """Gives the user `count` transactions over the three years to the end of 2025."""
+    rng = random.Random(seed)
+    end = datetime.date(2025, 12, 31)
+    Transaction.objects.bulk_create([
+        Transaction(
+            user=user, transaction_type='credited' if category == 'Income' else 'debited',
+            amount=rng.randint(10, 20000), source='email', description=description,
+            category=None if rng.random() < uncategorized_share else category,
+            date=end - datetime.timedelta(days=i * 1095 // count),
+        )
+        for i, (description, category) in enumerate(synthetic_categorized_descriptions(count, seed=seed))
+    ], batch_size=5000)
+
+
+def _analysis_request(factory, body):
+    from .views import get_financial_analysis
+
+    response = get_financial_analysis(factory.post('/app/api/get-analysis/', json.dumps(body),
+                                                   content_type='application/json'))
+    return response
+
+
+def _timed_requests(factory, bodies):
+    """Sends each request body; returns latency, queries and response size."""
+    durations, queries, sizes, response = [], [], [], None
+    for body in bodies:
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = _analysis_request(factory, body)
+            durations.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        sizes.append(len(response.content))
+    return dict(latency_summary(durations), queries=max(queries), response_bytes=max(sizes)), response
+
+
+@benchmark('analysis_pipeline')
+def analysis_pipeline(transactions=(1000, 10000), requests=20):
+    """
+    The analysis endpoint for users with each number of `transactions`:
+    the first load (categorization and report backfill included), repeated
+    dashboard loads of the latest month and of the whole history, and
+    keyset-paginated transaction pages. Latency, queries, response size,
+    peak memory and per-stage latency (categorization, Gemini, writes).
+    """
+    from . import categorization
+
+    factory = RequestFactory()
+    results = {'requests': requests}
+    with mock.patch('app.gemini.generative_model', FakeGenerativeModel), \
+            override_settings(AI_INSIGHTS_WAIT=5, LOCAL_CATEGORY_MODEL_MAX_AGE=3600):
+        for count in transactions:
+            caches['insights'].clear()
+            categorization.default_cache.clear()
+            categorization._local_model['model'] = None
+
+            user = create_benchmark_user(f'analysis-{count}')
+            start = time.perf_counter()
+            seed_history(user, count)
+            seed_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            rebuild(user.pk)
+            backfill_seconds = time.perf_counter() - start
+
+            uid = user.firebase_uid
+            month = {'uid': uid, 'month': 12, 'year': 2025}
+            with recording() as spans:
+                first_load, _ = _timed_requests(factory, [{'uid': uid}])
+                dashboard, _ = _timed_requests(factory, [month] * requests)
+                history, response = _timed_requests(factory, [{'uid': uid}] * requests)
+
+                pages, cursor = [], json.loads(response.content)['next_cursor']
+                for _ in range(requests):
+                    if not cursor:
+                        break
+                    page, response = _timed_requests(factory, [{'uid': uid, 'cursor': cursor}])
+                    pages.append(page)
+                    cursor = json.loads(response.content)['next_cursor']
+            results[str(count)] = {
+                'seed_seconds': round(seed_seconds, 3),
+                'report_backfill_ms': round(backfill_seconds * 1000, 1),
+                'first_load': first_load,
+                'dashboard_month': dashboard,
+                'dashboard_all_history': history,
+                'transaction_pages': {
+                    'count': len(pages),
+                    'p50_ms': percentile([p['p50_ms'] for p in pages], 0.5),
+                    'p95_ms': percentile([p['p50_ms'] for p in pages], 0.95),
+                    'queries': max((p['queries'] for p in pages), default=0),
+                },
+                'peak_kib': peak_memory(lambda: _analysis_request(factory, month)),
+                'stages': stage_summary(spans),
+            }
+    return results
+
+
+@benchmark('trends')
+def trends(transactions=100000, months=(12, 36), runs=20):
+    """
+    Dashboard trends for a user with `transactions` transactions over three
+    years, for each number of `months` of history: reading the columns
+    (one query) and computing the series from them, timed separately.
+    """
+    user = create_benchmark_user('trends')
+    seed_history(user, transactions)
+    today = datetime.date(2025, 12, 31)
+    results = {'transactions': transactions, 'runs': runs}
+    for count in months:
+        first, last = month_window(months=count, today=today)
+        start, end = month_range(1970 + first // 12, first % 12 + 1)[0], month_range(1970 + last // 12, last % 12 + 1)[1]
+        loads, computes = [], []
+        for _ in range(runs):
+            began = time.perf_counter()
+            columns = load_columns(user.pk, start, end)
+            loaded = time.perf_counter()
+            summary = compute_trends(columns, first, last, today)
+            computes.append(time.perf_counter() - loaded)
+            loads.append(loaded - began)
+        results[f'{count}_months'] = {
+            'rows': len(columns),
+            'load': latency_summary(loads),
+            'compute': latency_summary(computes),
+            'recurring_found': len(summary['recurring']),
+        }
+    return results
+
+
+def import_times(module, setup='import django; django.setup()'):
+    """
+    Imports `module` in a fresh interpreter under `python -X importtime`,
+    after running `setup`, and returns {name: cumulative microseconds} for
+    every module that import loaded.
+    """
+    code = f'{setup}\nimport sys; sys.stderr.write("--\\n")\nimport {module}'
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            cwd=settings.BASE_DIR, check=True).stderr
+    times = {}
+    for line in stderr.partition('--\n')[2].splitlines():
+        fields = line.removeprefix('import time:').split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def boot_time(module=None):
+    """
+    Runs django.setup() and imports `module`, if given, in a fresh
+    interpreter, as every worker does on boot. Returns the seconds that took
+    and the names of the modules loaded by then.
+    """
+    code = ('import sys, time\nstart = time.perf_counter()\nimport django; django.setup()\n'
+            + (f'import {module}\n' if module else '')
+            + 'print(time.perf_counter() - start); print(" ".join(sys.modules))')
+    stdout = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=settings.BASE_DIR, check=True).stdout
+    seconds, modules = stdout.splitlines()[-2:]
+    return float(seconds), set(modules.split())
+
+
+@benchmark('startup')
+def startup(module='Backend.urls', runs=5):
+    """
+    Time to boot a fresh interpreter through django.setup() and the URLconf
+    (or `module`), the URLconf import alone, and the slowest modules it pulls
+    in.
+    """
+    boots = [boot_time(module)[0] for _ in range(runs)]
+    runs = [import_times(module) for _ in range(runs)]
+    slowest = sorted((name for name in runs[-1] if name != module), key=lambda name: -runs[-1][name])[:10]
+    return {
+        'module': module,
+        'boot': latency_summary(boots),
+        'import': latency_summary([times[module] / 1e6 for times in runs]),
+        'slowest_ms': {name: round(runs[-1][name] / 1000, 1) for name in slowest},
+    }
+
+
+@benchmark('response_encoding')
+def response_encoding(rows=50000, runs=5):
+    """
+    Encoding `rows` transactions as the analysis API lists them: Django's
+    JsonResponse (json with DjangoJSONEncoder) against app.responses with
+    and without orjson, and the payload size plain, gzipped and, if brotli
+    is installed, Brotli-compressed.
+    """
+    from django.http import JsonResponse as DjangoJsonResponse
+    from django.utils.text import compress_string
+
+    user = create_benchmark_user('response-encoding')
+    seed_history(user, rows)
+    data = {'transactions': list(Transaction.objects.filter(user=user).values(*TRANSACTION_FIELDS))}
+
+    def timed(run):
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = run()
+            durations.append(time.perf_counter() - start)
+        return latency_summary(durations), result
+
+    results = {'rows': rows, 'runs': runs, 'encode': {}}
+    results['encode']['django_json'], body = timed(lambda: DjangoJsonResponse(data).content)
+    with mock.patch.object(responses, 'orjson', None):
+        results['encode']['compact_json'], compact = timed(lambda: responses.JsonResponse(data).content)
+    if responses.orjson is not None:
+        results['encode']['orjson'], compact = timed(lambda: responses.JsonResponse(data).content)
+
+    results['bytes'] = {'django_json': len(body), 'compact': len(compact)}
+    results['compress'] = {}
+    results['compress']['gzip'], gzipped = timed(lambda: compress_string(compact))
+    results['bytes']['gzip'] = len(gzipped)
+    if responses.brotli is not None:
+        results['compress']['br'], compressed = timed(
+            lambda: responses.brotli.compress(compact, quality=responses.BROTLI_QUALITY))
+        results['bytes']['br'] = len(compressed)
+    return results
@@ -0,0 +1,251 @@
+"""
+Transaction categorization.
+
+Descriptions are normalized (lowercased, digits and punctuation removed) so
+every alert from the same merchant shares one key. A key is looked up in an
+in-process LRU, then in the CategoryCache table. Keys found in neither are
+scored by the local categorizer (merchant rules plus a model trained on
+already-categorized rows); only those it is unsure about are sent to Gemini:
+in chunks of a bounded size, as a JSON list of {id, description} objects,
+asking for JSON {id, category} objects back so a skipped or reordered answer
+can't shift categories onto the wrong rows. Gemini's answers are stored in
+both caches, confident local answers in the LRU only. If Gemini can't be
+reached, the local best guess is used, or FALLBACK_CATEGORY when there is
+none; descriptions that normalize to nothing get FALLBACK_CATEGORY straight
+away. Either way no row is left uncategorized to be sent again on the next
+dashboard load. The transactions are written with one bulk_update, and the
+monthly reports of the touched months are refreshed.
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+
+from . import gemini
+from .conditional import bump_data_version
+from .instrumentation import span
+from .local_categorizer import LocalCategorizer
+from .lru import LRUCache
+from .models import CategoryCache, Transaction
+from .rollups import refresh_for
+
+CATEGORIES = [
+    "Food & Dining", "Transport", "Shopping", "Bills & Utilities", "Entertainment",
+    "Health & Wellness", "Groceries", "Income", "Transfers", "Other",
+]
+# For rows nothing can categorize; written to the transaction but not cached,
+# so new rows with the same description are still asked about.
+FALLBACK_CATEGORY = "Other"
+logger = logging.getLogger(__name__)
+
+_DIGITS_RE = re.compile(r'\d+')
+_PUNCTUATION_RE = re.compile(r'[^\w&@]+')
+_CURRENCY_WORDS = frozenset(('rs', 'inr'))
+
+
+def normalize_description(description):
+    """
+    The cache key for a description: lowercase words with digits,
+    punctuation and currency words removed, so amounts, dates and reference
+    numbers don't split one merchant into many keys.
+    """
+    text = _PUNCTUATION_RE.sub(' ', _DIGITS_RE.sub(' ', (description or '').lower()))
+    return ' '.join(word for word in text.split() if word not in _CURRENCY_WORDS)[:255]
+
+
+default_cache = LRUCache(settings.CATEGORY_CACHE_SIZE)
+
+
+def build_prompt(descriptions):
+    items = [{'id': i, 'description': d} for i, d in enumerate(descriptions)]
+    return (
+        f"Categorize each transaction description into exactly one of these categories: "
+        f"{', '.join(CATEGORIES)}.\n"
+        f"Respond with a JSON array of objects with keys \"id\" and \"category\", one per transaction.\n"
+        f"Transactions:\n{json.dumps(items, ensure_ascii=False)}"
+    )
+
+
+def parse_response(text, count):
+    """
+    Returns {index: category} from a JSON model response, keeping only
+    valid categories for ids in range(count).
+    """
+    try:
+        items = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    if isinstance(items, dict):
+        items = items.get('categories', [])
+    result = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        index, category = item.get('id'), item.get('category')
+        if isinstance(index, int) and 0 <= index < count and category in CATEGORIES:
+            result[index] = category
+    return result
+
+
+class Categorizer:
+    """
+    Assigns categories to transactions using the caches and, for unseen
+    descriptions, the Gemini model built by `model_factory`.
+    """
+
+    def __init__(self, model_factory=None, chunk_size=None, cache=None, local=None):
+        self.model_factory = model_factory or (lambda: gemini.generative_model(gemini.GEMINI_MODEL))
+        self.chunk_size = chunk_size or settings.GEMINI_CATEGORY_CHUNK_SIZE
+        self.cache = default_cache if cache is None else cache
+        self.local = local
+        self.model_calls = 0
+
+    def lookup(self, keys):
+        """Returns {key: category} for the keys found in the LRU or the table."""
+        found, missing = {}, []
+        for key in keys:
+            category = self.cache.get(key)
+            if category is None:
+                missing.append(key)
+            else:
+                found[key] = category
+        if missing:
+            for key, category in CategoryCache.objects.filter(
+                normalized_description__in=missing
+            ).values_list('normalized_description', 'category'):
+                found[key] = category
+                self.cache.set(key, category)
+        return found
+
+    def ask_model(self, keys):
+        """
+        Categorizes the keys with the model, chunk by chunk. A chunk that
+        fails is logged and left out; its keys are retried on the next call.
+        """
+        found = {}
+        model = None
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            try:
+                model = model or self.model_factory()
+                self.model_calls += 1
+                with span('gemini_categorize'):
+                    response = model.generate_content(
+                        build_prompt(chunk),
+                        generation_config={'response_mime_type': 'application/json'},
+                    )
+                answers = parse_response(response.text, len(chunk))
+            except Exception as e:
+                logger.warning("AI categorization failed", extra={'error': str(e), 'descriptions': len(chunk)})
+                continue
+            for index, category in answers.items():
+                found[chunk[index]] = category
+
+        if found:
+            CategoryCache.objects.bulk_create(
+                [CategoryCache(normalized_description=key, category=category) for key, category in found.items()],
+                ignore_conflicts=True,
+            )
+            for key, category in found.items():
+                self.cache.set(key, category)
+        return found
+
+    def categorize(self, transactions):
+        """
+        Sets the category of the given transactions where one can be found
+        and saves them with a single bulk_update. Returns how many were
+        categorized.
+        """
+        transactions = list(transactions)
+        keys = {t.pk: normalize_description(t.description) for t in transactions}
+        unique_keys = list(dict.fromkeys(k for k in keys.values() if k))
+
+        categories = self.lookup(unique_keys)
+        unseen = [key for key in unique_keys if key not in categories]
+        if unseen:
+            local = self.local or get_local_model()
+            with span('local_categorize'):
+                guesses = dict(zip(unseen, local.predict(unseen)))
+            doubtful = []
+            for key, (category, confidence) in guesses.items():
+                if confidence >= settings.LOCAL_CATEGORY_MIN_CONFIDENCE:
+                    categories[key] = category
+                    self.cache.set(key, category)
+                else:
+                    doubtful.append(key)
+            if doubtful:
+                answered = self.ask_model(doubtful)
+                categories.update(answered)
+                for key in doubtful:
+                    if key not in answered:
+                        categories[key] = guesses[key][0] or FALLBACK_CATEGORY
+
+        updated = []
+        for transaction in transactions:
+            key = keys[transaction.pk]
+            category = categories.get(key) if key else FALLBACK_CATEGORY
+            if category:
+                transaction.category = category
+                updated.append(transaction)
+        if updated:
+            with span('db_write'), db_transaction.atomic():
+                Transaction.objects.bulk_update(updated, ['category'], batch_size=500)
+                refresh_for(updated)
+                bump_data_version(t.user_id for t in updated)
+        return len(updated)
+
+
+def train_local_model(limit=20000):
+    """
+    Trains a LocalCategorizer on the most recent categorized transactions
+    and on every description Gemini has categorized.
+    """
+    keys, labels = [], []
+    for key, category in CategoryCache.objects.values_list('normalized_description', 'category'):
+        keys.append(key)
+        labels.append(category)
+    for description, category in (Transaction.objects.filter(category__in=CATEGORIES)
+                                  .order_by('-id').values_list('description', 'category')[:limit]):
+        keys.append(normalize_description(description))
+        labels.append(category)
+    return LocalCategorizer(CATEGORIES).fit(keys, labels)
+
+
+_local_model = {'model': None, 'trained_at': 0.0}
+_local_model_lock = threading.Lock()
+
+
+def _local_model_expired():
+    return time.monotonic() - _local_model['trained_at'] > settings.LOCAL_CATEGORY_MODEL_MAX_AGE
+
+
+def get_local_model():
+    """
+    The process-wide LocalCategorizer, retrained every
+    LOCAL_CATEGORY_MODEL_MAX_AGE seconds. One thread retrains at a time;
+    the others keep using the old model meanwhile, and only wait when
+    there is none yet.
+    """
+    model = _local_model['model']
+    if model is not None and not _local_model_expired():
+        return model
+    if not _local_model_lock.acquire(blocking=model is None):
+        return model
+    try:
+        # Another thread may have trained while this one waited.
+        if _local_model['model'] is None or _local_model_expired():
+            with span('local_train'):
+                trained = train_local_model()
+            _local_model['model'], _local_model['trained_at'] = trained, time.monotonic()
+        return _local_model['model']
+    finally:
+        _local_model_lock.release()
+
+
+def categorize_transactions(transactions):
+    """Categorizes the transactions with the default caches and model."""
+    return Categorizer().categorize(transactions)
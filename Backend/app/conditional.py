@@ -0,0 +1,83 @@
+"""
+Conditional GETs for the dashboard's per-user endpoints.
+
+A user's version is read from their profile row alone: when the profile
+last changed, when the user last synced, and BasicInfo.data_version, which
+every write to their transactions bumps (bump_data_version(): sync batches,
+categorization, and single saves and deletes through app.signals). Hourly
+token refreshes don't change it. The GET views hash it with the request's
+parameters into an ETag and answer an If-None-Match that still matches
+with 304 Not Modified before any other query, aggregation or Gemini call.
+
+Responses are marked `private, no-cache`: browsers keep them but revalidate
+on every use, so an unchanged dashboard refresh is a single cheap query.
+"""
+import hashlib
+
+from django.db.models import F
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+class UserVersion:
+    """What a user's dashboard responses depend on, as of one query."""
+
+    def __init__(self, pk, updated_at, last_email_sync, data_version):
+        self.pk = pk
+        self.updated_at = updated_at
+        self.last_email_sync = last_email_sync
+        self.data_version = data_version
+
+    def token(self):
+        return (self.pk, self.updated_at and self.updated_at.isoformat(),
+                self.last_email_sync and self.last_email_sync.isoformat(), self.data_version)
+
+    @property
+    def last_modified(self):
+        times = [time for time in (self.updated_at, self.last_email_sync) if time]
+        return max(times) if times else None
+
+    def etag(self, *parts):
+        """A strong ETag for this version of a response that also depends on `parts`."""
+        digest = hashlib.sha1(repr((self.token(), parts)).encode('utf-8')).hexdigest()
+        return f'"{digest}"'
+
+
+def user_version(uid):
+    """The UserVersion of the user with Firebase UID `uid`, or None if there is none."""
+    from .models import BasicInfo
+
+    row = (BasicInfo.objects.using('default').filter(firebase_uid=uid)
+           .values_list('pk', 'updated_at', 'last_email_sync', 'data_version')
+           .first())
+    return UserVersion(*row) if row else None
+
+
+def bump_data_version(user_ids):
+    """Records that the transactions of the users with these primary keys changed."""
+    from .models import BasicInfo
+
+    user_ids = set(user_ids)
+    if user_ids:
+        BasicInfo.objects.filter(pk__in=user_ids).update(data_version=F('data_version') + 1)
+
+
+def set_validators(response, etag, last_modified=None):
+    """Adds the ETag, Last-Modified and Cache-Control of a revalidated response."""
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    A 304 response if the request's If-None-Match matches `etag` (weakly, so
+    tags weakened by gzip still match), otherwise None. If-Modified-Since
+    alone is not enough: Last-Modified doesn't move when transactions do.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None or response.status_code != 304:
+        return None
+    return set_validators(response, etag, last_modified)
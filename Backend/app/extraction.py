@@ -0,0 +1,236 @@
+import re
+import time
+import datetime
+from typing import NamedTuple
+
+from dateutil import parser as date_parser
+
+FINANCIAL_KEYWORDS = (
+    'paid', 'payment', 'received', 'sent', 'transfer', 'transaction',
+    'invoice', 'bill', 'receipt', 'statement', 'purchase', 'order',
+    'refund', 'cashback', 'reward', 'cash', 'rs.', 'inr', '₹', 'debit', 'credit',
+    'bank', 'upi', 'card', 'wallet', 'settlement', 'clear'
+)
+DEBIT_INDICATORS = ('debited', 'spent', 'paid', 'sent', 'purchase', 'withdrawn')
+CREDIT_INDICATORS = ('credited', 'received', 'refund', 'deposit', 'cashback', 'reward')
+
+FINANCIAL, DEBIT, CREDIT = 1, 2, 4
+
+_CURRENCY = r'(?:rs\.?|inr|₹)'
+_NUMBER = r'([\d,]+(?:\.\d{1,2})?)'
+_MONTH = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'
+
+# Amount and date patterns, highest priority first within each kind.
+AMOUNT_PATTERNS = (
+    rf'{_CURRENCY}\s*{_NUMBER}',                                  # Rs. 1,234.56 or ₹1,234.56
+    rf'amount\s*[\:\-]?\s*{_CURRENCY}?\s*{_NUMBER}',              # Amount: Rs. 1,234.56
+    rf'total\s*[\:\-]?\s*{_CURRENCY}?\s*{_NUMBER}',               # Total: ₹1,234.56
+)
+DATE_PATTERNS = (
+    r'(?:date|on)\s*[\:\-]?\s*(\d{1,2})[\/\-\.](\d{1,2})[\/\-\.](\d{2,4})',   # DD/MM/YYYY or DD-MM-YYYY
+    rf'(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH}[a-z]*)\s+(\d{{4}})',           # 1st Jan 2023
+)
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3,
+    'apr': 4, 'april': 4, 'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7,
+    'aug': 8, 'august': 8, 'sep': 9, 'sept': 9, 'september': 9,
+    'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12,
+}
+
+
+def _keyword_flags():
+    """
+    Maps every keyword to the classes it signals. A keyword also carries the
+    classes of every other keyword that is a prefix of it ('debited' implies
+    'debit'), because the scanner only reports the longest keyword starting
+    at each position.
+    """
+    classes = {}
+    for keywords, flag in ((FINANCIAL_KEYWORDS, FINANCIAL), (DEBIT_INDICATORS, DEBIT), (CREDIT_INDICATORS, CREDIT)):
+        for keyword in keywords:
+            classes[keyword] = classes.get(keyword, 0) | flag
+    return {
+        keyword: flags | _or(classes[other] for other in classes if keyword.startswith(other))
+        for keyword, flags in classes.items()
+    }
+
+
+def _or(values):
+    result = 0
+    for value in values:
+        result |= value
+    return result
+
+
+class TransactionDetails(NamedTuple):
+    type: str
+    amount: float
+    date: datetime.datetime
+    description: str
+
+
+class TransactionExtractor:
+    """
+    Finds the transaction type, amount and date in an email body.
+
+    All patterns are compiled once and run over one lowercased copy of the
+    body. Keywords are found with a single alternation regex; amount and date
+    candidates are found together by a second one. Each regex is resumed one
+    character after its previous match, so overlapping candidates are seen
+    exactly as separate re.search calls would see them, and each scan stops
+    as soon as nothing later in the text can change the result.
+    """
+
+    def __init__(self):
+        self.keyword_flags = _keyword_flags()
+        alternatives = sorted(self.keyword_flags, key=len, reverse=True)
+        self.keyword_re = re.compile('|'.join(re.escape(k) for k in alternatives))
+
+        groups = [f'(?P<a{i}>{p})' for i, p in enumerate(AMOUNT_PATTERNS)]
+        groups += [f'(?P<d{i}>{p})' for i, p in enumerate(DATE_PATTERNS)]
+        self.value_re = re.compile('|'.join(groups))
+        self.amount_groups = [f'a{i}' for i in range(len(AMOUNT_PATTERNS))]
+        self.date_groups = [f'd{i}' for i in range(len(DATE_PATTERNS))]
+
+    def classify(self, text):
+        """Returns the keyword class flags found in the lowercased text."""
+        flags, pos, search = 0, 0, self.keyword_re.search
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return flags
+            flags |= self.keyword_flags[match.group()]
+            if flags & FINANCIAL and flags & CREDIT:
+                return flags
+            pos = match.start() + 1
+
+    def find_values(self, text):
+        """
+        Returns (amount, date) from the lowercased text in one scan: the value
+        of the first match of the highest-priority pattern that parses, or None.
+        """
+        values, pos, search = {}, 0, self.value_re.search
+        while True:
+            match = search(text, pos)
+            if match is None:
+                break
+            pos = match.start() + 1
+            name = match.lastgroup
+            if name in values:
+                continue
+            start = match.re.groupindex[name]
+            if name[0] == 'a':
+                values[name] = parse_amount(match.group(start + 1))
+            else:
+                values[name] = _parse_date(match, start)
+            # Nothing later in the text can beat a valid top-priority match.
+            if values.get('a0') is not None and values.get('d0') is not None:
+                break
+
+        amount = next((values[n] for n in self.amount_groups if values.get(n) is not None), None)
+        date = next((values[n] for n in self.date_groups if values.get(n) is not None), None)
+        return amount, date
+
+    def extract(self, email_body, internal_date_ms):
+        """
+        Returns TransactionDetails for the email body, or None if it
+        doesn't look like a transaction.
+        """
+        if not email_body:
+            return None
+
+        email_lower = email_body.lower()
+        flags = self.classify(email_lower)
+        if not flags & FINANCIAL:
+            return None
+        transaction_type = 'debited' if flags & DEBIT and not flags & CREDIT else 'credited'
+
+        amount, transaction_date = self.find_values(email_lower)
+        if amount is None:
+            return None
+
+        transaction_date = transaction_date or datetime.datetime.fromtimestamp(
+            int(internal_date_ms) / 1000, tz=datetime.timezone.utc
+        )
+
+        return TransactionDetails(transaction_type, amount, transaction_date, first_line(email_body))
+
+
+def first_line(text, limit=255):
+    """The first line of the text, truncated to `limit` characters."""
+    newline = text.find('\n')
+    return text[:newline if newline != -1 else len(text)][:limit]
+
+
+def parse_amount(number):
+    try:
+        return float(number.replace(',', ''))
+    except ValueError:
+        return None
+
+
+def _parse_date(match, start):
+    """Parses a date match whose day, month and year groups follow `start`."""
+    day, month, year = match.group(start + 1, start + 2, start + 3)
+    parsed = _fast_date(day, month, year)
+    if parsed is None:
+        try:
+            parsed = date_parser.parse(match.string[match.start(start + 1):match.end(start)], dayfirst=True)
+        except (ValueError, OverflowError):
+            return None
+    return parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def parse_date_parts(day, month, year):
+    """
+    Builds a UTC datetime from day, month (number or name) and year strings,
+    or returns None if they don't form a valid date.
+    """
+    parsed = _fast_date(day, month, year)
+    if parsed is None:
+        try:
+            parsed = date_parser.parse(f"{day} {month} {year}", dayfirst=True)
+        except (ValueError, OverflowError):
+            return None
+    return parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _fast_date(day, month, year):
+    """
+    Builds the date directly when dateutil would read it as day/month/year;
+    returns None to defer to dateutil for anything else (three-digit years,
+    day/month swaps, unknown month words).
+    """
+    if len(year) not in (2, 4) or not (day + year).isascii() or int(day) > 31:
+        return None
+    if month.isdigit():
+        if not month.isascii():
+            return None
+        month_number = int(month)
+    else:
+        month_number = MONTHS.get(month.lower())
+        if month_number is None:
+            return None
+    if not 1 <= month_number <= 12:
+        return None
+    try:
+        return datetime.datetime(_full_year(year), month_number, int(day))
+    except ValueError:
+        return None
+
+
+def _full_year(year):
+    """Expands a two-digit year to within 50 years of today, as dateutil does."""
+    if len(year) == 4:
+        return int(year)
+    this_year = time.localtime().tm_year
+    full = int(year) + this_year // 100 * 100
+    if full >= this_year + 50:
+        full -= 100
+    elif full < this_year - 50:
+        full += 100
+    return full
+
+
+default_extractor = TransactionExtractor()
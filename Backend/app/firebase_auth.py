@@ -0,0 +1,280 @@
+"""
+Firebase Authentication for the API.
+
+With FIREBASE_PROJECT_ID set, FirebaseAuthMiddleware requires every /app/api/
+request to carry the signed-in user's Firebase ID token
+(`Authorization: Bearer <token>`) and the views act for the token's user,
+whatever `uid` the request sends. Without it the API trusts that `uid`, for
+local development.
+
+Tokens are verified locally: an RS256 signature by one of Google's public
+certificates for Firebase, this project as audience and issuer, and expiry.
+The certificates are fetched once and again only when their Cache-Control
+max-age runs out (or a token is signed by a key not seen yet), so requests
+never wait on Google. Verified tokens are memoized until they expire; the
+client reuses a token for its whole hour.
+
+Profiles are cached by UID for FIREBASE_PROFILE_CACHE_TTL seconds, and
+dropped whenever a BasicInfo is saved or deleted in this process (see
+app.signals), so the views don't look the user up on every request. The
+cache is per process: another worker keeps serving a profile saved
+elsewhere for up to the TTL, which is why it is short. Nothing that must be
+current reads the cached copy; the dashboard's ETags come from
+app.conditional.user_version, and sync jobs load their user afresh.
+"""
+import copy
+import logging
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .instrumentation import count
+from .lru import LRUCache
+from .models import BasicInfo
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/app/api/'
+CLOCK_SKEW = 60
+# Shortest wait between two certificate fetches, so tokens with unknown key
+# IDs or an unreachable Google don't turn into a fetch per request.
+MIN_FETCH_INTERVAL = 60
+HTTP_TIMEOUT = 10
+
+re_max_age = re.compile(r'\bmax-age=(\d+)')
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def fetch_certs(url):
+    """({key ID: PEM certificate}, seconds they may be cached) from `url`."""
+    import requests
+
+    response = requests.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    max_age = re_max_age.search(response.headers.get('Cache-Control', ''))
+    return response.json(), int(max_age.group(1)) if max_age else 0
+
+
+class PublicKeys:
+    """
+    The certificates Firebase ID tokens are signed with, kept for as long
+    as their response's Cache-Control allows. Safe to share between threads.
+    """
+
+    def __init__(self, url=None, fetch=fetch_certs):
+        self.url = url
+        self.fetch = fetch
+        self._certs = {}
+        self._expires = 0
+        self._fetched = None
+        self._lock = threading.Lock()
+
+    def get(self, kid, now=None):
+        """The certificates, refetched first if expired or if `kid` isn't among them."""
+        now = time.time() if now is None else now
+        if now < self._expires and kid in self._certs:
+            return self._certs
+        with self._lock:
+            if (now >= self._expires or kid not in self._certs) and (
+                    self._fetched is None or now - self._fetched >= MIN_FETCH_INTERVAL):
+                self._fetched = now
+                try:
+                    certs, max_age = self.fetch(self.url or settings.FIREBASE_CERTS_URL)
+                except Exception as e:
+                    # Keep verifying with the certificates we have.
+                    logger.warning("Fetching Firebase certificates failed", extra={'error': str(e)})
+                else:
+                    self._certs, self._expires = certs, now + max_age
+            return self._certs
+
+
+public_keys = PublicKeys()
+
+
+class TokenVerifier:
+    """Verifies ID tokens against public_keys, remembering verified tokens until they expire."""
+
+    def __init__(self, maxsize=None):
+        self._tokens = LRUCache(maxsize or settings.FIREBASE_TOKEN_CACHE_SIZE)
+
+    def cached(self, token, now=None):
+        """The claims of a token verified before and not expired yet, or None."""
+        now = time.time() if now is None else now
+        claims = self._tokens.get(token)
+        if claims is not None and claims['exp'] > now:
+            count('firebase_token_cache_hits')
+            return claims
+        return None
+
+    def verify(self, token, now=None):
+        """The token's claims. Raises InvalidToken."""
+        now = time.time() if now is None else now
+        claims = self.cached(token, now)
+        if claims is not None:
+            return claims
+
+        claims = decode_token(token, now)
+        self._tokens.set(token, claims)
+        return claims
+
+    def clear(self):
+        self._tokens.clear()
+
+
+def decode_token(token, now=None):
+    """Verifies a Firebase ID token for FIREBASE_PROJECT_ID and returns its claims. Raises InvalidToken."""
+    from google.auth import exceptions, jwt
+
+    now = time.time() if now is None else now
+    project_id = settings.FIREBASE_PROJECT_ID
+    try:
+        header = jwt.decode_header(token)
+        if header.get('alg') != 'RS256':
+            raise InvalidToken('ID token must be signed with RS256.')
+        certs = public_keys.get(header.get('kid'), now)
+        claims = jwt.decode(token, certs=certs, audience=project_id, clock_skew_in_seconds=CLOCK_SKEW)
+    except (ValueError, exceptions.GoogleAuthError) as e:
+        raise InvalidToken(f'Invalid ID token: {e}')
+
+    if claims.get('iss') != f'https://securetoken.google.com/{project_id}':
+        raise InvalidToken('ID token has the wrong issuer.')
+    if not isinstance(claims.get('sub'), str) or not claims['sub'] or len(claims['sub']) > 128:
+        raise InvalidToken('ID token has no valid subject.')
+    if claims.get('auth_time', 0) > now + CLOCK_SKEW:
+        raise InvalidToken('ID token was issued for a future sign-in.')
+    return claims
+
+
+class ProfileCache:
+    """BasicInfo rows by Firebase UID, for `ttl` seconds or until forgotten."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def get(self, uid):
+        """A copy of the user's BasicInfo, or None if there is no such user."""
+        ttl = self.ttl if self.ttl is not None else settings.FIREBASE_PROFILE_CACHE_TTL
+        with self._lock:
+            cached = self._profiles.get(uid)
+        if cached is None or cached[1] <= time.monotonic():
+            profile = BasicInfo.objects.filter(firebase_uid=uid).first()
+            if profile is None:
+                return None
+            cached = (profile, time.monotonic() + ttl)
+            if ttl > 0:
+                with self._lock:
+                    self._profiles[uid] = cached
+        # Callers may change and save their copy.
+        return copy.copy(cached[0])
+
+    def forget(self, uid):
+        with self._lock:
+            self._profiles.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+verifier = TokenVerifier()
+profile_cache = ProfileCache()
+
+
+def request_uid(request, data, key='uid'):
+    """The UID of the signed-in user, or the one in `data` when authentication is off."""
+    return getattr(request, 'firebase_uid', None) or data.get(key)
+
+
+def request_profile(request, uid):
+    """The BasicInfo of `uid` from the cache, set as request.basic_info. Raises BasicInfo.DoesNotExist."""
+    profile = profile_cache.get(uid)
+    if profile is None:
+        raise BasicInfo.DoesNotExist(f'No user with UID {uid}.')
+    request.basic_info = profile
+    return profile
+
+
+def bearer_token(request):
+    """The token of the request's `Authorization: Bearer` header, or None."""
+    scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
+
+
+class FirebaseAuthMiddleware:
+    """
+    Authenticates API requests by their Firebase ID token, setting
+    request.firebase_uid, when FIREBASE_PROJECT_ID is set. Runs natively
+    under both WSGI and ASGI; under ASGI only tokens not verified before
+    (which may need Google's certificates fetched) go to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.applies(request):
+            return self.get_response(request)
+
+        token = bearer_token(request)
+        if not token:
+            return self.unauthorized('Authentication required.')
+        try:
+            claims = verifier.verify(token)
+        except InvalidToken as e:
+            return self.rejected(request, e)
+
+        request.firebase_uid = claims['sub']
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    async def __acall__(self, request):
+        if not self.applies(request):
+            return await self.get_response(request)
+
+        token = bearer_token(request)
+        if not token:
+            return self.unauthorized('Authentication required.')
+        try:
+            claims = verifier.cached(token) or await sync_to_async(verifier.verify, thread_sensitive=False)(token)
+        except InvalidToken as e:
+            return self.rejected(request, e)
+
+        request.firebase_uid = claims['sub']
+        response = await self.get_response(request)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def applies(self, request):
+        return bool(settings.FIREBASE_PROJECT_ID) and request.path.startswith(API_PREFIX) \
+            and request.method != 'OPTIONS'
+
+    def rejected(self, request, error):
+        logger.info("Rejected ID token", extra={'error': str(error), 'path': request.path})
+        return self.unauthorized('Invalid or expired ID token.')
+
+    def unauthorized(self, message):
+        # Imported here: app.signals loads this module during django.setup(),
+        # before anything needs orjson.
+        from .responses import JsonResponse
+
+        response = JsonResponse({'error': message}, status=401)
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response
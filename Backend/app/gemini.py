@@ -0,0 +1,36 @@
+"""
+The Gemini SDK, imported and configured on first use.
+
+google.generativeai pulls in gRPC, protobuf and IPython display helpers
+and takes most of a second to import, so nothing imports it at module
+level: workers, management commands and views that never call Gemini don't
+pay for it. The SDK keeps one client per process, configured here once
+with GEMINI_API_KEY.
+"""
+import threading
+
+from django.conf import settings
+
+GEMINI_MODEL = 'gemini-1.5-flash'
+
+_sdk = None
+_lock = threading.Lock()
+
+
+def sdk():
+    """The google.generativeai module, configured with GEMINI_API_KEY if there is one."""
+    global _sdk
+    if _sdk is None:
+        with _lock:
+            if _sdk is None:
+                import google.generativeai as genai
+
+                if getattr(settings, 'GEMINI_API_KEY', None):
+                    genai.configure(api_key=settings.GEMINI_API_KEY)
+                _sdk = genai
+    return _sdk
+
+
+def generative_model(name=GEMINI_MODEL):
+    """A GenerativeModel for `name`, on the process's shared client."""
+    return sdk().GenerativeModel(name)
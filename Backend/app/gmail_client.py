@@ -0,0 +1,180 @@
+"""
+Google OAuth flows, per-user credentials and Gmail API services.
+
+Building a service with googleapiclient.discovery.build() reads and parses
+the Gmail discovery document (a few hundred KB of JSON) every time, and
+each service opens its own connections. Here the parsed document is kept
+per API root and services are built from it, over one keep-alive
+httplib2.Http per thread (httplib2 is not thread-safe).
+
+Credentials are cached per user along with their expiry. An access token
+with less than GOOGLE_TOKEN_REFRESH_MARGIN seconds left is refreshed before
+it is handed out, and the new token and expiry are saved to the user's
+BasicInfo so other workers and processes pick them up.
+
+The Google client libraries are imported on first use rather than with
+this module, which the views and the sync worker import at startup.
+"""
+import datetime
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .firebase_auth import profile_cache
+from .models import BasicInfo
+
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+AUTH_URI = 'https://accounts.google.com/o/oauth2/auth'
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+HTTP_TIMEOUT = 60
+
+
+def oauth_flow():
+    """A new OAuth web flow for connecting a user's Gmail account."""
+    from google_auth_oauthlib.flow import Flow
+
+    return Flow.from_client_config(
+        {
+            "web": {
+                "client_id": settings.GOOGLE_CLIENT_ID,
+                "client_secret": settings.GOOGLE_CLIENT_SECRET,
+                "auth_uri": AUTH_URI,
+                "token_uri": TOKEN_URI,
+            }
+        },
+        scopes=SCOPES,
+        redirect_uri=settings.GOOGLE_REDIRECT_URI,
+    )
+
+
+_documents = {}
+_local = threading.local()
+
+
+def discovery_document(root_url=None):
+    """The parsed Gmail v1 discovery document pointing at `root_url` (default GMAIL_API_ROOT_URL)."""
+    root_url = root_url or settings.GMAIL_API_ROOT_URL
+    document = _documents.get(root_url)
+    if document is None:
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc('gmail', 'v1'))
+        document['rootUrl'] = root_url
+        _documents[root_url] = document
+    return document
+
+
+def thread_http():
+    """This thread's keep-alive httplib2.Http."""
+    http = getattr(_local, 'http', None)
+    if http is None:
+        import httplib2
+
+        http = _local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    return http
+
+
+def gmail_service_for(credentials, root_url=None):
+    """A Gmail service for the credentials, on this thread's connection."""
+    import google_auth_httplib2
+    from googleapiclient.discovery import build_from_document
+
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=thread_http())
+    return build_from_document(discovery_document(root_url), http=http)
+
+
+def _naive_utc(value):
+    # google-auth compares expiry as a naive UTC datetime.
+    return timezone.make_naive(value, datetime.timezone.utc) if value else None
+
+
+class CredentialCache:
+    """
+    Per-user OAuth credentials, refreshed shortly before they expire and
+    written back to BasicInfo. Safe to share between threads; refreshes for
+    one user are serialized so a token is never refreshed twice at once.
+    """
+
+    def __init__(self, margin=None):
+        self.margin = margin
+        self._credentials = {}
+        self._locks = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+        self._session = None
+
+    def _user_lock(self, user_id):
+        with self._lock:
+            return self._locks[user_id]
+
+    def _request(self):
+        """A google-auth transport on this cache's keep-alive session."""
+        import google.auth.transport.requests
+        import requests
+
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+        return google.auth.transport.requests.Request(session=self._session)
+
+    def _stale(self, creds, user):
+        """Whether the user's stored tokens are newer than the cached credentials."""
+        if creds is None or creds.refresh_token != user.google_refresh_token:
+            return True
+        stored_expiry = _naive_utc(user.google_token_expiry)
+        return stored_expiry is not None and (creds.expiry is None or stored_expiry > creds.expiry)
+
+    def _expiring(self, creds):
+        if creds.expiry is None:
+            # Saved before expiry was tracked: refresh once to learn it.
+            return True
+        margin = self.margin if self.margin is not None else settings.GOOGLE_TOKEN_REFRESH_MARGIN
+        return creds.expiry - datetime.timedelta(seconds=margin) <= _naive_utc(timezone.now())
+
+    def get(self, user):
+        """Returns valid Credentials for the user, refreshing and saving the token if needed."""
+        from google.oauth2.credentials import Credentials
+
+        with self._user_lock(user.pk):
+            creds = self._credentials.get(user.pk)
+            if self._stale(creds, user):
+                creds = Credentials(
+                    token=user.google_access_token,
+                    refresh_token=user.google_refresh_token,
+                    token_uri=TOKEN_URI,
+                    client_id=settings.GOOGLE_CLIENT_ID,
+                    client_secret=settings.GOOGLE_CLIENT_SECRET,
+                    scopes=SCOPES,
+                    expiry=_naive_utc(user.google_token_expiry),
+                )
+            if creds.refresh_token and self._expiring(creds):
+                creds.refresh(self._request())
+                user.google_access_token = creds.token
+                user.google_token_expiry = timezone.make_aware(creds.expiry, datetime.timezone.utc) \
+                    if creds.expiry else None
+                BasicInfo.objects.filter(pk=user.pk).update(
+                    google_access_token=user.google_access_token,
+                    google_token_expiry=user.google_token_expiry,
+                )
+                profile_cache.forget(user.firebase_uid)
+            self._credentials[user.pk] = creds
+            return creds
+
+    def forget(self, user_id):
+        with self._user_lock(user_id):
+            self._credentials.pop(user_id, None)
+
+
+credential_cache = CredentialCache()
+
+
+def user_credentials(user):
+    """Valid Credentials for the user's stored OAuth tokens."""
+    return credential_cache.get(user)
+
+
+def gmail_service(user):
+    """A Gmail service authorized as the user."""
+    return gmail_service_for(user_credentials(user))
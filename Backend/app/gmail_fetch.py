@@ -0,0 +1,166 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Gmail rejects batches larger than 100 and recommends staying at or below 50.
+MAX_BATCH_SIZE = 100
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _status_of(error):
+    resp = getattr(error, 'resp', None)
+    try:
+        return int(getattr(resp, 'status', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def default_http_factory(service):
+    """
+    Returns a callable producing a fresh HTTP object for a worker thread.
+    httplib2.Http is not thread-safe, so every concurrent batch needs its own
+    connection, authorized with the same credentials as the service.
+    """
+    import google_auth_httplib2
+    import httplib2
+
+    http = getattr(service, '_http', None)
+    if not isinstance(http, google_auth_httplib2.AuthorizedHttp):
+        return httplib2.Http
+
+    def factory():
+        return google_auth_httplib2.AuthorizedHttp(http.credentials, http=httplib2.Http())
+    return factory
+
+
+class GmailBatchFetcher:
+    """
+    Downloads Gmail messages by ID using batch requests instead of one HTTP
+    round-trip per message.
+
+    IDs are grouped into batches of `batch_size`. With `max_workers` > 1 the
+    batches are sent concurrently, each on its own connection. A failure for
+    one message (e.g. 404) never fails the rest of its batch; 429/5xx responses,
+    for single messages or for the whole batch, are retried with exponential
+    backoff up to `max_retries` times.
+    """
+
+    def __init__(self, service, batch_size=50, max_workers=1, max_retries=4,
+                 backoff_base=0.5, http_factory=None, sleep=time.sleep):
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self.service = service
+        self.batch_size = batch_size
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.http_factory = http_factory
+        self.sleep = sleep
+
+    def fetch(self, message_ids, format='full', metadata_headers=None):
+        """
+        Fetches the given message IDs.
+        Returns a tuple (messages, errors): the successfully fetched message
+        resources in the order of `message_ids`, and a dict mapping each
+        failed ID to the exception that ended its retries.
+        """
+        message_ids = list(dict.fromkeys(message_ids))
+        chunks = list(_chunks(message_ids, self.batch_size))
+        fetched, errors = {}, {}
+
+        if self.max_workers == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                ok, failed = self._fetch_chunk(chunk, format, metadata_headers, http=None)
+                fetched.update(ok)
+                errors.update(failed)
+        else:
+            factory = self.http_factory or default_http_factory(self.service)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [
+                    pool.submit(self._fetch_chunk, chunk, format, metadata_headers, factory())
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    ok, failed = future.result()
+                    fetched.update(ok)
+                    errors.update(failed)
+
+        messages = [fetched[msg_id] for msg_id in message_ids if msg_id in fetched]
+        return messages, errors
+
+    def _get_request(self, msg_id, format, metadata_headers):
+        kwargs = {'userId': 'me', 'id': msg_id, 'format': format}
+        if metadata_headers:
+            kwargs['metadataHeaders'] = list(metadata_headers)
+        return self.service.users().messages().get(**kwargs)
+
+    def _backoff(self, attempt):
+        delay = self.backoff_base * (2 ** attempt)
+        self.sleep(delay + random.uniform(0, delay / 2))
+
+    def _fetch_chunk(self, chunk, format, metadata_headers, http):
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        fetched, errors = {}, {}
+        pending = list(chunk)
+
+        for attempt in range(self.max_retries + 1):
+            retry = []
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                    errors.pop(request_id, None)
+                elif _status_of(exception) in RETRYABLE_STATUSES:
+                    retry.append(request_id)
+                    errors[request_id] = exception
+                else:
+                    errors[request_id] = exception
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            for msg_id in pending:
+                batch.add(self._get_request(msg_id, format, metadata_headers), request_id=msg_id)
+
+            try:
+                batch.execute(http=http)
+            except HttpError as e:
+                # The batch endpoint itself failed; none of its parts were processed.
+                if _status_of(e) not in RETRYABLE_STATUSES:
+                    for msg_id in pending:
+                        errors[msg_id] = e
+                    return fetched, errors
+                retry = [msg_id for msg_id in pending if msg_id not in fetched]
+                for msg_id in retry:
+                    errors[msg_id] = e
+            except (httplib2.HttpLib2Error, OSError) as e:
+                retry = [msg_id for msg_id in pending if msg_id not in fetched]
+                for msg_id in retry:
+                    errors[msg_id] = e
+
+            if not retry:
+                break
+            pending = retry
+            if attempt < self.max_retries:
+                self._backoff(attempt)
+
+        return fetched, errors
+
+
+def fetch_messages(service, message_ids, format='full', metadata_headers=None, **options):
+    """
+    Convenience wrapper around GmailBatchFetcher using the project settings
+    for batch size and concurrency.
+    """
+    options.setdefault('batch_size', settings.GMAIL_FETCH_BATCH_SIZE)
+    options.setdefault('max_workers', settings.GMAIL_FETCH_CONCURRENCY)
+    return GmailBatchFetcher(service, **options).fetch(
+        message_ids, format=format, metadata_headers=metadata_headers
+    )
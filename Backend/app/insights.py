@@ -0,0 +1,159 @@
+"""
+AI financial insights for the analysis dashboard.
+
+The Gemini answer depends only on the prompt, which is built from the
+salary, income, expenses and category totals of the window being viewed,
+so answers are cached under a hash of the prompt: a dashboard reloaded with
+unchanged numbers never calls the model. On a miss the answer is generated
+on a small thread pool (one generation per prompt at a time) and the
+request gets the user's previous insight for the same window, or a
+placeholder, without waiting on Gemini. With AI_INSIGHTS_WORKERS = 0 (the
+test suite) answers are generated in the request instead. A failed
+generation is remembered for AI_INSIGHTS_FAILURE_TTL seconds, during which
+the prompt is answered as unavailable instead of asking Gemini again.
+
+The analysis response carries a signed poll token (poll_token()) for
+insights still being generated; the insights endpoint answers it from this
+module alone, without redoing the dashboard's queries.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+from . import gemini
+from .instrumentation import count, span
+
+PLACEHOLDER = "Your financial insights are being prepared. They will appear here in a moment."
+UNAVAILABLE = "Could not generate AI insights at this time."
+POLL_SALT = 'app.insights.poll'
+# Seconds a poll token stays valid
+POLL_MAX_AGE = 3600
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def build_prompt(salary, income, expenses, category_spending):
+    category_summary = ", ".join([f"{item['category']}: Rs.{item['total']:.2f}" for item in category_spending])
+    overspend_alert = "Your spending is high compared to your income. Consider reviewing your expenses." if salary and expenses > (salary * 0.8) else ""
+    return (f"You are a friendly financial advisor in India. User's Monthly Salary: Rs.{salary}. "
+            f"This Period's Income: Rs.{income:.2f}, Expenses: Rs.{expenses:.2f}. "
+            f"Spending by category: {category_summary}. {overspend_alert} "
+            f"Provide 2-3 short, actionable suggestions to help them manage their finances better. Format as a single block of text.")
+
+
+def prompt_key(prompt):
+    return 'insights:' + hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def failure_key(key):
+    return key + ':failed'
+
+
+def generate(prompt, key, latest_key):
+    """Asks Gemini for the prompt's insights and caches them. Returns the text, or None on failure."""
+    cache = caches['insights']
+    try:
+        with span('gemini_insights'):
+            text = gemini.generative_model(gemini.GEMINI_MODEL).generate_content(prompt).text
+    except Exception as e:
+        logger.warning("AI insight generation failed", extra={'error': str(e)})
+        text = None
+    if text is not None:
+        cache.set(key, text)
+        cache.set(latest_key, text)
+    else:
+        cache.set(failure_key(key), True, settings.AI_INSIGHTS_FAILURE_TTL)
+    # Only now, so a request arriving meanwhile finds either the answer or this generation.
+    with _lock:
+        _pending.pop(key, None)
+    return text
+
+
+def submit(prompt, key, latest_key):
+    """Starts generating the prompt's insights unless that is already under way; returns the future."""
+    global _executor
+    if not settings.AI_INSIGHTS_WORKERS:
+        future = Future()
+        future.set_result(generate(prompt, key, latest_key))
+        return future
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.AI_INSIGHTS_WORKERS,
+                                               thread_name_prefix='ai-insights')
+            future = _pending[key] = _executor.submit(generate, prompt, key, latest_key)
+    return future
+
+
+def shutdown(wait=True):
+    """Stops the generation threads, waiting for running generations if `wait`; the next miss starts new ones."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        _pending.clear()
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def get_insights(prompt, latest_key, wait=None):
+    """
+    Returns (text, status) for the prompt. status is 'ready' for a cached or
+    freshly generated answer, 'stale' when the previous answer stored under
+    `latest_key` stands in while a new one is generated, 'pending' when
+    there is nothing to show yet, and 'unavailable' when generating failed
+    recently (with the previous answer, if any). Waits up to `wait` seconds
+    (default AI_INSIGHTS_WAIT) for a generation to finish.
+    """
+    cache = caches['insights']
+    key = prompt_key(prompt)
+    text = cache.get(key)
+    if text is not None:
+        count('insights_cache_hits')
+        cache.set(latest_key, text)
+        return text, 'ready'
+    count('insights_cache_misses')
+    if cache.get(failure_key(key)):
+        return cache.get(latest_key, UNAVAILABLE), 'unavailable'
+
+    future = submit(prompt, key, latest_key)
+    wait = settings.AI_INSIGHTS_WAIT if wait is None else wait
+    if wait or future.done():
+        try:
+            text = future.result(timeout=wait)
+        except TimeoutError:
+            pass
+        else:
+            if text is None:
+                return cache.get(latest_key, UNAVAILABLE), 'unavailable'
+            return text, 'ready'
+
+    stale = cache.get(latest_key)
+    if stale is not None:
+        return stale, 'stale'
+    return PLACEHOLDER, 'pending'
+
+
+def poll_token(uid, prompt, latest_key):
+    """A signed token with which the user `uid` can ask for the prompt's insights again."""
+    return signing.dumps({'uid': uid, 'prompt': prompt, 'latest': latest_key}, salt=POLL_SALT, compress=True)
+
+
+def poll_insights(uid, token):
+    """
+    get_insights() for a poll token issued to `uid`, without waiting.
+    Raises signing.BadSignature for a forged, expired or someone else's token.
+    """
+    data = signing.loads(token, salt=POLL_SALT, max_age=POLL_MAX_AGE)
+    if data['uid'] != uid:
+        raise signing.BadSignature('Poll token was issued to another user.')
+    return get_insights(data['prompt'], data['latest'], wait=0)
@@ -0,0 +1,255 @@
+"""
+Metrics and structured logging.
+
+Hot paths are wrapped in `span(name)` blocks, whose durations go to the
+`moneyminder_span_seconds` histogram, and bump counters with `count()`.
+Everything is kept in-process and served by the /metrics view in the
+Prometheus text exposition format, so each worker process reports its own
+numbers. METRICS_ENABLED=false turns every span and counter into a no-op.
+
+Log records of the `app` loggers are written one JSON object per line by
+JsonFormatter, with any `extra` fields as keys; LOG_LEVEL=OFF silences them
+(see settings.LOGGING).
+"""
+import bisect
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger(__name__)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(labelnames, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, _label_text(self.labelnames, key), value
+
+
+class Histogram:
+    """Observations counted into cumulative `le` buckets, per label combination."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, n) for key, (counts, total, n) in self.values.items()}
+        for key, (counts, total, n) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket', _label_text(self.labelnames + ('le',), key + (bound,)),
+                       cumulative)
+            yield f'{self.name}_sum', _label_text(self.labelnames, key), total
+            yield f'{self.name}_count', _label_text(self.labelnames, key), n
+
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, help, labelnames, **options):
+    with _registry_lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, help, labelnames, **options)
+        return metric
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter, name, help, labelnames)
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+
+SPAN_SECONDS = histogram('moneyminder_span_seconds', 'Time spent in instrumented code paths.',
+                         ('span', 'outcome'))
+EVENTS = counter('moneyminder_events_total', 'Things processed, by kind.', ('event',))
+REQUEST_SECONDS = histogram('moneyminder_http_request_seconds', 'Time to answer HTTP requests.',
+                            ('view', 'method', 'status'))
+
+
+def enabled():
+    return settings.METRICS_ENABLED
+
+
+_recordings = []
+
+
+class recording:
+    """
+    Collects the duration of every span finished while it is active, as
+    {name: [seconds, ...]}, for benchmarks that need exact percentiles.
+    """
+
+    def __enter__(self):
+        self.spans = defaultdict(list)
+        _recordings.append(self.spans)
+        return self.spans
+
+    def __exit__(self, exc_type, exc, tb):
+        _recordings.remove(self.spans)
+        return False
+
+
+class span:
+    """
+    Times the block under `name`, with outcome "error" if it raises.
+        with span('gmail_list'):
+            ...
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not enabled():
+            return False
+        elapsed = time.perf_counter() - self.start
+        SPAN_SECONDS.observe(elapsed, span=self.name, outcome='error' if exc_type else 'ok')
+        for spans in _recordings:
+            spans[self.name].append(elapsed)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('span', extra={'span': self.name, 'ms': round(elapsed * 1000, 3),
+                                        'outcome': 'error' if exc_type else 'ok'})
+        return False
+
+
+def count(event, amount=1):
+    if amount and enabled():
+        EVENTS.inc(amount, event=event)
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    with _registry_lock:
+        metrics = list(REGISTRY.values())
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the duration of every request, labelled by URL name. Runs
+    natively under both WSGI and ASGI, so as the outermost middleware it
+    doesn't force the stack below it into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    def observe(self, request, response, start):
+        match = request.resolver_match
+        REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                view=match.view_name if match else 'unmatched',
+                                method=request.method, status=response.status_code)
+
+
+# Attributes every LogRecord has; anything else came from `extra`.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object: time, level, logger, message and extra fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,238 @@
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .gmail_client import gmail_service
+from .models import BasicInfo, SyncJob
+from .sync import GmailSyncEngine
+
+ACTIVE_STATUSES = (SyncJob.QUEUED, SyncJob.RUNNING)
+FINISHED_STATUSES = (SyncJob.SUCCEEDED, SyncJob.FAILED)
+# Seconds between a worker's sweeps for stale and old jobs
+MAINTENANCE_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_sync(user):
+    """
+    Queues a Gmail sync for the user and returns the job.
+    If the user already has a queued or running sync, that job is returned
+    instead of creating another one; a queued one scheduled for later is
+    moved up to now.
+    """
+    with transaction.atomic():
+        existing = (SyncJob.objects.select_for_update()
+                    .filter(user=user, status__in=ACTIVE_STATUSES)
+                    .order_by('created_at').first())
+        if existing:
+            if existing.status == SyncJob.QUEUED and existing.not_before:
+                existing.not_before = None
+                existing.save(update_fields=['not_before'])
+            return existing
+        return SyncJob.objects.create(user=user)
+
+
+def schedule_syncs(interval=None, stale_after=None, max_per_minute=None, now=None, rng=random):
+    """
+    Queues a sync for every connected user whose last sync is older than
+    `stale_after` and who has no queued or running sync, stalest first.
+
+    Start times are spread evenly over the next `interval` (stretched if
+    `max_per_minute` couldn't start them all in time), each jittered within
+    its slot, so the workers never see the whole user base at once and every
+    sync has only a short stretch of mail to catch up on. Returns the jobs.
+    """
+    interval = interval or datetime.timedelta(minutes=settings.SYNC_SCHEDULE_INTERVAL)
+    stale_after = stale_after or interval
+    max_per_minute = settings.SYNC_MAX_STARTS_PER_MINUTE if max_per_minute is None else max_per_minute
+    now = now or timezone.now()
+
+    users = list(BasicInfo.objects
+                 .exclude(Q(google_refresh_token__isnull=True) | Q(google_refresh_token=''))
+                 .filter(Q(last_email_sync__isnull=True) | Q(last_email_sync__lt=now - stale_after))
+                 .exclude(sync_jobs__status__in=ACTIVE_STATUSES)
+                 .order_by(F('last_email_sync').asc(nulls_first=True), 'pk')
+                 .values_list('pk', flat=True))
+    if not users:
+        return []
+    window = interval
+    if max_per_minute:
+        window = max(window, datetime.timedelta(minutes=len(users) / max_per_minute))
+    slot = window / len(users)
+    return SyncJob.objects.bulk_create([
+        SyncJob(user_id=user_id, not_before=now + slot * i + slot * rng.random())
+        for i, user_id in enumerate(users)
+    ])
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically moves the oldest claimable queued job to running and returns
+    it, or None if there is nothing to do. A job is not claimable while
+    another job for the same user is running; the partial unique constraint
+    on SyncJob makes that hold across workers and processes.
+    """
+    now = timezone.now()
+    limit = settings.SYNC_MAX_STARTS_PER_MINUTE
+    if limit and SyncJob.objects.filter(started_at__gte=now - datetime.timedelta(minutes=1)).count() >= limit:
+        # Over the global start rate; concurrent workers may overshoot it by a few.
+        return None
+    candidates = (SyncJob.objects.filter(status=SyncJob.QUEUED)
+                  .filter(Q(not_before__isnull=True) | Q(not_before__lte=now))
+                  .exclude(user__sync_jobs__status=SyncJob.RUNNING)
+                  .order_by('created_at')
+                  .values_list('pk', flat=True)[:10])
+    for job_id in candidates:
+        try:
+            with transaction.atomic():
+                started = timezone.now()
+                claimed = SyncJob.objects.filter(pk=job_id, status=SyncJob.QUEUED).update(
+                    status=SyncJob.RUNNING, worker=worker_name, started_at=started, heartbeat_at=started
+                )
+        except IntegrityError:
+            # Another worker just started a sync for the same user.
+            continue
+        if claimed:
+            return SyncJob.objects.select_related('user').get(pk=job_id)
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """Touches a running job's heartbeat_at every `interval` seconds until stopped."""
+
+    def __init__(self, job_id, interval=None):
+        super().__init__(name=f'sync-heartbeat-{job_id}', daemon=True)
+        self.job_id = job_id
+        self.interval = interval or settings.SYNC_HEARTBEAT_INTERVAL
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                SyncJob.objects.filter(pk=self.job_id, status=SyncJob.RUNNING).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception("Sync job heartbeat failed", extra={'job_id': self.job_id})
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def start_job(user, worker_name):
+    """
+    Starts a sync for the user now, outside the queue: their queued job is
+    claimed, or a running one created. Returns the job, or None if a sync
+    of theirs is already running (the one-running-sync constraint holds for
+    these syncs too).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            job = (SyncJob.objects.select_for_update()
+                   .filter(user=user, status=SyncJob.QUEUED).order_by('created_at').first()) or SyncJob(user=user)
+            job.status, job.worker, job.started_at, job.heartbeat_at = SyncJob.RUNNING, worker_name, now, now
+            job.not_before = None
+            job.save()
+    except IntegrityError:
+        return None
+    return job
+
+
+def finish_job(job, stats=None, error=None):
+    """Records the outcome of a started job: its final stats, or the exception that ended it."""
+    if error is None:
+        job.progress = dict(stats, stage='done')
+        job.status = SyncJob.SUCCEEDED
+    else:
+        job.error = str(error)
+        job.status = SyncJob.FAILED
+    job.finished_at = timezone.now()
+    job.save(update_fields=['progress', 'status', 'error', 'finished_at'])
+    return job
+
+
+def run_job(job):
+    """Runs a claimed job to completion, recording progress and outcome."""
+    def on_progress(stats):
+        SyncJob.objects.filter(pk=job.pk).update(progress=stats, heartbeat_at=timezone.now())
+
+    heartbeat = Heartbeat(job.pk)
+    heartbeat.start()
+    try:
+        service = gmail_service(job.user)
+        stats = GmailSyncEngine(service, job.user, on_progress=on_progress).run()
+    except Exception as e:
+        logger.exception("Sync job failed", extra={'job_id': job.pk, 'user_id': job.user_id})
+        return finish_job(job, error=e)
+    finally:
+        heartbeat.stop()
+    return finish_job(job, stats)
+
+
+def worker_loop(worker_name, stop_event, poll_interval=2.0, once=False, stale_after=None):
+    """
+    Claims and runs jobs until `stop_event` is set. With `once`, returns as
+    soon as the queue has no claimable job. Between jobs, at most every
+    MAINTENANCE_INTERVAL seconds, re-queues jobs whose worker died and
+    deletes old finished ones.
+    """
+    swept = None
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            if swept is None or time.monotonic() - swept >= MAINTENANCE_INTERVAL:
+                swept = time.monotonic()
+                recovered = recover_stale_jobs(stale_after)
+                if recovered:
+                    logger.warning("Re-queued stale sync jobs", extra={'jobs': recovered, 'worker': worker_name})
+                prune_finished_jobs()
+            job = claim_next_job(worker_name)
+            if job is None:
+                if once:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job)
+    finally:
+        connection.close()
+
+
+def default_worker_name(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{index}"
+
+
+def recover_stale_jobs(older_than=None, now=None):
+    """
+    Re-queues running jobs whose worker died before finishing them: those
+    without a heartbeat for `older_than` (default SYNC_STALE_AFTER seconds).
+    Jobs of live workers keep beating and are left alone. Returns the number
+    of jobs re-queued.
+    """
+    older_than = older_than or datetime.timedelta(seconds=settings.SYNC_STALE_AFTER)
+    cutoff = (now or timezone.now()) - older_than
+    return SyncJob.objects.filter(status=SyncJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ).update(status=SyncJob.QUEUED, worker=None, started_at=None, heartbeat_at=None)
+
+
+def prune_finished_jobs(older_than=None, now=None):
+    """
+    Deletes jobs that finished more than `older_than` (default
+    SYNC_JOB_RETENTION_DAYS) ago. Returns the number deleted.
+    """
+    older_than = older_than or datetime.timedelta(days=settings.SYNC_JOB_RETENTION_DAYS)
+    cutoff = (now or timezone.now()) - older_than
+    deleted, _ = SyncJob.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=cutoff).delete()
+    return deleted
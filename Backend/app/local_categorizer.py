@@ -0,0 +1,126 @@
+"""
+In-process transaction categorizer.
+
+Merchant keyword rules settle the descriptions they recognise outright.
+Everything else is scored by a multinomial naive Bayes model over hashed
+word and word-pair features, trained from descriptions that already have a
+category. A whole batch is scored with a few NumPy operations, and every
+prediction comes with its probability so callers can hand only the
+low-confidence ones to the LLM.
+
+Descriptions are expected to be normalized already
+(app.categorization.normalize_description).
+"""
+import zlib
+
+import numpy as np
+
+N_FEATURES = 2 ** 16
+
+# Merchants whose category is unambiguous, matched against whole words.
+MERCHANT_RULES = (
+    (('swiggy', 'zomato', 'dominos', 'mcdonalds', 'kfc', 'starbucks', 'restaurant', 'cafe'), 'Food & Dining'),
+    (('uber', 'ola', 'rapido', 'irctc', 'indigo', 'redbus', 'fastag', 'petrol', 'fuel'), 'Transport'),
+    (('amazon', 'flipkart', 'myntra', 'ajio', 'nykaa', 'meesho', 'croma', 'decathlon'), 'Shopping'),
+    (('electricity', 'bescom', 'broadband', 'postpaid', 'recharge', 'airtel', 'jio'), 'Bills & Utilities'),
+    (('bookmyshow', 'netflix', 'spotify', 'hotstar', 'pvr', 'inox'), 'Entertainment'),
+    (('pharmacy', 'pharmeasy', 'practo', 'hospital', 'medplus', 'netmeds'), 'Health & Wellness'),
+    (('bigbasket', 'blinkit', 'zepto', 'dmart', 'jiomart', 'grocery', 'supermarket'), 'Groceries'),
+    (('salary', 'payroll', 'dividend', 'cashback'), 'Income'),
+    (('neft', 'imps', 'rtgs'), 'Transfers'),
+)
+
+
+class LocalCategorizer:
+    """
+    Keyword rules plus a hashed-feature naive Bayes model over `categories`.
+    `alpha` is the additive smoothing of the feature counts.
+    """
+
+    def __init__(self, categories, rules=MERCHANT_RULES, n_features=N_FEATURES, alpha=0.1):
+        self.categories = list(categories)
+        self.category_index = {category: i for i, category in enumerate(self.categories)}
+        self.rules = {keyword: category for keywords, category in rules for keyword in keywords}
+        self.n_features = n_features
+        self.alpha = alpha
+        self.log_prior = None
+        self.log_likelihood = None
+        self._feature_ids = {}
+
+    @property
+    def trained(self):
+        return self.log_likelihood is not None
+
+    def _feature_id(self, feature):
+        feature_id = self._feature_ids.get(feature)
+        if feature_id is None:
+            # crc32 rather than hash(): stable across processes.
+            feature_id = self._feature_ids[feature] = zlib.crc32(feature.encode('utf-8')) % self.n_features
+        return feature_id
+
+    def _features(self, keys):
+        """
+        Returns (rows, columns) arrays listing the hashed word and word-pair
+        features of every key, one entry per occurrence.
+        """
+        rows, columns = [], []
+        for row, key in enumerate(keys):
+            words = key.split()
+            for feature in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+                rows.append(row)
+                columns.append(self._feature_id(feature))
+        return np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)
+
+    def fit(self, keys, labels):
+        """Trains the model on normalized descriptions and their categories."""
+        pairs = [(key, self.category_index[label]) for key, label in zip(keys, labels)
+                 if key and label in self.category_index]
+        if not pairs:
+            return self
+        keys, classes = zip(*pairs)
+        classes = np.array(classes, dtype=np.intp)
+        rows, columns = self._features(keys)
+
+        counts = np.full((len(self.categories), self.n_features), self.alpha, dtype=np.float32)
+        np.add.at(counts, (classes[rows], columns), 1)
+        self.log_likelihood = np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))
+        class_counts = np.bincount(classes, minlength=len(self.categories)) + 1
+        self.log_prior = np.log(class_counts / class_counts.sum()).astype(np.float32)
+        return self
+
+    def rule_for(self, key):
+        for word in key.split():
+            category = self.rules.get(word)
+            if category is not None:
+                return category
+        return None
+
+    def predict(self, keys):
+        """
+        Returns a list of (category, confidence) pairs, one per key: 1.0 for
+        rule matches, the model's probability otherwise, and (None, 0.0) if
+        neither applies.
+        """
+        results = [(None, 0.0)] * len(keys)
+        unmatched = []
+        for i, key in enumerate(keys):
+            category = self.rule_for(key)
+            if category is not None:
+                results[i] = (category, 1.0)
+            elif key:
+                unmatched.append(i)
+        if not unmatched or not self.trained:
+            return results
+
+        rows, columns = self._features([keys[i] for i in unmatched])
+        scores = np.tile(self.log_prior, (len(unmatched), 1))
+        np.add.at(scores, rows, self.log_likelihood[:, columns].T)
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(unmatched)), best]
+        for i, category_id, probability in zip(unmatched, best.tolist(), confidence.tolist()):
+            results[i] = (self.categories[category_id], probability)
+        return results
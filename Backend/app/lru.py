@@ -0,0 +1,42 @@
+"""
+A small thread-safe LRU mapping, shared by the categorization and Firebase
+token caches. Kept apart from app.categorization so code that only needs the
+cache (the auth middleware, loaded during django.setup()) doesn't import
+numpy with the local categorizer.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used key. Safe to share
+    between threads (request threads, sync workers, the insights executor).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.data.clear()
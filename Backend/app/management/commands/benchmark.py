@@ -0,0 +1,98 @@
+import datetime
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.benchmarks import BENCHMARKS
+
+
+def _param(text):
+    name, sep, value = text.partition('=')
+    if not sep or not name:
+        raise ValueError(text)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name, value
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(old, new, path=''):
+    """Yields (path, old, new) for every number present in both result trees."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in new:
+            if key in old:
+                yield from _compare(old[key], new[key], f'{path}.{key}' if path else key)
+    elif isinstance(old, (int, float)) and isinstance(new, (int, float)) \
+            and not isinstance(old, bool) and not isinstance(new, bool):
+        yield path, old, new
+
+
+class Command(BaseCommand):
+    help = "Runs performance benchmarks against a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Benchmarks to run (default: all).")
+        parser.add_argument('--list', action='store_true', help="List available benchmarks.")
+        parser.add_argument('--output', help="Also write the results as JSON to this file.")
+        parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                            help="Override a benchmark argument (JSON value, e.g. transactions=[1000,100000]). "
+                                 "Applies to every selected benchmark that takes it.")
+        parser.add_argument('--compare', metavar='FILE',
+                            help="Print how each number changed relative to an earlier --output file.")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, func in BENCHMARKS.items():
+                self.stdout.write(f"{name}: {(func.__doc__ or '').strip()}")
+            return
+
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+        try:
+            params = dict(_param(text) for text in options['param'])
+        except ValueError as e:
+            raise CommandError(f"Invalid --param {e}; expected NAME=VALUE.")
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {}
+            for name in names:
+                func = BENCHMARKS[name]
+                arguments = func.__code__.co_varnames[:func.__code__.co_argcount]
+                kwargs = {key: value for key, value in params.items() if key in arguments}
+                self.stdout.write(f"Running {name}...")
+                results[name] = func(**kwargs)
+                self.stdout.write(json.dumps(results[name], indent=2))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            self.stdout.write(f"Compared with {previous.get('commit') or options['compare']}:")
+            for path, old, new in _compare(previous.get('results', previous), results):
+                change = f"{(new - old) / old:+.1%}" if old else "n/a"
+                self.stdout.write(f"  {path}: {old} -> {new} ({change})")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'commit': _commit(),
+                    'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    'params': params,
+                    'results': results,
+                }, f, indent=2)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import BasicInfo
+from app.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes the monthly FinancialReport rollups from transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', action='append', default=[],
+                            help="Firebase UID of a user to rebuild (repeatable). Defaults to every user.")
+
+    def handle(self, *args, **options):
+        users = BasicInfo.objects.all()
+        if options['uid']:
+            users = users.filter(firebase_uid__in=options['uid'])
+            missing = set(options['uid']) - set(users.values_list('firebase_uid', flat=True))
+            if missing:
+                raise CommandError(f"Unknown UID(s): {', '.join(sorted(missing))}")
+
+        total = 0
+        for user_id, email in users.values_list('pk', 'email'):
+            months = rebuild(user_id)
+            total += months
+            self.stdout.write(f"{email}: {months} month(s)")
+        self.stdout.write(f"Rebuilt {total} report(s).")
@@ -0,0 +1,80 @@
+import datetime
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.jobs import default_worker_name, worker_loop
+
+
+def _stop_on_signals(stop_event):
+    """Makes SIGTERM and SIGINT stop the workers once their current jobs finish."""
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+
+
+def _process_main(index, poll_interval, once, stale_after):
+    stop_event = threading.Event()
+    _stop_on_signals(stop_event)
+    worker_loop(default_worker_name(index), stop_event, poll_interval, once, stale_after)
+
+
+class Command(BaseCommand):
+    help = "Runs queued Gmail sync jobs on a pool of worker threads or processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Number of concurrent workers.")
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread',
+                            help="Run workers as threads in this process or as separate processes.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait before polling an empty queue again.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue has no claimable jobs.")
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help="Re-queue running jobs without a heartbeat for this many seconds "
+                                 "(default SYNC_STALE_AFTER).")
+
+    def handle(self, *args, **options):
+        stale_after = options['stale_after'] and datetime.timedelta(seconds=options['stale_after'])
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Starting {workers} sync worker {options['mode']}(s).")
+        if options['mode'] == 'process':
+            self._run_processes(workers, options['poll_interval'], options['once'], stale_after)
+        else:
+            self._run_threads(workers, options['poll_interval'], options['once'], stale_after)
+        self.stdout.write("Sync workers stopped.")
+
+    def _run_threads(self, workers, poll_interval, once, stale_after):
+        stop_event = threading.Event()
+        _stop_on_signals(stop_event)
+        threads = [
+            threading.Thread(target=worker_loop,
+                             args=(default_worker_name(i), stop_event, poll_interval, once, stale_after))
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        # Joined with a timeout so the main thread keeps handling signals.
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+
+    def _run_processes(self, workers, poll_interval, once, stale_after):
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_process_main, args=(i, poll_interval, once, stale_after))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
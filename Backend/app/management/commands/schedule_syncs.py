@@ -0,0 +1,35 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.jobs import schedule_syncs
+
+
+class Command(BaseCommand):
+    help = "Queues incremental Gmail syncs for connected users, spread over the sync interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=settings.SYNC_SCHEDULE_INTERVAL,
+                            help="Minutes to spread the syncs over (default SYNC_SCHEDULE_INTERVAL).")
+        parser.add_argument('--stale-after', type=int,
+                            help="Only sync users last synced this many minutes ago (default --interval).")
+        parser.add_argument('--max-per-minute', type=int, default=settings.SYNC_MAX_STARTS_PER_MINUTE,
+                            help="Stretch the schedule so no more syncs than this start per minute (0: no limit).")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep scheduling every --interval minutes instead of exiting.")
+
+    def handle(self, *args, **options):
+        interval = datetime.timedelta(minutes=max(1, options['interval']))
+        stale_after = datetime.timedelta(minutes=options['stale_after']) if options['stale_after'] is not None \
+            else interval
+        while True:
+            jobs = schedule_syncs(interval, stale_after, options['max_per_minute'])
+            self.stdout.write(f"Scheduled {len(jobs)} sync(s).")
+            if not options['loop']:
+                return
+            try:
+                time.sleep(interval.total_seconds())
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_syncjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='gmail_message_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(fields=('user', 'gmail_message_id'), name='unique_transaction_per_message'),
+        ),
+    ]
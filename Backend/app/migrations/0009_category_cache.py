@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_transaction_gmail_message_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_description', models.CharField(max_length=255, unique=True)),
+                ('category', models.CharField(max_length=50)),
+                ('source', models.CharField(default='gemini', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basicinfo',
+            name='google_token_expiry',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
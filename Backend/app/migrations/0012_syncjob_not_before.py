@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_basicinfo_google_token_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncjob',
+            name='not_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
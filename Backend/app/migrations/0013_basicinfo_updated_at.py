@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_syncjob_not_before'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basicinfo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
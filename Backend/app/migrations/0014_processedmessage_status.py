@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_basicinfo_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedmessage',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='processedmessage',
+            name='status',
+            field=models.CharField(choices=[('processed', 'Processed'), ('failed', 'Failed')], default='processed', max_length=10),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_processedmessage_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='syncjob',
+            index=models.Index(fields=['started_at'], name='app_syncjob_started_0031c5_idx'),
+        ),
+    ]
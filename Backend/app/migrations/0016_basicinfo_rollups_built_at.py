@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_syncjob_heartbeat'),
+    ]
+
+    operations = [
+        # Existing users get null, so their reports are rebuilt on first use;
+        # users created from now on start with complete (empty) reports.
+        migrations.AddField(
+            model_name='basicinfo',
+            name='rollups_built_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='basicinfo',
+            name='rollups_built_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+    ]
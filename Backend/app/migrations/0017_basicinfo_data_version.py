@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_basicinfo_rollups_built_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basicinfo',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
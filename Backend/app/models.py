@@ -17,6 +17,18 @@ class BasicInfo(models.Model):
     last_email_sync = models.DateTimeField(null=True, blank=True)
     google_access_token = models.TextField(null=True, blank=True)
     google_refresh_token = models.TextField(null=True, blank=True)
+    # When google_access_token expires; unknown (null) for tokens saved before it was tracked
+    google_token_expiry = models.DateTimeField(null=True, blank=True)
+    # Bumped by every save of the profile (not by token refreshes, which
+    # update the row directly); part of the dashboard's ETags (see app.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every write to the user's transactions (see
+    # app.conditional.bump_data_version); part of the dashboard's ETags
+    data_version = models.PositiveBigIntegerField(default=0)
+    # When the user's FinancialReports were last rebuilt from all their
+    # transactions; null for users whose transactions predate the reports,
+    # which app.rollups rebuilds on first use
+    rollups_built_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
 
     def __str__(self):
         return self.email
@@ -32,6 +44,20 @@ class Transaction(models.Model):
     description = models.TextField(null=True, blank=True)
     category = models.CharField(max_length=50, null=True, blank=True)
     date = models.DateField(default=timezone.now)
+    raw_data = models.TextField(null=True, blank=True)
+    # ID of the Gmail message the transaction was parsed from, if any
+    gmail_message_id = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'gmail_message_id'], name='unique_transaction_per_message'),
+        ]
+        indexes = [
+            # Date windows and newest-first pages: dedup, rollups, the analysis list.
+            models.Index(fields=['user', 'date', 'id'], name='transaction_user_date_idx'),
+            # The analysis list narrowed to one category, and uncategorized rows (category IS NULL).
+            models.Index(fields=['user', 'category', 'date', 'id'], name='transaction_user_category_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.full_name}: {self.transaction_type} ₹{self.amount} - {self.source}"
@@ -48,4 +74,96 @@ class FinancialReport(models.Model):
         unique_together = ('user', 'month', 'year')
 
     def __str__(self):
-        return f"Report for {self.user.email} - {self.month}/{self.year}"
\ No newline at end of file
+        return f"Report for {self.user.email} - {self.month}/{self.year}"
+
+
+# Gmail sync state: the mailbox history ID reached by the last successful sync
+class SyncCursor(models.Model):
+    user = models.OneToOneField(BasicInfo, on_delete=models.CASCADE, related_name='sync_cursor')
+    history_id = models.CharField(max_length=32, null=True, blank=True)
+    last_full_sync = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sync cursor for {self.user.email} at history {self.history_id}"
+
+
+# Ledger of Gmail messages that have already been downloaded and parsed
+class ProcessedMessage(models.Model):
+    PROCESSED = 'processed'
+    # Parsing raised; retried by later syncs until SYNC_MAX_PARSE_ATTEMPTS
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(BasicInfo, on_delete=models.CASCADE, related_name='processed_messages')
+    message_id = models.CharField(max_length=64)
+    processed_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PROCESSED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'message_id')
+
+    def __str__(self):
+        return f"{self.user.email}: {self.message_id}"
+
+
+# Background Gmail sync requests, processed by the run_sync_worker command
+class SyncJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(BasicInfo, on_delete=models.CASCADE, related_name='sync_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(null=True, blank=True)
+    worker = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Scheduled syncs are not claimed before this time; null means as soon as possible
+    not_before = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker while the job runs; a running job whose heartbeat
+    # stops is re-queued (see app.jobs.recover_stale_jobs)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            # The global start rate counts recent starts
+            models.Index(fields=['started_at']),
+        ]
+        constraints = [
+            # At most one running sync per user, enforced by the database
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(status='running'),
+                name='one_running_sync_per_user',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Sync job {self.pk} for {self.user.email}: {self.status}"
+
+
+# Category assigned to a normalized transaction description, shared by all
+# users so a merchant is only ever sent to the categorization model once
+class CategoryCache(models.Model):
+    normalized_description = models.CharField(max_length=255, unique=True)
+    category = models.CharField(max_length=50)
+    source = models.CharField(max_length=20, default='gemini')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.normalized_description} -> {self.category}"
@@ -0,0 +1,30 @@
+from django.conf import settings
+
+from .extraction import default_extractor
+from .mime import extract_body
+
+
+def get_email_body(payload):
+    """
+    Returns the email body as text, preferring plain text over HTML.
+    Only the chosen part is decoded, capped at GMAIL_MAX_BODY_BYTES, and
+    HTML is converted to text.
+    """
+    return extract_body(payload, settings.GMAIL_MAX_BODY_BYTES)
+
+
+def extract_transaction_details(email_body, msg_data):
+    """
+    Extract transaction details from email body.
+    Returns a dictionary with transaction details or None if no transaction found.
+    """
+    details = default_extractor.extract(email_body, msg_data['internalDate'])
+    if details is None:
+        return None
+    return {
+        'type': details.type,
+        'amount': details.amount,
+        'date': details.date,
+        'description': details.description,
+        'raw_body': email_body
+    }
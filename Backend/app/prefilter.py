@@ -0,0 +1,86 @@
+"""
+Header-first screening of Gmail messages.
+
+Scores a `format=metadata` message (From, Subject and snippet) so the sync
+only downloads full bodies for mail that is likely to be a transaction.
+"""
+from django.conf import settings
+
+from .extraction import CREDIT, DEBIT, FINANCIAL, default_extractor
+from .parsers import SenderParser, registry
+
+METADATA_HEADERS = ['From', 'Subject']
+THRESHOLD = 2
+DEFAULT_KEYWORDS = (
+    'debited', 'credited', 'transaction', 'payment', 'paid', 'received', 'upi',
+    'receipt', 'invoice', 'refund', 'order', 'statement', 'cashback',
+)
+
+
+def header(message, name):
+    """The value of a Gmail message's header `name` (lowercase), or ''."""
+    return next((h['value'] for h in message.get('payload', {}).get('headers', [])
+                 if h.get('name', '').lower() == name), '')
+
+
+def score_metadata(message):
+    """
+    Returns a likelihood score for a metadata-only message:
+    0 for senders registered as non-financial, otherwise +2 for a sender
+    with a registered parser, +2 for an amount in the subject or snippet,
+    +1 for a debit/credit word and +1 for a financial keyword (a word such
+    as 'paid' is both). So an alert from an unknown sender that names no
+    amount still reaches THRESHOLD on its wording.
+    """
+    parser = registry.parser_for(header(message, 'from'))
+    if not parser.financial:
+        return 0
+
+    score = 2 if isinstance(parser, SenderParser) else 0
+    text = f"{header(message, 'subject')}\n{message.get('snippet', '')}".lower()
+    amount, _ = default_extractor.find_values(text)
+    if amount is not None:
+        score += 2
+    flags = default_extractor.classify(text)
+    if flags & (DEBIT | CREDIT):
+        score += 1
+    if flags & FINANCIAL:
+        score += 1
+    return score
+
+
+def is_likely_transaction(message, threshold=THRESHOLD):
+    return score_metadata(message) >= threshold
+
+
+def build_list_query(after_date, senders=(), keywords=()):
+    """
+    Builds the messages.list query: the date filter, narrowed to mail from
+    any allowlisted sender or with an allowlisted keyword in the subject.
+    """
+    terms = [f"from:{sender}" for sender in senders]
+    terms += [f'subject:"{keyword}"' if ' ' in keyword else f"subject:{keyword}" for keyword in keywords]
+    query = f"after:{after_date}"
+    if terms:
+        query += " {" + " ".join(terms) + "}"
+    return query
+
+
+def default_senders():
+    """Domains of every sender with a registered transaction parser."""
+    return sorted(sender for sender, parser in registry.by_sender.items() if isinstance(parser, SenderParser))
+
+
+def _setting_list(value, default):
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def allowlist_query(after_date):
+    """The list query for GMAIL_SYNC_SENDERS / GMAIL_SYNC_KEYWORDS."""
+    return build_list_query(
+        after_date,
+        _setting_list(settings.GMAIL_SYNC_SENDERS, default_senders()),
+        _setting_list(settings.GMAIL_SYNC_KEYWORDS, DEFAULT_KEYWORDS),
+    )
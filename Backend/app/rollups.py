@@ -0,0 +1,187 @@
+"""
+Monthly rollups of each user's transactions, kept in FinancialReport.
+
+A report's `report_data` holds the month's credited and debited totals, its
+transaction count and its debited total per category. Code that inserts or
+recategorizes transactions in bulk calls refresh_months() with the months it
+touched; single-row saves and deletes are covered by the signal handlers in
+app.signals. A refresh recomputes only the touched months, with one grouped
+query, and upserts their reports, so readers can sum O(months) rows instead
+of scanning every transaction.
+
+Users whose transactions were stored before the reports existed have a null
+BasicInfo.rollups_built_at; summarize() rebuilds all their reports once
+before reading any (the rebuild_financial_reports command does it up front).
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .models import BasicInfo, FinancialReport, Transaction
+
+
+def month_of(date):
+    return (date.year, date.month)
+
+
+def month_range(year, month):
+    """The [start, end) dates of a month."""
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def build_report(rows):
+    """Builds report_data from grouped (transaction_type, category, total, count) rows."""
+    report = {'credited': 0.0, 'debited': 0.0, 'count': 0, 'categories': []}
+    spending = defaultdict(float)
+    for row in rows:
+        report['count'] += row['count']
+        if row['transaction_type'] == 'credited':
+            report['credited'] += row['total']
+        elif row['transaction_type'] == 'debited':
+            report['debited'] += row['total']
+            spending[row['category']] += row['total']
+    report['categories'] = [
+        {'category': category, 'total': total}
+        for category, total in sorted(spending.items(), key=lambda item: -item[1])
+    ]
+    return report
+
+
+def month_rows(user_id, months):
+    """Grouped (year, month, transaction_type, category) rows of a user's (year, month) pairs."""
+    window = Q()
+    for year, month in months:
+        start, end = month_range(year, month)
+        window |= Q(date__gte=start, date__lt=end)
+    return (Transaction.objects.filter(user_id=user_id).filter(window)
+            .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+            .values('year', 'month', 'transaction_type', 'category')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by())
+
+
+def refresh_months(user_id, months):
+    """
+    Recomputes the reports of one user's (year, month) pairs from their
+    transactions. Months left without transactions lose their report.
+    """
+    months = set(months)
+    if not months:
+        return
+    rows = defaultdict(list)
+    for row in month_rows(user_id, months):
+        rows[(row['year'], row['month'])].append(row)
+
+    reports = [
+        FinancialReport(user_id=user_id, year=year, month=month, report_data=build_report(rows[(year, month)]))
+        for year, month in months if rows[(year, month)]
+    ]
+    empty = Q()
+    for year, month in months:
+        if not rows[(year, month)]:
+            empty |= Q(year=year, month=month)
+
+    with db_transaction.atomic():
+        FinancialReport.objects.bulk_create(
+            reports, update_conflicts=True,
+            unique_fields=['user', 'month', 'year'], update_fields=['report_data'],
+        )
+        if empty:
+            FinancialReport.objects.filter(user_id=user_id).filter(empty).delete()
+
+
+def refresh_for(transactions):
+    """Refreshes the months of the given transactions, grouped by user."""
+    months = defaultdict(set)
+    for t in transactions:
+        months[t.user_id].add(month_of(t.date))
+    for user_id, user_months in months.items():
+        refresh_months(user_id, user_months)
+
+
+def rebuild(user_id):
+    """Recomputes every report of one user from scratch and marks them complete."""
+    months = {
+        (row['year'], row['month'])
+        for row in (Transaction.objects.filter(user_id=user_id)
+                    .annotate(year=ExtractYear('date'), month=ExtractMonth('date'))
+                    .values('year', 'month').distinct())
+    }
+    with db_transaction.atomic():
+        FinancialReport.objects.filter(user_id=user_id).delete()
+        refresh_months(user_id, months)
+        BasicInfo.objects.filter(pk=user_id).update(rollups_built_at=timezone.now())
+    return len(months)
+
+
+def _window_rows(user_id, windows):
+    """Grouped (transaction_type, category) rows of the transactions in the [start, end) windows."""
+    q = Q()
+    for start, end in windows:
+        q |= Q(date__gte=start, date__lt=end)
+    return (Transaction.objects.filter(user_id=user_id).filter(q)
+            .values('transaction_type', 'category')
+            .annotate(total=Sum('amount'), count=Count('id'))
+            .order_by())
+
+
+def summarize(user_id, start=None, end=None):
+    """
+    Returns (totals, category_spending) for a user's transactions dated in
+    [start, end), either bound being optional: {'total_credited',
+    'total_debited'} and a list of {'category', 'total'} sorted by total,
+    largest first.
+
+    Whole months are read from the reports; the partial months at the edges
+    of the window are aggregated from their transactions with one grouped
+    query. Reports are rebuilt first if the user's were never built from
+    all their transactions (transactions stored before rollups existed).
+    """
+    if BasicInfo.objects.filter(pk=user_id, rollups_built_at__isnull=True).exists():
+        rebuild(user_id)
+
+    first_full = start if start is None or start.day == 1 else month_range(start.year, start.month)[1]
+    last_full = end if end is None else datetime.date(end.year, end.month, 1)
+    edges = []
+    if first_full and last_full and first_full >= last_full:
+        # No whole month inside the window.
+        reports, edges = [], [(start, end)]
+    else:
+        if start and start < first_full:
+            edges.append((start, first_full))
+        if end and last_full < end:
+            edges.append((last_full, end))
+        reports = _month_reports(user_id, first_full, last_full)
+    if edges:
+        reports.append(build_report(_window_rows(user_id, edges)))
+
+    totals = {'total_credited': 0.0, 'total_debited': 0.0}
+    spending = defaultdict(float)
+    for report in reports:
+        totals['total_credited'] += report['credited']
+        totals['total_debited'] += report['debited']
+        for item in report['categories']:
+            spending[item['category']] += item['total']
+    category_spending = [
+        {'category': category, 'total': total}
+        for category, total in sorted(spending.items(), key=lambda item: -item[1])
+    ]
+    return totals, category_spending
+
+
+def _month_reports(user_id, first, last):
+    """The report_data of the user's months starting in [first, last); None means unbounded."""
+    reports = FinancialReport.objects.filter(user_id=user_id)
+    if first or last:
+        reports = reports.annotate(index=F('year') * 12 + F('month'))
+        if first:
+            reports = reports.filter(index__gte=first.year * 12 + first.month)
+        if last:
+            reports = reports.filter(index__lt=last.year * 12 + last.month)
+    return list(reports.values_list('report_data', flat=True))
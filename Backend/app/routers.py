@@ -0,0 +1,91 @@
+"""
+Routing of read-only analytics queries to an optional read replica.
+
+Reads made inside a `replica_reads()` block go to the 'replica' database
+alias when one is configured (DB_REPLICA_HOST); every other query, and
+every write, uses 'default'. The analysis view runs its aggregates and
+transaction pages in such a block, so dashboards don't compete with sync
+writes on the primary.
+
+Replicas lag, so reads stay on the primary when they must see recent
+writes:
+- for a user whose sync is running or finished less than DB_REPLICA_LAG
+  seconds ago;
+- for the rest of a block once anything in it has written, such as the
+  view categorizing new transactions before charting them.
+"""
+import contextvars
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+REPLICA = 'replica'
+
+_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def recently_synced(user):
+    """Whether the user's data may not have reached the replica yet."""
+    from .models import SyncJob
+
+    since = timezone.now() - datetime.timedelta(seconds=settings.DB_REPLICA_LAG)
+    if user.last_email_sync and user.last_email_sync >= since:
+        return True
+    return SyncJob.objects.using('default').filter(user=user).filter(
+        Q(status=SyncJob.RUNNING) | Q(finished_at__gte=since)
+    ).exists()
+
+
+class replica_reads:
+    """
+    Sends the block's reads to the replica, unless there is none or `user`
+    has synced too recently for it to have caught up. One instance can be
+    entered again for later blocks of the same request; the replica is
+    chosen or ruled out on first entry.
+        reads = replica_reads(user)
+        with reads:
+            ...
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.alias = None
+        self.tokens = []
+
+    def __enter__(self):
+        if self.alias is None:
+            use_replica = replica_configured() and not (self.user is not None and recently_synced(self.user))
+            self.alias = REPLICA if use_replica else 'default'
+        self.tokens.append(_reads.set({'alias': self.alias if self.alias == REPLICA else None}))
+        return self.alias
+
+    def __exit__(self, exc_type, exc, tb):
+        _reads.reset(self.tokens.pop())
+        return False
+
+
+class ReplicaRouter:
+    """Routes reads inside replica_reads() blocks to the replica, and everything else to 'default'."""
+
+    def db_for_read(self, model, **hints):
+        state = _reads.get()
+        if state is None:
+            return None
+        return state['alias'] or 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _reads.get()
+        if state:
+            # Read your writes: the rest of the block reads from the primary.
+            state['alias'] = None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import BasicInfo, Transaction
+from .conditional import bump_data_version
+from .firebase_auth import profile_cache
+from .rollups import month_of, refresh_months
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_month(sender, instance, raw=False, **kwargs):
+    """Notes the stored month of an updated transaction, in case its date moves."""
+    instance._previous_month = None
+    if instance.pk and not raw:
+        date = Transaction.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+        if date:
+            instance._previous_month = month_of(date)
+
+
+@receiver(post_save, sender=Transaction)
+def refresh_report_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    months = {month_of(instance.date)}
+    if getattr(instance, '_previous_month', None):
+        months.add(instance._previous_month)
+    refresh_months(instance.user_id, months)
+
+
+@receiver(post_delete, sender=Transaction)
+def refresh_report_on_delete(sender, instance, **kwargs):
+    refresh_months(instance.user_id, {month_of(instance.date)})
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def bump_data_version_on_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version([instance.user_id])
+
+
+@receiver(post_save, sender=BasicInfo)
+@receiver(post_delete, sender=BasicInfo)
+def forget_cached_profile(sender, instance, **kwargs):
+    profile_cache.forget(instance.firebase_uid)
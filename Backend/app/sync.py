@@ -0,0 +1,410 @@
+import json
+import datetime
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .conditional import bump_data_version
+from .gmail_fetch import fetch_messages
+from .instrumentation import count, span
+from .models import ProcessedMessage, SyncCursor, Transaction
+from .parsers import parser_for
+from .parsing import get_email_body
+from .prefilter import METADATA_HEADERS, allowlist_query, header, is_likely_transaction
+from .rollups import refresh_for
+
+DEFAULT_START_DATE = "2024/01/01"
+LEDGER_CHUNK_SIZE = 500
+SKIPPED_LABELS = {'SPAM', 'TRASH'}
+PROGRESS_EVERY = 25
+DUPLICATE_WINDOW = datetime.timedelta(days=1)
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryExpired(Exception):
+    """The stored history ID is too old for users.history.list (HTTP 404)."""
+
+
+def parse_message(user, msg_data):
+    """
+    Parses a downloaded Gmail message into an unsaved Transaction,
+    or returns None if it doesn't describe a transaction.
+    """
+    sender = header(msg_data, 'from')
+    parser = parser_for(sender)
+    if not parser.financial:
+        return None
+
+    with span('body_decode'):
+        email_body = get_email_body(msg_data['payload']) or msg_data.get('snippet', '')
+    if not email_body:
+        return None
+
+    subject = header(msg_data, 'subject')
+    with span('extraction'):
+        details = parser.extract(email_body, msg_data['internalDate'], subject=subject)
+    if not details:
+        return None
+
+    return Transaction(
+        user=user,
+        gmail_message_id=msg_data['id'],
+        transaction_type=details.type,
+        amount=details.amount,
+        description=details.description,
+        date=details.date.astimezone(datetime.timezone.utc).date(),
+        raw_data=json.dumps({
+            'subject': subject,
+            'from': sender,
+            'snippet': msg_data.get('snippet', '')
+        })
+    )
+
+
+class TransactionBatch:
+    """
+    Collects parsed transactions for one user and writes them in one go.
+
+    Duplicates are found with a single query over the batch's date span: a
+    candidate is dropped if a transaction with the same amount already exists
+    within DUPLICATE_WINDOW of its date (in the database or earlier in the
+    batch), or if its Gmail message was already stored. Survivors are written
+    with one bulk_create and the FinancialReports of their months refreshed;
+    the (user, gmail_message_id) unique constraint and ignore_conflicts keep
+    concurrent syncs from inserting a message twice.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.candidates = []
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def add(self, msg_data):
+        """Parses the message and queues it; returns True if it is a transaction."""
+        candidate = parse_message(self.user, msg_data)
+        if candidate is None:
+            return False
+        self.candidates.append(candidate)
+        return True
+
+    def _existing(self):
+        """The stored transactions a candidate could duplicate."""
+        dates = [c.date for c in self.candidates]
+        message_ids = [c.gmail_message_id for c in self.candidates]
+        return Transaction.objects.filter(user=self.user).filter(
+            Q(date__range=(min(dates) - DUPLICATE_WINDOW, max(dates) + DUPLICATE_WINDOW))
+            | Q(gmail_message_id__in=message_ids)
+        ).values_list('amount', 'date', 'gmail_message_id')
+
+    def deduplicate(self, existing=None):
+        if not self.candidates:
+            return []
+        if existing is None:
+            existing = self._existing()
+
+        dates_by_amount = defaultdict(list)
+        stored_ids = set()
+        for amount, date, gmail_message_id in existing:
+            dates_by_amount[amount].append(date)
+            stored_ids.add(gmail_message_id)
+
+        survivors = []
+        for candidate in self.candidates:
+            if candidate.gmail_message_id in stored_ids:
+                continue
+            if any(abs(candidate.date - d) <= DUPLICATE_WINDOW for d in dates_by_amount[candidate.amount]):
+                continue
+            dates_by_amount[candidate.amount].append(candidate.date)
+            stored_ids.add(candidate.gmail_message_id)
+            survivors.append(candidate)
+        return survivors
+
+    def save(self):
+        """Writes the non-duplicate candidates; returns how many were saved."""
+        with span('dedup'):
+            survivors = self.deduplicate()
+        with span('db_write'), db_transaction.atomic():
+            Transaction.objects.bulk_create(survivors, ignore_conflicts=True)
+            refresh_for(survivors)
+            bump_data_version([self.user.pk] if survivors else [])
+        self.candidates = []
+        return len(survivors)
+
+    async def asave(self):
+        """save() with the async ORM."""
+        if not self.candidates:
+            return 0
+        with span('dedup'):
+            survivors = self.deduplicate([row async for row in self._existing()])
+        with span('db_write'):
+            await Transaction.objects.abulk_create(survivors, ignore_conflicts=True)
+            await sync_to_async(refresh_for)(survivors)
+            await sync_to_async(bump_data_version)([self.user.pk] if survivors else [])
+        self.candidates = []
+        return len(survivors)
+
+
+class GmailSyncEngine:
+    """
+    Incremental Gmail ingestion for one user.
+
+    The first run (or any run after the stored history ID has expired) lists
+    every matching message, following nextPageToken to the end, and records
+    the mailbox historyId taken just before listing. Later runs ask
+    users.history.list for messages added since that point only.
+
+    With GMAIL_METADATA_PREFILTER, pending messages are first fetched as
+    metadata (From, Subject, snippet) and only those the prefilter scores as
+    likely transactions are downloaded in full; the rest are recorded as
+    processed straight away.
+
+    Every message that was downloaded and parsed is written to the
+    ProcessedMessage ledger, so messages seen by an earlier run are never
+    downloaded again. The cursor only advances when every message of a run
+    was handled; otherwise the next run re-lists from the old cursor and the
+    ledger filters out what already succeeded. A message whose parsing
+    raises is recorded as failed and retried by the next
+    SYNC_MAX_PARSE_ATTEMPTS - 1 runs; after that it is given up on, so it
+    can't hold the cursor back for good.
+    """
+
+    def __init__(self, service, user, page_size=500, fetch=fetch_messages, on_progress=None, prefilter=None):
+        self.service = service
+        self.user = user
+        self.page_size = page_size
+        self.fetch = fetch
+        self.on_progress = on_progress
+        self.prefilter = settings.GMAIL_METADATA_PREFILTER if prefilter is None else prefilter
+        self.stats = {'mode': None, 'listed': 0, 'skipped': 0, 'screened': 0, 'filtered': 0,
+                      'fetched': 0, 'parsed': 0, 'saved': 0, 'errors': 0}
+
+    # --- Listing ---
+
+    def _full_scan_query(self):
+        after_date = self.user.last_email_sync.strftime("%Y/%m/%d") if self.user.last_email_sync else DEFAULT_START_DATE
+        return allowlist_query(after_date)
+
+    def list_all_message_ids(self, query):
+        """Walks messages.list to the last page and returns every message ID."""
+        ids, page_token = [], None
+        while True:
+            kwargs = {'userId': 'me', 'q': query, 'maxResults': self.page_size, 'includeSpamTrash': False}
+            if page_token:
+                kwargs['pageToken'] = page_token
+            with span('gmail_list'):
+                results = self.service.users().messages().list(**kwargs).execute()
+            ids.extend(msg['id'] for msg in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return ids
+
+    def list_history_message_ids(self, start_history_id):
+        """
+        Returns (message IDs added since `start_history_id`, latest history ID).
+        Raises HistoryExpired if Gmail no longer has that history.
+        """
+        from googleapiclient.errors import HttpError
+
+        ids, page_token, latest = [], None, start_history_id
+        while True:
+            kwargs = {
+                'userId': 'me',
+                'startHistoryId': start_history_id,
+                'historyTypes': ['messageAdded'],
+                'maxResults': self.page_size,
+            }
+            if page_token:
+                kwargs['pageToken'] = page_token
+            try:
+                with span('gmail_list'):
+                    results = self.service.users().history().list(**kwargs).execute()
+            except HttpError as e:
+                if getattr(e.resp, 'status', None) == 404:
+                    raise HistoryExpired(start_history_id) from e
+                raise
+            ids.extend(self._added_ids(results))
+            latest = results.get('historyId', latest)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return list(dict.fromkeys(ids)), latest
+
+    @staticmethod
+    def _added_ids(results):
+        """Message IDs added in a history.list page, minus spam and trash."""
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message = added['message']
+                if not SKIPPED_LABELS.intersection(message.get('labelIds', [])):
+                    yield message['id']
+
+    # --- Ledger ---
+
+    @staticmethod
+    def _done():
+        """Ledger rows of messages no run needs to download again."""
+        return Q(status=ProcessedMessage.PROCESSED) | Q(attempts__gte=settings.SYNC_MAX_PARSE_ATTEMPTS)
+
+    def unprocessed(self, message_ids):
+        """Drops IDs that the user's ProcessedMessage ledger has processed or given up on."""
+        seen = set()
+        for start in range(0, len(message_ids), LEDGER_CHUNK_SIZE):
+            chunk = message_ids[start:start + LEDGER_CHUNK_SIZE]
+            seen.update(ProcessedMessage.objects.filter(
+                self._done(), user=self.user, message_id__in=chunk
+            ).values_list('message_id', flat=True))
+        return [msg_id for msg_id in message_ids if msg_id not in seen]
+
+    def _ledger_rows(self, message_ids, status=ProcessedMessage.PROCESSED):
+        return [ProcessedMessage(user=self.user, message_id=msg_id, status=status) for msg_id in message_ids]
+
+    def mark_processed(self, message_ids):
+        # Messages that failed on an earlier run are marked processed too.
+        ProcessedMessage.objects.bulk_create(
+            self._ledger_rows(message_ids), update_conflicts=True,
+            unique_fields=['user', 'message_id'], update_fields=['status'],
+        )
+
+    def record_failures(self, message_ids):
+        """
+        Counts a failed parse of each message in the ledger. Returns how many
+        of them have now used up their SYNC_MAX_PARSE_ATTEMPTS.
+        """
+        if not message_ids:
+            return 0
+        ProcessedMessage.objects.bulk_create(self._ledger_rows(message_ids, ProcessedMessage.FAILED),
+                                             ignore_conflicts=True)
+        failed = ProcessedMessage.objects.filter(user=self.user, message_id__in=message_ids,
+                                                 status=ProcessedMessage.FAILED)
+        failed.update(attempts=F('attempts') + 1)
+        return failed.filter(attempts__gte=settings.SYNC_MAX_PARSE_ATTEMPTS).count()
+
+    # --- Run ---
+
+    def _report(self, stage):
+        if self.on_progress:
+            self.on_progress(dict(self.stats, stage=stage))
+
+    @staticmethod
+    def _gone(fetch_errors):
+        """
+        IDs that answered 404. Messages deleted since they were listed will
+        never be fetchable; they are recorded so they don't hold the cursor
+        back forever.
+        """
+        return [msg_id for msg_id, error in fetch_errors.items()
+                if getattr(getattr(error, 'resp', None), 'status', None) == 404]
+
+    def _select(self, metadata, errors):
+        """Splits screened messages into (likely, processed) IDs."""
+        self.stats['screened'] = len(metadata)
+        processed = self._gone(errors)
+        self.stats['errors'] += len(errors) - len(processed)
+        likely = []
+        for message in metadata:
+            (likely if is_likely_transaction(message) else processed).append(message['id'])
+        self.stats['filtered'] = len(metadata) - len(likely)
+        return likely, processed
+
+    def _fetched(self, messages, fetch_errors, processed):
+        self.stats['fetched'] = len(messages)
+        gone = self._gone(fetch_errors)
+        processed.extend(gone)
+        self.stats['errors'] += len(fetch_errors) - len(gone)
+        self._report('parsing')
+
+    def _parse(self, messages, processed):
+        """Parses downloaded messages into (a TransactionBatch, the IDs that failed to parse)."""
+        batch, failed = TransactionBatch(self.user), []
+        for i, msg_data in enumerate(messages, 1):
+            try:
+                batch.add(msg_data)
+                processed.append(msg_data['id'])
+            except Exception as e:
+                logger.warning("Error processing message",
+                               extra={'message_id': msg_data.get('id', 'unknown'), 'error': str(e)})
+                self.stats['errors'] += 1
+                failed.append(msg_data['id'])
+            self.stats['parsed'] = i
+            if i % PROGRESS_EVERY == 0:
+                self._report('parsing')
+        self._report('saving')
+        return batch, failed
+
+    def _record(self):
+        """Adds the run's stats to the message counters and logs them."""
+        for stat in ('listed', 'skipped', 'screened', 'filtered', 'fetched', 'parsed', 'saved', 'errors'):
+            count(f'sync_messages_{stat}', self.stats[stat])
+        logger.info("Gmail sync finished", extra={'user_id': self.user.pk, 'stats': dict(self.stats)})
+
+    def _advance(self, cursor, new_history_id):
+        """Moves the cursor and user sync time forward; the caller saves them."""
+        now = timezone.now()
+        cursor.history_id = new_history_id
+        if self.stats['mode'] == 'full':
+            cursor.last_full_sync = now
+        self.user.last_email_sync = now
+
+    def screen(self, message_ids):
+        """
+        Fetches metadata for the IDs and returns (likely, processed): the IDs
+        worth downloading in full, and the IDs that are rejected or gone.
+        """
+        self._report('screening')
+        with span('gmail_get_metadata'):
+            metadata, errors = self.fetch(self.service, message_ids, format='metadata',
+                                          metadata_headers=METADATA_HEADERS)
+        return self._select(metadata, errors)
+
+    def run(self):
+        """Performs one sync and returns the stats dict."""
+        cursor, _ = SyncCursor.objects.get_or_create(user=self.user)
+
+        message_ids, new_history_id = None, None
+        if cursor.history_id:
+            try:
+                message_ids, new_history_id = self.list_history_message_ids(cursor.history_id)
+                self.stats['mode'] = 'incremental'
+            except HistoryExpired:
+                message_ids = None
+
+        if message_ids is None:
+            # Read the history ID before listing so nothing that arrives
+            # during the scan falls between the scan and the next run.
+            profile = self.service.users().getProfile(userId='me').execute()
+            new_history_id = profile.get('historyId')
+            message_ids = self.list_all_message_ids(self._full_scan_query())
+            self.stats['mode'] = 'full'
+
+        self.stats['listed'] = len(message_ids)
+        pending = self.unprocessed(list(dict.fromkeys(message_ids)))
+        self.stats['skipped'] = self.stats['listed'] - len(pending)
+
+        processed = []
+        if self.prefilter and pending:
+            pending, processed = self.screen(pending)
+        self._report('fetching')
+
+        with span('gmail_get'):
+            messages, fetch_errors = self.fetch(self.service, pending, format='full')
+        self._fetched(messages, fetch_errors, processed)
+        batch, failed = self._parse(messages, processed)
+
+        with db_transaction.atomic():
+            self.stats['saved'] = batch.save()
+            self.mark_processed(processed)
+            given_up = self.record_failures(failed)
+
+        if self.stats['errors'] == given_up:
+            self._advance(cursor, new_history_id)
+            cursor.save()
+            self.user.save(update_fields=['last_email_sync'])
+        self._record()
+        return self.stats
@@ -1,3 +1,1881 @@
-from django.test import TestCase
+import base64
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import datetime
+
+import numpy as np
+
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import caches
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from googleapiclient.discovery_cache import get_static_doc
+
+from benchmarking.corpora import (
+    labeled_descriptions, legacy_extract_transaction_details, legacy_get_email_body, promotional_payload,
+    synthetic_bank_emails, synthetic_categorized_descriptions, synthetic_inbox,
+)
+from benchmarking.fake_gemini import FakeGenerativeModel
+from benchmarking.fake_gmail import FakeGmailServer, make_message
+
+from .analysis import filter_window
+from .async_sync import AsyncGmailClient, AsyncGmailSyncEngine, _loop_resources, close_connections, sync_user
+from .categorization import CATEGORIES, Categorizer, get_local_model, normalize_description, train_local_model
+from .local_categorizer import LocalCategorizer
+from .lru import LRUCache
+from .benchmarks import analysis_pipeline, boot_time, percentile, sync_pipeline
+from .extraction import TransactionExtractor
+from . import firebase_auth
+from .gmail_client import CredentialCache, gmail_service_for
+from .gmail_fetch import GmailBatchFetcher
+from . import insights
+from .insights import PLACEHOLDER, UNAVAILABLE, get_insights
+from .instrumentation import JsonFormatter, span
+from . import responses
+from .mime import decode_part_data, extract_body, html_to_text
+from .jobs import (
+    claim_next_job, enqueue_sync, prune_finished_jobs, recover_stale_jobs, schedule_syncs, worker_loop,
+)
+from .parsers import parser_for
+from .prefilter import build_list_query, is_likely_transaction, score_metadata
+from .rollups import month_rows, refresh_months, summarize
+from .routers import replica_reads
+from .models import BasicInfo, CategoryCache, FinancialReport, ProcessedMessage, SyncCursor, SyncJob, Transaction
+from .sync import GmailSyncEngine, TransactionBatch, parse_message
+from .trends import forecast, load_columns, rolling_mean, summarize_trends
+
+# No test may reach the real Gemini SDK, and AI insights are generated in the
+# request unless a test asks for the background threads.
+fake_gemini = mock.patch('app.gemini.generative_model', FakeGenerativeModel)
+insights_in_request = override_settings(AI_INSIGHTS_WORKERS=0)
+# Only ReplicaRoutingTests copy rows to the replica (Backend.test_settings
+# gives it its own database); everywhere else reads stay on the primary.
+primary_reads = mock.patch('app.routers.replica_configured', return_value=False)
+
+
+def setUpModule():
+    fake_gemini.start()
+    insights_in_request.enable()
+    primary_reads.start()
+
+
+def tearDownModule():
+    primary_reads.stop()
+    insights_in_request.disable()
+    fake_gemini.stop()
+    insights.shutdown()
+
+
+def no_sleep(seconds):
+    pass
+
+
+class GmailBatchFetcherTests(SimpleTestCase):
+    def setUp(self):
+        self.messages = [make_message(f'msg{i}', f'Rs. {i}.00 debited from your account') for i in range(100)]
+        self.server = FakeGmailServer(self.messages).start()
+        self.addCleanup(self.server.stop)
+        self.service = self.server.build_service()
+        self.ids = [m['id'] for m in self.messages]
+
+    def test_batches_replace_per_message_round_trips(self):
+        fetched, errors = GmailBatchFetcher(self.service, batch_size=50).fetch(self.ids)
+
+        self.assertEqual(errors, {})
+        self.assertEqual([m['id'] for m in fetched], self.ids)
+        self.assertEqual(self.server.round_trips, 2)
+
+    def test_sequential_gets_cost_one_round_trip_each(self):
+        for msg_id in self.ids:
+            self.service.users().messages().get(userId='me', id=msg_id, format='full').execute()
+        self.assertEqual(self.server.round_trips, 100)
+
+    def test_per_message_error_does_not_fail_batch(self):
+        self.server.missing.add('msg7')
+
+        fetched, errors = GmailBatchFetcher(self.service, batch_size=50).fetch(self.ids)
+
+        self.assertEqual(len(fetched), 99)
+        self.assertEqual(list(errors), ['msg7'])
+        self.assertEqual(errors['msg7'].resp.status, 404)
+
+    def test_rate_limited_messages_are_retried(self):
+        self.server.fail_once.update({'msg3': 429, 'msg60': 503})
+        delays = []
+
+        fetched, errors = GmailBatchFetcher(self.service, batch_size=50, sleep=delays.append).fetch(self.ids)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(fetched), 100)
+        # Two batches, then one retry batch for each batch with a failure.
+        self.assertEqual(self.server.round_trips, 4)
+        self.assertEqual(len(delays), 2)
+
+    def test_failed_batch_request_is_retried(self):
+        self.server.fail_batches = 1
+
+        fetched, errors = GmailBatchFetcher(self.service, batch_size=100, sleep=no_sleep).fetch(self.ids)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(fetched), 100)
+        self.assertEqual(self.server.round_trips, 2)
+
+    def test_retries_are_bounded(self):
+        self.server.fail_batches = 10
+
+        fetched, errors = GmailBatchFetcher(self.service, max_retries=2, sleep=no_sleep).fetch(self.ids[:5])
+
+        self.assertEqual(fetched, [])
+        self.assertEqual(set(errors), set(self.ids[:5]))
+        self.assertEqual(self.server.round_trips, 3)
+
+    def test_concurrent_batches_reduce_wall_time(self):
+        self.server.latency = 0.1
+
+        start = time.perf_counter()
+        sequential, _ = GmailBatchFetcher(self.service, batch_size=10).fetch(self.ids)
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent, _ = GmailBatchFetcher(self.service, batch_size=10, max_workers=5).fetch(self.ids)
+        concurrent_time = time.perf_counter() - start
+
+        self.assertEqual([m['id'] for m in concurrent], [m['id'] for m in sequential])
+        self.assertEqual(self.server.round_trips, 20)
+        self.assertLess(concurrent_time, sequential_time / 2)
+
+
+def transaction_email(i):
+    return make_message(
+        f'txn{i}',
+        f'Rs. {100 + i}.00 debited from your account via UPI on 0{1 + i % 9}/03/2025',
+        subject='Transaction alert',
+        sender='alerts@hdfcbank.net',
+    )
+
+
+def create_user(uid='uid-1', **fields):
+    defaults = {
+        'full_name': 'Test User', 'email': f'{uid}@example.com', 'occupation': 'Engineer',
+        'salary': 50000, 'marital_status': 'single', 'gender': 'other',
+    }
+    defaults.update(fields)
+    return BasicInfo.objects.create(firebase_uid=uid, **defaults)
+
+
+class GmailSyncEngineTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.server = FakeGmailServer([transaction_email(i) for i in range(250)]).start()
+        self.addCleanup(self.server.stop)
+        self.service = self.server.build_service()
+
+    def sync(self):
+        self.server.reset_counters()
+        return GmailSyncEngine(self.service, self.user, page_size=100).run()
+
+    def test_full_scan_follows_every_page(self):
+        stats = self.sync()
+
+        self.assertEqual(stats['mode'], 'full')
+        self.assertEqual(stats['listed'], 250)
+        self.assertEqual(stats['fetched'], 250)
+        self.assertEqual(stats['saved'], Transaction.objects.filter(user=self.user).count())
+        self.assertEqual(ProcessedMessage.objects.filter(user=self.user).count(), 250)
+        self.assertEqual(SyncCursor.objects.get(user=self.user).history_id, str(self.server.history_id))
+
+    def test_incremental_sync_fetches_only_new_messages(self):
+        self.sync()
+        for i in range(250, 253):
+            self.server.add(transaction_email(i))
+
+        stats = self.sync()
+
+        self.assertEqual(stats['mode'], 'incremental')
+        self.assertEqual(stats['fetched'], 3)
+        self.assertEqual(sorted(self.server.full_requested), ['txn250', 'txn251', 'txn252'])
+
+    def test_rerun_without_new_mail_costs_one_request(self):
+        self.sync()
+
+        stats = self.sync()
+
+        self.assertEqual(stats['fetched'], 0)
+        self.assertEqual(self.server.round_trips, 1)
+
+    def test_expired_history_falls_back_to_full_scan(self):
+        self.sync()
+        self.server.expire_history()
+
+        stats = self.sync()
+
+        self.assertEqual(stats['mode'], 'full')
+        self.assertEqual(stats['listed'], 250)
+        self.assertEqual(stats['skipped'], 250)
+        self.assertEqual(self.server.requested, [])
+
+    def test_cursor_is_held_back_when_a_message_fails(self):
+        self.server.fail_once['txn5'] = 400
+
+        stats = self.sync()
+
+        self.assertEqual(stats['errors'], 1)
+        self.assertIsNone(SyncCursor.objects.get(user=self.user).history_id)
+
+        stats = self.sync()
+
+        self.assertEqual(stats['fetched'], 1)
+        self.assertEqual(self.server.full_requested, ['txn5'])
+
+    @override_settings(SYNC_MAX_PARSE_ATTEMPTS=2)
+    def test_message_that_never_parses_stops_holding_the_cursor_back(self):
+        def poisoned(user, msg_data):
+            if msg_data['id'] == 'txn5':
+                raise ValueError('unparseable')
+            return parse_message(user, msg_data)
+
+        with mock.patch('app.sync.parse_message', poisoned):
+            self.assertEqual(self.sync()['errors'], 1)
+            self.assertIsNone(SyncCursor.objects.get(user=self.user).history_id)
+
+            # Retried once more, then given up on.
+            stats = self.sync()
+        self.assertEqual((stats['fetched'], stats['errors']), (1, 1))
+        self.assertEqual(SyncCursor.objects.get(user=self.user).history_id, str(self.server.history_id))
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_email_sync)
+        ledger = ProcessedMessage.objects.get(user=self.user, message_id='txn5')
+        self.assertEqual((ledger.status, ledger.attempts), (ProcessedMessage.FAILED, 2))
+
+        self.server.expire_history()
+        self.assertEqual(self.sync()['fetched'], 0)
+
+    def test_message_that_parses_on_retry_is_marked_processed(self):
+        with mock.patch('app.sync.parse_message', side_effect=ValueError('transient')):
+            self.sync()
+
+        self.sync()
+
+        self.assertFalse(ProcessedMessage.objects.filter(user=self.user).exclude(
+            status=ProcessedMessage.PROCESSED).exists())
+        self.assertEqual(SyncCursor.objects.get(user=self.user).history_id, str(self.server.history_id))
+
+
+def alert_on(msg_id, amount, day):
+    sent = datetime.datetime(2025, 3, day, 9, tzinfo=datetime.timezone.utc)
+    return make_message(msg_id, f'Rs. {amount} debited from your account', sender='alerts@hdfcbank.net',
+                        internal_date=int(sent.timestamp() * 1000))
+
+
+class TransactionBatchTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def save(self, *messages):
+        batch = TransactionBatch(self.user)
+        for message in messages:
+            batch.add(message)
+        return batch.save()
+
+    def test_batch_is_written_with_constant_queries(self):
+        messages = [alert_on(f'm{i}', 100 + i, 1 + i % 28) for i in range(200)]
+        batch = TransactionBatch(self.user)
+        for message in messages:
+            batch.add(message)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(batch.save(), 200)
+
+        # One duplicate lookup, the bulk insert (SQLite splits it into a few
+        # statements), then one grouped query to refresh the month's report.
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 2)
+        self.assertLess(len(queries), 12)
+
+    def test_same_amount_within_a_day_is_a_duplicate(self):
+        self.save(alert_on('a', 500, 10))
+
+        saved = self.save(alert_on('b', 500, 11), alert_on('c', 500, 13), alert_on('d', 750, 10))
+
+        self.assertEqual(saved, 2)
+        self.assertEqual(
+            sorted(Transaction.objects.values_list('gmail_message_id', flat=True)), ['a', 'c', 'd'])
+
+    def test_duplicates_within_the_batch_are_dropped(self):
+        self.assertEqual(self.save(alert_on('a', 500, 10), alert_on('b', 500, 10)), 1)
+
+    def test_message_is_never_stored_twice(self):
+        self.save(alert_on('a', 500, 10))
+        Transaction.objects.update(amount=1)
+
+        self.assertEqual(self.save(alert_on('a', 500, 10)), 0)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_unique_constraint_guards_concurrent_inserts(self):
+        Transaction.objects.create(user=self.user, transaction_type='debited', amount=1,
+                                   date=datetime.date(2025, 3, 10), gmail_message_id='a')
+        duplicate = Transaction(user=self.user, transaction_type='debited', amount=2,
+                                date=datetime.date(2025, 3, 10), gmail_message_id='a')
+
+        Transaction.objects.bulk_create([duplicate], ignore_conflicts=True)
+
+        self.assertEqual(Transaction.objects.count(), 1)
+
+
+class SyncJobTests(TestCase):
+    def setUp(self):
+        self.user = create_user(google_access_token='token', google_refresh_token='refresh',
+                                google_token_expiry=timezone.now() + datetime.timedelta(hours=1))
+
+    def post_sync(self, uid='uid-1'):
+        return self.client.post(reverse('manual-email-sync'), json.dumps({'uid': uid}),
+                                content_type='application/json')
+
+    def test_manual_sync_enqueues_and_returns_job_id(self):
+        response = self.post_sync()
+
+        self.assertEqual(response.status_code, 202)
+        job = SyncJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(job.status, SyncJob.QUEUED)
+
+    def test_repeated_requests_reuse_the_active_job(self):
+        first = self.post_sync().json()['job_id']
+        second = self.post_sync().json()['job_id']
+
+        self.assertEqual(first, second)
+        self.assertEqual(SyncJob.objects.count(), 1)
+
+    def test_manual_sync_requires_connected_google_account(self):
+        create_user('uid-2')
+        self.assertEqual(self.post_sync('uid-2').status_code, 400)
+
+    def test_only_one_running_job_per_user(self):
+        SyncJob.objects.create(user=self.user, status=SyncJob.RUNNING)
+        queued = SyncJob.objects.create(user=self.user)
+        other = enqueue_sync(create_user('uid-2'))
+
+        self.assertEqual(claim_next_job('worker'), other)
+        self.assertIsNone(claim_next_job('worker'))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SyncJob.objects.filter(pk=queued.pk).update(status=SyncJob.RUNNING)
+
+    def test_worker_runs_job_and_reports_progress(self):
+        server = FakeGmailServer([transaction_email(i) for i in range(30)]).start()
+        self.addCleanup(server.stop)
+        job = enqueue_sync(self.user)
+
+        with mock.patch('app.jobs.gmail_service', return_value=server.build_service()), \
+                mock.patch('app.jobs.connection.close'):
+            worker_loop('test-worker', threading.Event(), once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.SUCCEEDED)
+        self.assertEqual(job.worker, 'test-worker')
+        self.assertEqual(job.progress['fetched'], 30)
+
+        response = self.client.get(reverse('sync-status', args=[job.pk]), {'uid': 'uid-1'})
+        self.assertEqual(response.json()['job_status'], SyncJob.SUCCEEDED)
+        self.assertEqual(response.json()['progress']['stage'], 'done')
+
+    def test_failed_job_records_error(self):
+        job = enqueue_sync(self.user)
+
+        with mock.patch('app.jobs.gmail_service', side_effect=RuntimeError('token revoked')), \
+                mock.patch('app.jobs.connection.close'):
+            worker_loop('test-worker', threading.Event(), once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, SyncJob.FAILED)
+        self.assertEqual(job.error, 'token revoked')
+
+    def test_scheduler_spreads_stale_users_over_the_interval(self):
+        now = timezone.now()
+        BasicInfo.objects.filter(pk=self.user.pk).update(last_email_sync=now - datetime.timedelta(hours=2))
+        never = create_user('uid-2', google_refresh_token='refresh')
+        create_user('uid-3', google_refresh_token='refresh', last_email_sync=now)
+        create_user('uid-4')
+        busy = create_user('uid-5', google_refresh_token='refresh')
+        SyncJob.objects.create(user=busy, status=SyncJob.RUNNING)
+
+        jobs = schedule_syncs(datetime.timedelta(hours=1), max_per_minute=0, now=now)
+
+        # Stalest first, each in its own half of the hour; fresh, unconnected and busy users are left alone.
+        self.assertEqual([job.user_id for job in jobs], [never.pk, self.user.pk])
+        self.assertTrue(now <= jobs[0].not_before < now + datetime.timedelta(minutes=30))
+        self.assertTrue(now + datetime.timedelta(minutes=30) <= jobs[1].not_before < now + datetime.timedelta(hours=1))
+        self.assertEqual(schedule_syncs(datetime.timedelta(hours=1), now=now), [])
+
+    def test_scheduler_stretches_the_window_to_the_start_rate(self):
+        now = timezone.now()
+        for i in range(2, 12):
+            create_user(f'uid-{i}', google_refresh_token='refresh')
+
+        jobs = schedule_syncs(datetime.timedelta(minutes=1), max_per_minute=2, now=now)
+
+        self.assertEqual(len(jobs), 11)
+        self.assertTrue(max(job.not_before for job in jobs) > now + datetime.timedelta(minutes=5))
+
+    def test_scheduled_job_waits_until_due_unless_requested(self):
+        job = SyncJob.objects.create(user=self.user, not_before=timezone.now() + datetime.timedelta(minutes=10))
+        self.assertIsNone(claim_next_job('worker'))
+
+        self.assertEqual(enqueue_sync(self.user), job)
+        self.assertEqual(claim_next_job('worker'), job)
+
+    @override_settings(SYNC_MAX_STARTS_PER_MINUTE=1)
+    def test_claims_respect_the_global_start_rate(self):
+        first = enqueue_sync(self.user)
+        enqueue_sync(create_user('uid-2'))
+
+        self.assertEqual(claim_next_job('worker'), first)
+        self.assertIsNone(claim_next_job('worker'))
+
+    def test_only_jobs_without_a_recent_heartbeat_are_recovered(self):
+        now = timezone.now()
+        long_ago = now - datetime.timedelta(hours=1)
+        alive = SyncJob.objects.create(user=self.user, status=SyncJob.RUNNING, started_at=long_ago,
+                                       heartbeat_at=now - datetime.timedelta(seconds=10))
+        dead = SyncJob.objects.create(user=create_user('uid-2'), status=SyncJob.RUNNING, started_at=long_ago,
+                                      heartbeat_at=long_ago)
+
+        self.assertEqual(recover_stale_jobs(datetime.timedelta(minutes=3), now=now), 1)
+
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, SyncJob.RUNNING)
+        self.assertEqual((dead.status, dead.worker, dead.heartbeat_at), (SyncJob.QUEUED, None, None))
+
+    def test_worker_loop_recovers_and_prunes_jobs(self):
+        long_ago = timezone.now() - datetime.timedelta(days=60)
+        SyncJob.objects.create(user=self.user, status=SyncJob.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        old = SyncJob.objects.create(user=create_user('uid-2'), status=SyncJob.SUCCEEDED, finished_at=long_ago)
+        recent = SyncJob.objects.create(user=create_user('uid-3'), status=SyncJob.FAILED, finished_at=timezone.now())
+
+        with mock.patch('app.jobs.gmail_service', side_effect=RuntimeError('token revoked')), \
+                mock.patch('app.jobs.connection.close'):
+            worker_loop('test-worker', threading.Event(), once=True)
+
+        # The stale job was re-queued, then claimed and run again.
+        self.assertEqual(SyncJob.objects.get(user=self.user).status, SyncJob.FAILED)
+        self.assertFalse(SyncJob.objects.filter(pk=old.pk).exists())
+        self.assertTrue(SyncJob.objects.filter(pk=recent.pk).exists())
+        self.assertEqual(prune_finished_jobs(), 0)
+
+    def test_status_is_scoped_to_the_job_owner(self):
+        job = enqueue_sync(self.user)
+        create_user('uid-2')
+
+        response = self.client.get(reverse('sync-status', args=[job.pk]), {'uid': 'uid-2'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TransactionExtractorTests(SimpleTestCase):
+    def setUp(self):
+        self.extractor = TransactionExtractor()
+
+    def assertMatchesLegacy(self, body, internal_date='1735689600000'):
+        expected = legacy_extract_transaction_details(body, {'internalDate': internal_date})
+        actual = self.extractor.extract(body, internal_date)
+        if expected is None:
+            self.assertIsNone(actual, body)
+        else:
+            self.assertEqual(
+                (expected['type'], expected['amount'], expected['date'], expected['description']),
+                tuple(actual), body)
+
+    def test_matches_legacy_extractor_on_synthetic_corpus(self):
+        for body, internal_date in synthetic_bank_emails(2000, seed=7):
+            self.assertMatchesLegacy(body, internal_date)
+
+    def test_edge_cases_match_legacy_extractor(self):
+        cases = [
+            'Amount: Rs. 500 paid',            # lower-priority pattern starts before the currency
+            'Total: 1,299 for your order',
+            'Rs. , bill total 250',            # unparseable first amount falls through
+            'Rs.300 debited on 05/13/2024',    # dateutil swaps day and month
+            'Rs.300 debited on 31/02/2024 or 1st March 2024',
+            'Rs.300 debited on 5-3-24',
+            'INR 10 credited on 12.11.202',    # three-digit year
+            'INR 10 received 3 Sept 2024',
+            'INR 10 received 3 Janxyz 2024',
+            'cardebited Rs 40',                # overlapping keywords
+            'Newsletter with no amounts at all',
+            'Weekly digest: 12 new posts',
+        ]
+        for body in cases:
+            self.assertMatchesLegacy(body)
+
+    def test_result_fields(self):
+        details = self.extractor.extract('Rs.1,234.50 debited on 05/03/2025\nsecond line', '0')
+
+        self.assertEqual(details.type, 'debited')
+        self.assertEqual(details.amount, 1234.5)
+        self.assertEqual(details.date.date(), datetime.date(2025, 3, 5))
+        self.assertEqual(details.description, 'Rs.1,234.50 debited on 05/03/2025')
+
+
+class SenderParserTests(TestCase):
+    def test_dispatch_by_address_and_domain(self):
+        self.assertEqual(parser_for('HDFC Bank InstaAlerts <alerts@hdfcbank.net>').name, 'hdfc')
+        self.assertEqual(parser_for('cbssbi.info@alerts.sbi.co.in').name, 'sbi')
+        self.assertEqual(parser_for('"Paytm" <no-reply@paytm.com>').name, 'paytm')
+        self.assertEqual(parser_for('someone@example.org').name, 'generic')
+        self.assertEqual(parser_for('').name, 'generic')
+        self.assertFalse(parser_for('LinkedIn <messages-noreply@linkedin.com>').financial)
+
+    def test_bank_template(self):
+        details = parser_for('alerts@hdfcbank.net').extract(
+            'Dear Customer, Rs.2,500.00 has been debited from account **1234 to VPA swiggy@okicici '
+            'on 05-03-25. Your UPI transaction reference number is 506412345678.', '0')
+
+        self.assertEqual(details.type, 'debited')
+        self.assertEqual(details.amount, 2500.0)
+        self.assertEqual(details.date.date(), datetime.date(2025, 3, 5))
+
+    def test_template_fixes_generic_type_heuristic(self):
+        body = ('Your A/c no. XXXXXXXX1234 is debited for Rs 640.00 on 12.3.2025 and credited to '
+                'zomato@okaxis (UPI Ref no 506412345678) -SBI')
+
+        self.assertEqual(parser_for('unknown@example.org').extract(body, '0').type, 'credited')
+        details = parser_for('donotreply.sbiatm@alerts.sbi.co.in').extract(body, '0')
+        self.assertEqual((details.type, details.amount), ('debited', 640.0))
+        self.assertEqual(details.date.date(), datetime.date(2025, 3, 12))
+
+    def test_template_uses_subject(self):
+        details = parser_for('no-reply@phonepe.com').extract(
+            'PhonePe transaction successful. Reward points added.', '0', subject='Received ₹750 from Priya')
+
+        self.assertEqual((details.type, details.amount), ('credited', 750.0))
+
+    def test_unmatched_template_falls_back_to_generic(self):
+        body = 'Your statement is ready. Total: 4,200 due on 10/04/2025'
+        self.assertEqual(parser_for('alerts@hdfcbank.net').extract(body, '0'),
+                         parser_for('unknown@example.org').extract(body, '0'))
+
+    def test_non_financial_sender_is_rejected_before_decoding(self):
+        message = make_message('m1', 'Rs. 500 paid', sender='notifications@facebookmail.com')
+
+        with mock.patch('app.sync.get_email_body') as get_email_body:
+            self.assertIsNone(parse_message(create_user(), message))
+        get_email_body.assert_not_called()
+
+
+class MetadataPrefilterTests(TestCase):
+    def metadata(self, sender, subject, snippet=''):
+        return {'id': 'm1', 'snippet': snippet, 'payload': {'headers': [
+            {'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject},
+        ]}}
+
+    def test_scores(self):
+        self.assertEqual(score_metadata(self.metadata('alerts@linkedin.com', 'Rs. 500 paid')), 0)
+        self.assertGreaterEqual(score_metadata(self.metadata('alerts@hdfcbank.net', 'Account update')), 2)
+        self.assertGreaterEqual(score_metadata(self.metadata('a@shop.example', 'Order', 'Total ₹499 paid')), 2)
+        self.assertLess(score_metadata(self.metadata('a@shop.example', 'New arrivals', 'Shop the latest picks')), 2)
+
+    def test_alert_from_an_unknown_sender_without_an_amount_is_downloaded(self):
+        message = self.metadata('alerts@newbank.example', 'Transaction alert', 'Your account has been debited')
+
+        self.assertTrue(is_likely_transaction(message))
+
+    def test_list_query(self):
+        self.assertEqual(build_list_query('2025/01/01'), 'after:2025/01/01')
+        self.assertEqual(
+            build_list_query('2025/01/01', ['hdfcbank.net'], ['debited', 'order confirmed']),
+            'after:2025/01/01 {from:hdfcbank.net subject:debited subject:"order confirmed"}',
+        )
+
+    @override_settings(GMAIL_SYNC_SENDERS='hdfcbank.net, paytm.com', GMAIL_SYNC_KEYWORDS='')
+    def test_listing_uses_allowlist(self):
+        with FakeGmailServer() as server:
+            GmailSyncEngine(server.build_service(), create_user()).run()
+
+        self.assertEqual(server.queries, ['after:2024/01/01 {from:hdfcbank.net from:paytm.com}'])
+
+    def test_only_likely_transactions_are_downloaded(self):
+        inbox = synthetic_inbox(200, body_size=5000)
+        alerts = sorted(m['id'] for m in inbox if m['id'].startswith('inbox-alert'))
+        user = create_user()
+
+        with FakeGmailServer(inbox) as server:
+            stats = GmailSyncEngine(server.build_service(), user, prefilter=True).run()
+
+        self.assertEqual(sorted(server.full_requested), alerts)
+        self.assertEqual(stats['filtered'], 200 - len(alerts))
+        self.assertEqual(stats['saved'], len(alerts))
+        self.assertEqual(ProcessedMessage.objects.filter(user=user).count(), 200)
+        self.assertIsNotNone(SyncCursor.objects.get(user=user).history_id)
+
+
+def part(mime_type, text=None, parts=None):
+    body = {'size': 0}
+    if text is not None:
+        body = {'size': len(text), 'data': base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')}
+    result = {'mimeType': mime_type, 'body': body}
+    if parts is not None:
+        result['parts'] = parts
+    return result
+
+
+class MimeBodyTests(SimpleTestCase):
+    def test_part_selection_matches_legacy_for_plain_text(self):
+        payloads = [
+            part('text/plain', 'single part'),
+            part('multipart/alternative', parts=[part('text/html', '<p>html</p>'), part('text/plain', 'plain')]),
+            part('multipart/mixed', parts=[
+                part('multipart/alternative', parts=[part('text/plain', 'nested plain')]),
+                part('application/pdf', 'x' * 100),
+            ]),
+            part('multipart/mixed', parts=[part('text/plain'), part('text/plain', 'second')]),
+            make_message('m1', 'Rs. 10 debited')['payload'],
+        ]
+        for payload in payloads:
+            self.assertEqual(extract_body(payload), legacy_get_email_body(payload))
+
+    def test_html_is_converted_to_text(self):
+        payload = part('multipart/alternative', parts=[part('text/html', (
+            '<html><head><style>p{color:red}</style></head><body><!-- x -->'
+            '<p>Rs.&nbsp;500 <b>debited</b></p><div>Ref&amp;No 12</div><script>var a = "<p>";</script></body></html>'
+        ))])
+
+        self.assertEqual(extract_body(payload), 'Rs. 500 debited\nRef&No 12')
+        self.assertEqual(html_to_text('a<br>b<span>c</span>'), 'a\nb c')
+
+    def test_part_is_decoded_up_to_the_cap(self):
+        data = part('text/plain', 'é' * 1000)['body']['data']
+
+        self.assertEqual(decode_part_data(data, max_bytes=101), 'é' * 50)
+        self.assertEqual(decode_part_data(data.rstrip('='), max_bytes=None), 'é' * 1000)
+
+    def test_large_promotional_email_is_capped(self):
+        text = extract_body(promotional_payload(256 * 1024), max_bytes=16 * 1024)
+
+        self.assertTrue(text.startswith('Flat 50% off & free delivery.'))
+        self.assertLess(len(text), 16 * 1024)
+        self.assertNotIn('<', text)
+
+
+class AsyncGmailSyncTests(TestCase):
+    def setUp(self):
+        self.user = create_user(google_access_token='token', google_refresh_token='refresh',
+                                google_token_expiry=timezone.now() + datetime.timedelta(hours=1))
+        self.server = FakeGmailServer([transaction_email(i) for i in range(120)]).start()
+        self.addCleanup(self.server.stop)
+
+    async def sync(self, **client_options):
+        self.server.reset_counters()
+        client = AsyncGmailClient('token', self.user.pk, root_url=self.server.root_url, **client_options)
+        try:
+            return await AsyncGmailSyncEngine(client, self.user, page_size=50).arun()
+        finally:
+            await close_connections()
+
+    async def test_full_then_incremental_sync(self):
+        stats = await self.sync()
+
+        self.assertEqual((stats['mode'], stats['listed'], stats['fetched'], stats['errors']), ('full', 120, 120, 0))
+        self.assertEqual(await Transaction.objects.filter(user=self.user).acount(), stats['saved'])
+        self.assertEqual(await ProcessedMessage.objects.filter(user=self.user).acount(), 120)
+
+        self.server.add(transaction_email(120))
+        stats = await self.sync()
+
+        self.assertEqual((stats['mode'], stats['fetched']), ('incremental', 1))
+        self.assertEqual(self.server.full_requested, ['txn120'])
+
+    @override_settings(GMAIL_ASYNC_USER_CONCURRENCY=3)
+    async def test_requests_in_flight_are_bounded_per_user(self):
+        self.server.latency = 0.005
+
+        await self.sync()
+
+        self.assertLessEqual(self.server.peak_in_flight, 3)
+        self.assertGreater(self.server.peak_in_flight, 1)
+
+    async def test_retryable_errors_are_retried(self):
+        self.server.fail_once.update({'txn3': 429, 'txn4': 503, 'txn5': 404})
+        self.server.fail_batches = 1
+
+        stats = await self.sync(backoff_base=0)
+
+        self.assertEqual((stats['fetched'], stats['errors']), (119, 0))
+        self.assertTrue(await ProcessedMessage.objects.filter(user=self.user, message_id='txn5').aexists())
+
+    def test_async_view_runs_sync(self):
+        with override_settings(GMAIL_API_ROOT_URL=self.server.root_url):
+            response = self.client.post(reverse('async-sync'), {'uid': 'uid-1'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stats']['fetched'], 120)
+        job = SyncJob.objects.get(user=self.user)
+        self.assertEqual((job.status, job.progress['fetched']), (SyncJob.SUCCEEDED, 120))
+
+    def test_async_view_refuses_while_a_worker_syncs_the_user(self):
+        SyncJob.objects.create(user=self.user, status=SyncJob.RUNNING)
+
+        response = self.client.post(reverse('async-sync'), {'uid': 'uid-1'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.server.round_trips, 0)
+
+    async def test_sync_user_claims_the_queued_job_and_releases_its_limit(self):
+        job = await SyncJob.objects.acreate(user=self.user)
+
+        with override_settings(GMAIL_API_ROOT_URL=self.server.root_url):
+            try:
+                await sync_user(self.user)
+                self.assertNotIn(self.user.pk, _loop_resources().user_limits)
+            finally:
+                await close_connections()
+
+        await job.arefresh_from_db()
+        self.assertEqual(job.status, SyncJob.SUCCEEDED)
+        self.assertEqual(await SyncJob.objects.acount(), 1)
+
+    async def test_asgi_shutdown_closes_the_connection_pool(self):
+        from Backend.asgi import application
+
+        client = _loop_resources().client
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await application({'type': 'lifespan'}, receive, send)
+
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(client.is_closed)
+
+
+class CategorizationTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.model = FakeGenerativeModel()
+        self.cache = LRUCache(100)
+
+    def categorizer(self, **options):
+        # No rules and no training data: every unseen description reaches the model.
+        options.setdefault('local', LocalCategorizer(CATEGORIES, rules=()))
+        return Categorizer(model_factory=lambda: self.model, cache=self.cache, **options)
+
+    def add(self, *descriptions):
+        return [Transaction.objects.create(user=self.user, transaction_type='debited', amount=10,
+                                           source='email', description=d) for d in descriptions]
+
+    def test_normalized_description_ignores_amounts_and_references(self):
+        self.assertEqual(normalize_description('Paid Rs.250.00 to SWIGGY, Ref 50641234'),
+                         normalize_description('paid INR 99 to Swiggy ref 777'))
+
+    def test_model_is_asked_once_per_merchant(self):
+        self.add('Paid Rs.250 to Swiggy', 'Paid Rs.99 to Swiggy', 'Uber trip Rs.180')
+
+        # Load, cache lookup, cache insert, bulk update, then the report refresh
+        # (one grouped select and one upsert) and the data version bump inside
+        # two savepoints.
+        with self.assertNumQueries(11):
+            updated = self.categorizer().categorize(Transaction.objects.filter(user=self.user))
+
+        self.assertEqual(updated, 3)
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertEqual(
+            dict(Transaction.objects.values_list('description', 'category')),
+            {'Paid Rs.250 to Swiggy': 'Food & Dining', 'Paid Rs.99 to Swiggy': 'Food & Dining',
+             'Uber trip Rs.180': 'Transport'},
+        )
+        self.assertEqual(CategoryCache.objects.count(), 2)
+
+    def test_repeat_merchants_never_reach_the_model(self):
+        self.add('Paid Rs.250 to Swiggy')
+        self.categorizer().categorize(Transaction.objects.all())
+        self.add('Paid Rs.75 to Swiggy')
+
+        self.categorizer().categorize(Transaction.objects.filter(category__isnull=True))
+        self.cache.clear()
+        self.add('Paid Rs.40 to Swiggy')
+        self.categorizer().categorize(Transaction.objects.filter(category__isnull=True))
+
+        self.assertEqual(len(self.model.prompts), 1)
+        self.assertFalse(Transaction.objects.filter(category__isnull=True).exists())
+
+    def test_prompts_are_chunked_and_answers_matched_by_id(self):
+        self.add(*[f'Merchant {chr(97 + i)} order' for i in range(7)])
+
+        class ReversingModel(FakeGenerativeModel):
+            def generate_content(self, prompt, generation_config=None):
+                response = super().generate_content(prompt, generation_config)
+                answers = json.loads(response.text)
+                answers[0]['category'] = 'Not a category'
+                response.text = json.dumps(answers[::-1])
+                return response
+
+        self.model = ReversingModel()
+        updated = self.categorizer(chunk_size=3).categorize(Transaction.objects.all())
+
+        self.assertEqual(len(self.model.prompts), 3)
+        self.assertEqual(updated, 7)
+        # The three rejected answers fall back rather than shifting onto other rows.
+        self.assertEqual(sorted(Transaction.objects.values_list('category', flat=True)),
+                         ['Other'] * 3 + ['Shopping'] * 4)
+        self.assertEqual(CategoryCache.objects.count(), 4)
+
+    def test_failed_chunk_falls_back_without_caching(self):
+        self.add('Paid Rs.250 to Swiggy')
+        self.model.fail = True
+
+        self.assertEqual(self.categorizer().categorize(Transaction.objects.all()), 1)
+        self.assertEqual(Transaction.objects.get().category, 'Other')
+        self.assertEqual(CategoryCache.objects.count(), 0)
+
+    @override_settings(LOCAL_CATEGORY_MODEL_MAX_AGE=0, AI_INSIGHTS_WAIT=5)
+    def test_analysis_categorizes_with_the_stub_model(self):
+        self.add('Paid Rs.250 to Swiggy', 'Paid Rs.80 to Ramesh Kirana')
+        models = []
+
+        def model_factory(name):
+            models.append(FakeGenerativeModel(name))
+            return models[-1]
+
+        with mock.patch('app.gemini.generative_model', model_factory), \
+                mock.patch('app.categorization.default_cache', LRUCache(10)):
+            for _ in range(2):
+                response = self.client.post(reverse('get-analysis'), {'uid': self.user.firebase_uid},
+                                            content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        # Swiggy is settled by a merchant rule; only the unknown shop reaches the model, once.
+        categorization_prompts = [p for m in models for p in m.prompts if 'Transactions:' in p]
+        self.assertEqual(len(categorization_prompts), 1)
+        self.assertNotIn('swiggy', categorization_prompts[0])
+        self.assertEqual(sorted(c['category'] for c in response.json()['bar_chart_data']),
+                         ['Food & Dining', 'Other'])
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_one_thread_retrains_while_the_others_use_the_old_model(self):
+        old, new = object(), object()
+        release = threading.Event()
+        trainings = []
+
+        def train():
+            trainings.append(1)
+            release.wait(5)
+            return new
+
+        results = []
+        with mock.patch.dict('app.categorization._local_model', {'model': old, 'trained_at': -1e9}), \
+                mock.patch('app.categorization.train_local_model', train):
+            trainer = threading.Thread(target=lambda: results.append(get_local_model()))
+            trainer.start()
+            while not trainings:
+                time.sleep(0.001)
+            others = [get_local_model() for _ in range(3)]
+            release.set()
+            trainer.join()
+
+        self.assertEqual(others, [old] * 3)
+        self.assertEqual(results, [new])
+        self.assertEqual(len(trainings), 1)
+
+    def test_lru_survives_concurrent_use(self):
+        cache = LRUCache(50)
+        errors = []
+
+        def hammer(seed):
+            try:
+                for i in range(5000):
+                    key = (i * seed) % 80
+                    cache.set(key, i) if i % 3 else cache.get(key)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=hammer, args=(seed,)) for seed in (1, 7, 13, 29)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache), 50)
+
+
+class LocalCategorizerTests(TestCase):
+    def trained(self):
+        pairs = synthetic_categorized_descriptions(2000)
+        return LocalCategorizer(CATEGORIES).fit([normalize_description(d) for d, _ in pairs], [c for _, c in pairs])
+
+    def test_rules_win_with_full_confidence(self):
+        self.assertEqual(LocalCategorizer(CATEGORIES).predict(['paid to swiggy', 'unknown shop', '']),
+                         [('Food & Dining', 1.0), (None, 0.0), (None, 0.0)])
+
+    def test_model_generalizes_from_words(self):
+        [(category, confidence)] = self.trained().predict([normalize_description('Lab test at Neuberg clinic Rs.900')])
+
+        self.assertEqual(category, 'Health & Wellness')
+        self.assertGreater(confidence, 0.5)
+
+    def test_accuracy_on_labeled_fixture(self):
+        fixture = labeled_descriptions()
+        predictions = self.trained().predict([normalize_description(d) for d, _ in fixture])
+
+        correct = sum(1 for (category, _), (_, label) in zip(predictions, fixture) if category == label)
+        self.assertGreaterEqual(correct / len(fixture), 0.85)
+
+    def test_confident_rows_skip_the_llm(self):
+        user = create_user()
+        Transaction.objects.bulk_create([
+            Transaction(user=user, transaction_type='debited', amount=1, source='email', description=d, category=c)
+            for d, c in synthetic_categorized_descriptions(500)
+        ])
+        Transaction.objects.create(user=user, transaction_type='debited', amount=1, source='email',
+                                   description='Ticket for Metro line 3 at Andheri')
+        model = FakeGenerativeModel()
+
+        Categorizer(model_factory=lambda: model, cache=LRUCache(10), local=train_local_model()).categorize(
+            Transaction.objects.filter(category__isnull=True))
+
+        self.assertEqual(model.prompts, [])
+        self.assertEqual(Transaction.objects.get(description__startswith='Ticket').category, 'Transport')
+
+    def test_local_guess_is_used_when_the_llm_is_unreachable(self):
+        user = create_user()
+        Transaction.objects.create(user=user, transaction_type='debited', amount=1, source='email',
+                                   description='Neuberg clinic lab test')
+        local = self.trained()
+        local.predict = lambda keys: [('Health & Wellness', 0.5) for _ in keys]
+
+        Categorizer(model_factory=lambda: FakeGenerativeModel(fail=True), cache=LRUCache(10), local=local).categorize(
+            Transaction.objects.all())
+
+        self.assertEqual(Transaction.objects.get().category, 'Health & Wellness')
+
+    def test_uncategorizable_rows_are_not_retried_on_every_load(self):
+        user = create_user()
+        for description in (None, '1234 5678', 'Zqx merchant'):
+            Transaction.objects.create(user=user, transaction_type='debited', amount=1, source='email',
+                                       description=description)
+        model = FakeGenerativeModel(fail=True)
+        categorizer = Categorizer(model_factory=lambda: model, cache=LRUCache(10),
+                                  local=LocalCategorizer(CATEGORIES, rules=()))
+
+        self.assertEqual(categorizer.categorize(Transaction.objects.filter(category__isnull=True)), 3)
+        self.assertEqual(len(model.prompts), 1)
+        # The next dashboard load finds nothing left to send.
+        self.assertEqual(categorizer.categorize(Transaction.objects.filter(category__isnull=True)), 0)
+        self.assertEqual(len(model.prompts), 1)
+        self.assertEqual(set(Transaction.objects.values_list('category', flat=True)), {'Other'})
+        self.assertFalse(CategoryCache.objects.exists())
+
+
+class FinancialReportTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def add(self, amount, date, transaction_type='debited', category=None):
+        return Transaction.objects.create(user=self.user, transaction_type=transaction_type, amount=amount,
+                                          source='email', category=category, date=date)
+
+    def report(self, year, month):
+        return FinancialReport.objects.get(user=self.user, year=year, month=month).report_data
+
+    def test_single_saves_and_deletes_update_the_month(self):
+        first = self.add(100, datetime.date(2025, 3, 5), category='Shopping')
+        self.add(40, datetime.date(2025, 3, 9), category='Shopping')
+        self.add(1000, datetime.date(2025, 3, 1), transaction_type='credited')
+
+        self.assertEqual(self.report(2025, 3), {
+            'credited': 1000.0, 'debited': 140.0, 'count': 3,
+            'categories': [{'category': 'Shopping', 'total': 140.0}],
+        })
+
+        first.date = datetime.date(2025, 4, 2)
+        first.save()
+        self.assertEqual(self.report(2025, 3)['debited'], 40.0)
+        self.assertEqual(self.report(2025, 4)['debited'], 100.0)
+
+        first.delete()
+        self.assertFalse(FinancialReport.objects.filter(user=self.user, year=2025, month=4).exists())
+
+    def test_batch_inserts_and_recategorization_refresh_reports(self):
+        batch = TransactionBatch(self.user)
+        for msg_id, amount, day in (('m1', 250, 3), ('m2', 80, 4)):
+            batch.add(alert_on(msg_id, amount, day))
+        batch.save()
+
+        self.assertEqual(self.report(2025, 3)['categories'], [{'category': None, 'total': 330.0}])
+
+        local = LocalCategorizer(CATEGORIES, rules=())
+        local.predict = lambda keys: [('Shopping', 1.0) for _ in keys]
+        Categorizer(model_factory=FakeGenerativeModel, cache=LRUCache(10), local=local).categorize(
+            Transaction.objects.all())
+
+        self.assertEqual(self.report(2025, 3)['categories'], [{'category': 'Shopping', 'total': 330.0}])
+
+    def test_summary_matches_a_full_scan(self):
+        for i in range(30):
+            self.add(10 + i, datetime.date(2024 + i % 2, 1 + i % 12, 1 + i % 28),
+                     transaction_type='credited' if i % 5 == 0 else 'debited',
+                     category=CATEGORIES[i % 3])
+
+        totals, spending = summarize(self.user.pk)
+
+        debited = Transaction.objects.filter(user=self.user, transaction_type='debited')
+        self.assertAlmostEqual(totals['total_debited'], sum(t.amount for t in debited))
+        self.assertEqual({s['category']: s['total'] for s in spending},
+                         {c: sum(t.amount for t in debited if t.category == c) for c in CATEGORIES[:3]})
+        # The coverage check and the reports.
+        with self.assertNumQueries(2):
+            summarize(self.user.pk)
+
+    def test_users_with_reports_predating_rollups_are_rebuilt(self):
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, transaction_type='debited', amount=amount, source='email',
+                        date=datetime.date(2025, month, 5))
+            for month, amount in ((1, 100), (2, 50), (3, 25))
+        ])
+        # Only March was refreshed, and only because of a later sync.
+        refresh_months(self.user.pk, [(2025, 3)])
+        BasicInfo.objects.filter(pk=self.user.pk).update(rollups_built_at=None)
+
+        totals, _ = summarize(self.user.pk)
+
+        self.assertEqual(totals['total_debited'], 175.0)
+        self.assertEqual(FinancialReport.objects.filter(user=self.user).count(), 3)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.rollups_built_at)
+
+    def test_rebuild_command_backfills_reports(self):
+        self.add(100, datetime.date(2025, 1, 5))
+        self.add(50, datetime.date(2025, 2, 5))
+        FinancialReport.objects.all().delete()
+
+        call_command('rebuild_financial_reports', uid=[self.user.firebase_uid], stdout=io.StringIO())
+
+        self.assertEqual(FinancialReport.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.report(2025, 2)['debited'], 50.0)
+
+
+@mock.patch('app.gemini.generative_model', FakeGenerativeModel)
+@override_settings(AI_INSIGHTS_WAIT=5)
+class AnalysisApiTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        for i in range(40):
+            # Two transactions a day, so pages have to break ties on id.
+            Transaction.objects.create(user=self.user, transaction_type='credited' if i % 10 == 0 else 'debited',
+                                       amount=10 * (i + 1), source='email', description=f'Shop {i}',
+                                       category=CATEGORIES[i % 2], date=datetime.date(2025, 2, 20) + datetime.timedelta(days=i // 2))
+
+    def post(self, **data):
+        return self.client.post(reverse('get-analysis'), dict(data, uid=self.user.firebase_uid),
+                                content_type='application/json')
+
+    def expected(self, start, end):
+        rows = Transaction.objects.filter(user=self.user, date__gte=start, date__lte=end)
+        return {
+            'credited': sum(t.amount for t in rows if t.transaction_type == 'credited'),
+            'debited': sum(t.amount for t in rows if t.transaction_type == 'debited'),
+        }
+
+    def test_month_window_limits_charts_and_transactions(self):
+        body = self.post(month=3, year=2025).json()
+
+        self.assertEqual(body['window'], {'start_date': '2025-03-01', 'end_date': '2025-03-31'})
+        self.assertEqual(body['pie_chart_data'], self.expected(datetime.date(2025, 3, 1), datetime.date(2025, 3, 31)))
+        self.assertEqual(len(body['transactions']), 22)
+        self.assertTrue(all(t['date'].startswith('2025-03') for t in body['transactions']))
+        self.assertEqual(set(body['transactions'][0]),
+                         {'id', 'date', 'description', 'category', 'amount', 'transaction_type'})
+
+    def test_date_range_across_partial_months_matches_a_full_scan(self):
+        body = self.post(start_date='2025-02-25', end_date='2025-03-04').json()
+
+        self.assertEqual(body['pie_chart_data'], self.expected(datetime.date(2025, 2, 25), datetime.date(2025, 3, 4)))
+        self.assertEqual(len(body['transactions']), 16)
+
+    def test_cursor_pages_walk_the_window_once(self):
+        body = self.post(limit=15, category=CATEGORIES[0]).json()
+        seen = [t['id'] for t in body['transactions']]
+        with mock.patch('app.views.analysis.summarize_reports') as summarize_reports:
+            while body['next_cursor']:
+                body = self.post(limit=15, category=CATEGORIES[0], cursor=body['next_cursor']).json()
+                seen += [t['id'] for t in body['transactions']]
+        summarize_reports.assert_not_called()
+
+        expected = Transaction.objects.filter(category=CATEGORIES[0]).order_by('-date', '-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.post(limit=5).json()
+        # The profile comes from the cache the first request filled.
+        with self.assertNumQueries(1):
+            self.post(limit=5, cursor=first['next_cursor'])
+
+    def get(self, etag=None, **data):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get(reverse('get-analysis'), dict(data, uid=self.user.firebase_uid), headers=headers)
+
+    def test_unchanged_dashboard_is_revalidated_with_one_query(self):
+        response = self.get(month=3, year=2025)
+        self.assertEqual(response.json()['ai_insights_status'], 'ready')
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+
+        with mock.patch('app.views.analysis.summarize_reports') as summarize_reports, self.assertNumQueries(1):
+            cached = self.get(etag, month=3, year=2025)
+        summarize_reports.assert_not_called()
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], etag)
+        # Gzipped responses come back with a weak tag.
+        self.assertEqual(self.get(f'W/{etag}', month=3, year=2025).status_code, 304)
+
+        self.assertEqual(self.get(etag, month=2, year=2025).status_code, 200)
+
+    def test_new_or_categorized_transactions_change_the_etag(self):
+        etag = self.get()['ETag']
+        Transaction.objects.create(user=self.user, transaction_type='debited', amount=5, source='email',
+                                   description='Tea', date=datetime.date(2025, 3, 10))
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Tagged after categorizing the new transaction, so the next request matches.
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_edited_transactions_change_the_etag(self):
+        row = Transaction.objects.filter(user=self.user).first()
+        for field, value in (('category', CATEGORIES[5]), ('amount', 1234.5), ('description', 'Refund'),
+                             ('date', datetime.date(2025, 3, 2))):
+            with self.subTest(field=field):
+                etag = self.get()['ETag']
+                setattr(row, field, value)
+                row.save()
+
+                self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_profile_etag_follows_token_refreshes(self):
+        url = reverse('get-user-details')
+        response = self.client.get(url, {'uid': self.user.firebase_uid})
+        self.assertEqual(response.json()['email'], self.user.email)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, {'uid': self.user.firebase_uid},
+                                         headers={'If-None-Match': etag}).status_code, 304)
+
+        self.user.google_access_token = 'refreshed'
+        self.user.save()
+        response = self.client.get(url, {'uid': self.user.firebase_uid}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['google_access_token'], 'refreshed')
+
+    def test_bad_window_or_cursor_is_rejected(self):
+        for data in ({'start_date': '2025-13-01'}, {'start_date': '2025-03-05', 'end_date': '2025-03-01'},
+                     {'month': 'March', 'year': 2025}, {'cursor': 'not-a-cursor'}, {'limit': 'all'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(**data).status_code, 400)
+
+
+class TrendsTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        rows = []
+        for month in range(1, 7):
+            rows += [
+                ('credited', 50000, 'Salary', 'Income', 1),
+                ('debited', 649, 'Netflix subscription', 'Entertainment', 5),
+                ('debited', 1000 * month, f'BigBasket order {month}', 'Groceries', 12),
+                ('debited', 300 + month, f'Swiggy order {month}', 'Food & Dining', 20),
+            ]
+            Transaction.objects.bulk_create([
+                Transaction(user=self.user, transaction_type=kind, amount=amount, source='email',
+                            description=description, category=category, date=datetime.date(2025, month, day))
+                for kind, amount, description, category, day in rows[-4:]
+            ])
+
+    def trends(self, **kwargs):
+        return summarize_trends(self.user.pk, datetime.date(2025, 7, 1), months=6,
+                                today=datetime.date(2025, 12, 31), **kwargs)
+
+    def test_monthly_series_and_rolling_average(self):
+        months = self.trends()['months']
+
+        self.assertEqual([m['month'] for m in months], ['2025-01', '2025-02', '2025-03', '2025-04', '2025-05', '2025-06'])
+        self.assertEqual(months[0], {'month': '2025-01', 'credited': 50000.0, 'debited': 1950.0,
+                                     'net': 48050.0, 'debited_average': 1950.0})
+        self.assertEqual(months[2]['debited_average'], (1950 + 2951 + 3952) / 3)
+        self.assertEqual(rolling_mean(np.array([3.0, 6.0, 9.0, 12.0]), window=2).tolist(), [3.0, 4.5, 7.5, 10.5])
+
+    def test_category_changes_compare_the_last_complete_months(self):
+        changes = self.trends()['category_changes']
+
+        self.assertEqual((changes['month'], changes['previous_month']), ('2025-06', '2025-05'))
+        self.assertEqual(changes['categories'][0], {'category': 'Groceries', 'current': 6000.0, 'previous': 5000.0,
+                                                    'change': 1000.0, 'change_pct': 20.0})
+        self.assertEqual(changes['categories'][-1]['change'], 0.0)
+
+    def test_recurring_payments_need_a_steady_amount_and_rhythm(self):
+        recurring = self.trends()['recurring']
+
+        self.assertEqual([(r['description'], r['frequency'], r['occurrences']) for r in recurring],
+                         [('Netflix subscription', 'monthly', 6)])
+        self.assertEqual(recurring[0]['next_date'], datetime.date(2025, 7, 5))
+
+    def test_recurring_payments_that_lapsed_are_dropped(self):
+        trends = summarize_trends(self.user.pk, months=12, today=datetime.date(2026, 3, 1))
+
+        self.assertEqual(trends['recurring'], [])
+
+    def test_forecast_extends_the_trend_of_complete_months(self):
+        self.assertEqual(self.trends()['forecast'], {'month': '2025-07', 'debited': 7956.0, 'based_on_months': 6})
+        self.assertEqual(forecast(np.array([100.0, 300.0])), 200.0)
+        self.assertEqual(forecast(np.array([900.0, 500.0, 100.0])), 0.0)
+
+        # June still in progress: forecast June from January to May.
+        partial = summarize_trends(self.user.pk, months=6, today=datetime.date(2025, 6, 15))
+        self.assertEqual(partial['forecast']['month'], '2025-06')
+        self.assertEqual(partial['category_changes']['month'], '2025-05')
+
+    def test_columns_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            columns = load_columns(self.user.pk, datetime.date(2025, 2, 1), datetime.date(2025, 3, 1))
+
+        self.assertEqual(len(columns), 4)
+        self.assertEqual(columns.months.tolist(), [661] * 4)
+        self.assertEqual(columns.debits.tolist(), [False, True, True, True])
+
+    def test_analysis_response_includes_trends(self):
+        body = self.client.post(reverse('get-analysis'), {'uid': self.user.firebase_uid, 'month': 6, 'year': 2025},
+                                content_type='application/json').json()
+
+        self.assertEqual(body['trends']['months'][-1]['month'], '2025-06')
+        self.assertEqual(body['trends']['recurring'][0]['last_date'], '2025-06-05')
+
+
+# Routing is checked against a second database configured as 'replica' (not a test mirror of default).
+SEPARATE_REPLICA = 'replica' in settings.DATABASES and not settings.DATABASES['replica'].get('TEST', {}).get('MIRROR')
+
+
+@skipUnless(SEPARATE_REPLICA, "needs a second, non-mirror test database under the 'replica' alias")
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'} if SEPARATE_REPLICA else {'default'}
+
+    def setUp(self):
+        patcher = mock.patch('app.routers.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = create_user(google_access_token='token', google_refresh_token='refresh')
+        row = Transaction.objects.create(user=self.user, transaction_type='debited', amount=100, source='email',
+                                         description='Swiggy order', category=CATEGORIES[0],
+                                         date=datetime.date(2025, 3, 1))
+        # What replication would have copied over.
+        for obj in [self.user, row, *FinancialReport.objects.all()]:
+            obj.save(using='replica', force_insert=True)
+
+    def run_counting(self, func):
+        """Runs func(); returns the number of queries sent to the primary and to the replica."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            func()
+        return len(primary), len(replica)
+
+    def post_analysis(self):
+        response = self.client.post(reverse('get-analysis'), {'uid': self.user.firebase_uid, 'month': 3, 'year': 2025},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_reads_go_to_the_replica(self):
+        with mock.patch('app.gemini.generative_model', FakeGenerativeModel):
+            primary, replica = self.run_counting(self.post_analysis)
+
+        # Only the user lookup and the sync-recency check hit the primary.
+        self.assertEqual(primary, 2)
+        self.assertGreater(replica, 3)
+
+    def test_reads_stay_on_the_primary_after_a_sync(self):
+        BasicInfo.objects.filter(pk=self.user.pk).update(last_email_sync=timezone.now())
+
+        with mock.patch('app.gemini.generative_model', FakeGenerativeModel):
+            primary, replica = self.run_counting(self.post_analysis)
+
+        self.assertEqual(replica, 0)
+
+    def test_running_sync_keeps_reads_on_the_primary(self):
+        SyncJob.objects.create(user=self.user, status=SyncJob.RUNNING)
+
+        with replica_reads(self.user) as alias:
+            self.assertEqual(alias, 'default')
+
+    def test_writes_move_the_rest_of_the_block_to_the_primary(self):
+        def read_write_read():
+            with replica_reads():
+                list(Transaction.objects.all())
+                Transaction.objects.update(category=CATEGORIES[1])
+                list(Transaction.objects.all())
+
+        primary, replica = self.run_counting(read_write_read)
+        self.assertEqual((primary, replica), (2, 1))
+
+    def test_reads_outside_a_block_use_the_primary(self):
+        primary, replica = self.run_counting(lambda: list(Transaction.objects.all()))
+        self.assertEqual((primary, replica), (1, 0))
+
+
+class ResponseTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, transaction_type='debited', amount=100 + i, source='email',
+                        description=f'Swiggy order {i}', category=CATEGORIES[0], date=datetime.date(2025, 3, 1))
+            for i in range(30)
+        ])
+
+    def post(self, **headers):
+        with mock.patch('app.gemini.generative_model', FakeGenerativeModel):
+            return self.client.post(reverse('get-analysis'), {'uid': self.user.firebase_uid},
+                                    content_type='application/json', **headers)
+
+    def test_encoders_agree(self):
+        data = {'date': datetime.date(2025, 3, 1), 'amount': 12.5, 'rows': [{'id': 1, 'category': None}], 3: 'x'}
+        expected = {'date': '2025-03-01', 'amount': 12.5, 'rows': [{'id': 1, 'category': None}], '3': 'x'}
+
+        self.assertEqual(json.loads(responses.dumps(data)), expected)
+        with mock.patch.object(responses, 'orjson', None):
+            self.assertEqual(json.loads(responses.dumps(data)), expected)
+            self.assertNotIn(b': ', responses.dumps(data))
+
+    def test_only_dicts_unless_unsafe(self):
+        with self.assertRaises(TypeError):
+            responses.JsonResponse([1, 2])
+        self.assertEqual(responses.JsonResponse([1, 2], safe=False).content, b'[1,2]')
+
+    def test_gzip_is_negotiated(self):
+        plain = self.post()
+        compressed = self.post(HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(compressed.content))['transactions'], plain.json()['transactions'])
+
+    @skipUnless(responses.brotli, "brotli is not installed")
+    def test_brotli_is_preferred_for_json(self):
+        response = self.post(HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(responses.brotli.decompress(response.content))['transactions']), 30)
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot Transaction queries must be answered from an index, not a full
+    table scan, on a table big enough for the planner to care.
+    """
+    USERS = 20
+    ROWS_PER_USER = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(uid=f'plan-{i}', email=f'plan{i}@example.com') for i in range(cls.USERS)]
+        start = datetime.date(2022, 1, 1)
+        Transaction.objects.bulk_create([
+            Transaction(user=user, transaction_type='credited' if i % 7 == 0 else 'debited', amount=i % 500,
+                        source='email', description=f'Shop {i % 300}', date=start + datetime.timedelta(days=i % 1000),
+                        # One row in fifty is still waiting for categorization.
+                        category=None if i % 50 == 0 else CATEGORIES[i % len(CATEGORIES)],
+                        gmail_message_id=f'{user.pk}-{i}')
+            for user in cls.users for i in range(cls.ROWS_PER_USER)
+        ], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = cls.users[3]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        # SQLite says "SCAN app_transaction" and PostgreSQL "Seq Scan on app_transaction"
+        # when they read the whole table.
+        self.assertNotRegex(plan, r'SCAN app_transaction(?! USING)|Seq Scan on app_transaction')
+
+    def test_dedup_window(self):
+        batch = TransactionBatch(self.user)
+        batch.add(alert_on('new-1', 120, 10))
+        self.assertUsesIndex(batch._existing(), 'transaction_user_date_idx')
+
+    def test_uncategorized_rows(self):
+        self.assertUsesIndex(Transaction.objects.filter(user=self.user, category__isnull=True),
+                             'transaction_user_category_idx')
+
+    def test_rollup_refresh(self):
+        self.assertUsesIndex(month_rows(self.user.pk, {(2022, 3), (2023, 7)}), 'transaction_user_date_idx')
+
+    def test_analysis_pages(self):
+        window = filter_window(Transaction.objects.filter(user=self.user),
+                               datetime.date(2022, 6, 1), datetime.date(2022, 9, 1))
+        after = Q(date__lt=datetime.date(2022, 7, 15)) | Q(date=datetime.date(2022, 7, 15), id__lt=10 ** 9)
+        for queryset in (window, window.filter(after)):
+            with self.subTest(cursor=queryset is not window):
+                self.assertUsesIndex(queryset.order_by('-date', '-id')[:51], 'transaction_user_date_idx')
+
+    def test_analysis_category_pages(self):
+        queryset = filter_window(Transaction.objects.filter(user=self.user), None, None, CATEGORIES[2])
+        self.assertUsesIndex(queryset.order_by('-date', '-id')[:51], 'transaction_user_category_idx')
+
+
+@override_settings(AI_INSIGHTS_WORKERS=1)
+class InsightsTests(TestCase):
+    def setUp(self):
+        caches['insights'].clear()
+        self.addCleanup(insights.shutdown)
+        self.models = []
+        self.release = threading.Event()
+        self.release.set()
+
+        self.fail = False
+
+        def model_factory(name):
+            model = FakeGenerativeModel(name, text=f'Tip {len(self.models) + 1}', fail=self.fail)
+            generate_content = model.generate_content
+            model.generate_content = lambda prompt: (self.release.wait(5), generate_content(prompt))[1]
+            self.models.append(model)
+            return model
+
+        patcher = mock.patch('app.gemini.generative_model', model_factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(AI_INSIGHTS_WAIT=5)
+    def test_unchanged_dashboard_reuses_the_answer(self):
+        user = create_user()
+        Transaction.objects.create(user=user, transaction_type='debited', amount=500, source='email',
+                                   description='Swiggy', category='Food & Dining')
+
+        for _ in range(3):
+            response = self.client.post(reverse('get-analysis'), {'uid': user.firebase_uid},
+                                        content_type='application/json')
+            self.assertEqual((response.json()['ai_insights'], response.json()['ai_insights_status']),
+                             ('Tip 1', 'ready'))
+        self.assertEqual(len(self.models), 1)
+
+    def test_misses_answer_immediately_and_refresh_in_the_background(self):
+        self.release.clear()
+        started = time.monotonic()
+        self.assertEqual(get_insights('prompt one', 'latest', wait=0), (PLACEHOLDER, 'pending'))
+        # A second request while it is being generated doesn't start another generation.
+        self.assertEqual(get_insights('prompt one', 'latest', wait=0), (PLACEHOLDER, 'pending'))
+        self.assertLess(time.monotonic() - started, 1)
+
+        self.release.set()
+        self.assertEqual(get_insights('prompt one', 'latest', wait=5), ('Tip 1', 'ready'))
+        self.assertEqual(len(self.models), 1)
+
+        # New numbers: the previous insight stands in until the new one is ready.
+        self.release.clear()
+        self.assertEqual(get_insights('prompt two', 'latest', wait=0), ('Tip 1', 'stale'))
+        self.release.set()
+        self.assertEqual(get_insights('prompt two', 'latest', wait=5), ('Tip 2', 'ready'))
+
+    def test_failures_are_not_retried_by_every_poll(self):
+        self.fail = True
+        self.assertEqual(get_insights('prompt', 'latest', wait=5), (UNAVAILABLE, 'unavailable'))
+        self.assertEqual(get_insights('prompt', 'latest', wait=0), (UNAVAILABLE, 'unavailable'))
+        self.assertEqual(len(self.models), 1)
+
+        with override_settings(AI_INSIGHTS_FAILURE_TTL=0):
+            caches['insights'].clear()
+            get_insights('prompt', 'latest', wait=5)
+            get_insights('prompt', 'latest', wait=5)
+        self.assertEqual(len(self.models), 3)
+
+    def test_dashboard_polls_only_the_insights(self):
+        user = create_user()
+        Transaction.objects.create(user=user, transaction_type='debited', amount=500, source='email',
+                                   description='Swiggy', category='Food & Dining')
+        self.release.clear()
+        analysis = self.client.get(reverse('get-analysis'), {'uid': user.firebase_uid}).json()
+        self.assertEqual(analysis['ai_insights_status'], 'pending')
+        token = analysis['ai_insights_poll']
+
+        self.release.set()
+        with mock.patch('app.views.analysis.summarize_reports') as summarize_reports:
+            for _ in range(50):
+                poll = self.client.get(reverse('ai-insights'), {'uid': user.firebase_uid, 'token': token}).json()
+                if poll['ai_insights_status'] != 'pending':
+                    break
+                time.sleep(0.1)
+        summarize_reports.assert_not_called()
+        self.assertEqual(poll, {'ai_insights': 'Tip 1', 'ai_insights_status': 'ready', 'ai_insights_poll': None})
+
+        other = create_user('uid-2')
+        response = self.client.get(reverse('ai-insights'), {'uid': other.firebase_uid, 'token': token})
+        self.assertEqual(response.status_code, 400)
+
+
+class GmailClientTests(TestCase):
+    def setUp(self):
+        self.cache = CredentialCache(margin=300)
+        self.refreshes = []
+
+        def refresh(creds, request):
+            self.refreshes.append(creds.refresh_token)
+            creds.token = f'fresh-{len(self.refreshes)}'
+            creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+        patcher = mock.patch('google.oauth2.credentials.Credentials.refresh', refresh)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def user(self, expires_in):
+        expiry = None if expires_in is None else timezone.now() + datetime.timedelta(seconds=expires_in)
+        return create_user(google_access_token='old', google_refresh_token='refresh', google_token_expiry=expiry)
+
+    def test_valid_credentials_are_reused_without_refreshing(self):
+        user = self.user(expires_in=3600)
+
+        first = self.cache.get(user)
+        self.assertIs(self.cache.get(BasicInfo.objects.get(pk=user.pk)), first)
+        self.assertEqual((first.token, self.refreshes), ('old', []))
+
+    def test_tokens_close_to_expiry_are_refreshed_once_and_saved(self):
+        for expires_in in (60, None):
+            with self.subTest(expires_in=expires_in):
+                BasicInfo.objects.all().delete()
+                self.refreshes.clear()
+                user = self.user(expires_in)
+
+                creds = self.cache.get(user)
+                self.cache.get(user)
+
+                self.assertEqual(self.refreshes, ['refresh'])
+                stored = BasicInfo.objects.get(pk=user.pk)
+                self.assertEqual(stored.google_access_token, creds.token)
+                self.assertGreater(stored.google_token_expiry, timezone.now() + datetime.timedelta(minutes=50))
+                # A refresh doesn't change what the dashboard shows, so it keeps its ETags.
+                self.assertEqual(stored.updated_at, user.updated_at)
+
+    def test_tokens_saved_elsewhere_replace_the_cached_ones(self):
+        user = self.user(expires_in=600)
+        self.cache.get(user)
+        # Another worker refreshed the token.
+        BasicInfo.objects.filter(pk=user.pk).update(google_access_token='other',
+                                                    google_token_expiry=timezone.now() + datetime.timedelta(hours=1))
+
+        self.assertEqual(self.cache.get(BasicInfo.objects.get(pk=user.pk)).token, 'other')
+        self.assertEqual(self.refreshes, [])
+
+    def test_services_share_the_parsed_discovery_document(self):
+        creds = self.cache.get(self.user(expires_in=3600))
+        with FakeGmailServer([make_message('m1', 'Rs. 10 debited')]) as server:
+            with mock.patch('googleapiclient.discovery_cache.get_static_doc', wraps=get_static_doc) as read_document:
+                services = [gmail_service_for(creds, root_url=server.root_url) for _ in range(3)]
+            profile = services[-1].users().getProfile(userId='me').execute()
+
+        self.assertEqual(read_document.call_count, 1)
+        self.assertIn('historyId', profile)
+
+
+@override_settings(FRONTEND_URL='https://moneyminder.example')
+class GoogleOAuthTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def state(self):
+        response = self.client.get(reverse('google_state'), {'uid': self.user.firebase_uid})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['state']
+
+    def callback(self, state):
+        return self.client.get(reverse('google_callback'), {'code': 'auth-code', 'state': state})
+
+    def assertFrontendRedirect(self, response, url):
+        self.assertRedirects(response, f'https://moneyminder.example{url}', fetch_redirect_response=False)
+
+    def test_callback_errors_redirect_to_the_frontend(self):
+        response = self.client.get(reverse('google_callback'), {'state': self.state()})
+
+        self.assertFrontendRedirect(response, '/?error=no_code')
+
+    def test_callback_saves_tokens_for_the_signed_state_user(self):
+        flow = mock.Mock()
+        flow.credentials = mock.Mock(token='access', refresh_token='refresh', expiry=None)
+        with mock.patch('app.views.google.oauth_flow', return_value=flow), \
+                mock.patch('app.views.google.gmail_service_for') as service:
+            service.return_value.users.return_value.getProfile.return_value.execute.return_value = {
+                'emailAddress': 'user@gmail.com'}
+            response = self.callback(self.state())
+
+        self.assertFrontendRedirect(response, '/?google_connected=1')
+        flow.fetch_token.assert_called_once_with(code='auth-code')
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.google_access_token, self.user.email), ('access', 'user@gmail.com'))
+
+    def test_forged_or_expired_states_are_refused(self):
+        with mock.patch('app.views.google.oauth_flow') as oauth_flow:
+            # The raw UID, as the SPA used to send it.
+            self.assertEqual(self.client.get(reverse('connect_google'), {'state': 'uid-1'}).status_code, 400)
+            self.assertFrontendRedirect(self.callback('uid-1'), '/?error=invalid_state')
+            state = self.state()
+            with override_settings(GOOGLE_OAUTH_STATE_MAX_AGE=-1):
+                self.assertFrontendRedirect(self.callback(state), '/?error=invalid_state')
+        oauth_flow.assert_not_called()
+
+    def test_connect_passes_the_state_to_google(self):
+        state = self.state()
+        with mock.patch('app.views.google.oauth_flow') as oauth_flow:
+            oauth_flow.return_value.authorization_url.return_value = ('https://accounts.google.com/o/oauth2/auth', state)
+            response = self.client.get(reverse('connect_google'), {'state': state})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(oauth_flow.return_value.authorization_url.call_args.kwargs['state'], state)
+
+    @override_settings(FIREBASE_PROJECT_ID='moneyminder-test')
+    def test_state_needs_an_id_token(self):
+        response = self.client.get(reverse('google_state'), {'uid': self.user.firebase_uid})
+
+        self.assertEqual(response.status_code, 401)
+
+
+def metric_value(text, sample):
+    """The value of one sample line of /metrics output, 0 if absent."""
+    for line in text.splitlines():
+        name, _, value = line.rpartition(' ')
+        if name == sample:
+            return float(value)
+    return 0.0
+
+
+class InstrumentationTests(TestCase):
+    def metrics(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_sync_spans_and_counters_are_exported(self):
+        user = create_user()
+        before = self.metrics()
+        with FakeGmailServer([transaction_email(i) for i in range(30)]) as server:
+            stats = GmailSyncEngine(server.build_service(), user).run()
+        after = self.metrics()
+
+        for name in ('gmail_list', 'gmail_get', 'body_decode', 'extraction', 'dedup', 'db_write'):
+            sample = f'moneyminder_span_seconds_count{{span="{name}",outcome="ok"}}'
+            with self.subTest(span=name):
+                self.assertGreater(metric_value(after, sample), metric_value(before, sample))
+        saved = 'moneyminder_events_total{event="sync_messages_saved"}'
+        self.assertEqual(metric_value(after, saved) - metric_value(before, saved), stats['saved'])
+        self.assertIn('moneyminder_http_request_seconds_bucket{view="metrics",method="GET",status="200",le="+Inf"}',
+                      self.metrics())
+
+    def test_every_middleware_runs_natively_under_asgi(self):
+        # One sync-only middleware makes ASGI run the whole stack in a thread.
+        self.assertEqual([path for path in settings.MIDDLEWARE
+                          if not getattr(import_string(path), 'async_capable', False)], [])
+
+    async def test_asgi_requests_are_recorded(self):
+        sample = 'moneyminder_http_request_seconds_count{view="metrics",method="GET",status="200"}'
+        before = metric_value((await self.async_client.get(reverse('metrics'))).content.decode(), sample)
+        after = metric_value((await self.async_client.get(reverse('metrics'))).content.decode(), sample)
+
+        self.assertEqual(after, before + 1)
+
+    def test_spans_record_failures(self):
+        sample = 'moneyminder_span_seconds_count{span="test_failing",outcome="error"}'
+        with self.assertRaises(ValueError), span('test_failing'):
+            raise ValueError('boom')
+        self.assertEqual(metric_value(self.metrics(), sample), 1)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_record_nothing(self):
+        with span('test_disabled'):
+            pass
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with override_settings(METRICS_ENABLED=True):
+            self.assertNotIn('test_disabled', self.metrics())
+
+    def test_log_records_are_json_with_extra_fields(self):
+        record = logging.LogRecord('app.sync', logging.WARNING, __file__, 1, 'Error processing message', (), None)
+        record.message_id = 'm1'
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual((entry['level'], entry['logger'], entry['message'], entry['message_id']),
+                         ('WARNING', 'app.sync', 'Error processing message', 'm1'))
+
+
+class BenchmarkHarnessTests(TestCase):
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 0.5), percentile(values, 0.95), percentile(values, 1)), (50, 95, 100))
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_sync_pipeline_reports_every_stage(self):
+        result = sync_pipeline(messages=40, runs=1)
+
+        self.assertGreater(result['saved'], 0)
+        self.assertGreater(result['peak_kib'], 0)
+        self.assertLessEqual({'gmail_list', 'gmail_get', 'body_decode', 'extraction', 'dedup', 'db_write'},
+                             set(result['stages']))
+
+    def test_analysis_pipeline_replays_without_live_services(self):
+        result = analysis_pipeline(transactions=[300], requests=2)['300']
+
+        self.assertEqual(result['dashboard_month']['count'], 2)
+        self.assertLess(result['dashboard_month']['queries'], 10)
+        self.assertEqual(result['transaction_pages']['count'], 2)
+        self.assertIn('gemini_insights', result['stages'])
+
+
+class StartupTests(SimpleTestCase):
+    # django.setup() plus the URLconf in a fresh interpreter: about 450 ms
+    # here, with headroom so slower machines don't flake.
+    BOOT_BUDGET_MS = 1000
+    LAZY_MODULES = ('google.generativeai', 'googleapiclient.discovery', 'googleapiclient.errors',
+                    'google_auth_oauthlib.flow', 'google.oauth2.credentials', 'google_auth_httplib2',
+                    'httplib2', 'httpx')
+    # Only needed once a request categorizes or encodes a response.
+    SETUP_FREE_MODULES = ('numpy', 'orjson', 'app.categorization')
+
+    def test_setup_and_urlconf_within_budget(self):
+        seconds, modules = boot_time('Backend.urls')
+
+        self.assertLess(seconds * 1000, self.BOOT_BUDGET_MS)
+        self.assertEqual([name for name in self.LAZY_MODULES if name in modules], [])
+
+    def test_setup_leaves_heavy_modules_unloaded(self):
+        _, modules = boot_time()
+
+        self.assertEqual([name for name in self.SETUP_FREE_MODULES if name in modules], [])
+
+
+def make_signing_key(kid):
+    """A (google.auth signer, {kid: PEM certificate}) pair for test ID tokens."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+    from google.auth import crypt
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'securetoken.system.gserviceaccount.com')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    return crypt.RSASigner.from_string(pem, key_id=kid), {kid: cert.public_bytes(serialization.Encoding.PEM).decode()}
+
+
+@override_settings(FIREBASE_PROJECT_ID='moneyminder-test')
+class FirebaseAuthTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signer, cls.certs = make_signing_key('key-1')
+
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user('uid-2')
+        self.fetches = []
+        keys = firebase_auth.PublicKeys(fetch=lambda url: self.fetches.append(url) or (self.certs, 3600))
+        patcher = mock.patch('app.firebase_auth.public_keys', keys)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        firebase_auth.verifier.clear()
+        self.addCleanup(firebase_auth.verifier.clear)
+
+    def token(self, signer=None, **claims):
+        from google.auth import jwt
+
+        now = int(time.time())
+        payload = {'iss': 'https://securetoken.google.com/moneyminder-test', 'aud': 'moneyminder-test',
+                   'sub': self.user.firebase_uid, 'iat': now, 'exp': now + 3600, 'auth_time': now}
+        payload.update(claims)
+        return jwt.encode(signer or self.signer, payload).decode()
+
+    def get_user(self, token=None, uid=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.post(reverse('get-user-details'), {'uid': uid or self.user.firebase_uid},
+                                content_type='application/json', headers=headers)
+
+    def test_requests_act_for_the_token_user(self):
+        # The UID in the body no longer picks the user.
+        response = self.get_user(self.token(), uid=self.other.firebase_uid)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], self.user.email)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_missing_or_invalid_tokens_are_rejected(self):
+        now = int(time.time())
+        other_signer, _ = make_signing_key('key-1')
+        for token in (None, 'not-a-token', self.token(aud='someone-else'), self.token(exp=now - 3600, iat=now - 7200),
+                      self.token(iss='https://securetoken.google.com/someone-else'), self.token(sub=''),
+                      self.token(signer=other_signer)):
+            with self.subTest(token=token):
+                response = self.get_user(token)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    async def test_asgi_requests_are_authenticated(self):
+        headers = {'Authorization': f'Bearer {self.token()}'}
+        url = reverse('get-user-details')
+
+        response = await self.async_client.get(url, {'uid': self.other.firebase_uid}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], self.user.email)
+        # Verified before, so this one is answered from the token cache.
+        with mock.patch('app.firebase_auth.decode_token') as decode_token:
+            self.assertEqual((await self.async_client.get(url, headers=headers)).status_code, 200)
+        decode_token.assert_not_called()
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+    def test_tokens_and_profiles_are_cached(self):
+        token = self.token()
+        self.get_user(token)
+
+        with mock.patch('app.firebase_auth.decode_token') as decode_token, self.assertNumQueries(0):
+            response = self.get_user(token)
+        decode_token.assert_not_called()
+        self.assertEqual(response.json()['full_name'], 'Test User')
+        self.assertEqual(len(self.fetches), 1)
+
+        # Saving the profile drops it from the cache.
+        self.user.full_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.get_user(token).json()['full_name'], 'Renamed')
+
+    def test_certificates_are_refetched_when_their_max_age_runs_out(self):
+        keys = firebase_auth.public_keys
+        now = time.time()
+
+        self.assertEqual(keys.get('key-1', now), self.certs)
+        keys.get('key-1', now + 3599)
+        self.assertEqual(len(self.fetches), 1)
+        keys.get('key-1', now + 3600)
+        self.assertEqual(len(self.fetches), 2)
+        # An unknown key ID refetches, at most once a minute.
+        keys.get('key-2', now + 3601)
+        keys.get('key-2', now + 3630)
+        self.assertEqual(len(self.fetches), 2)
+        keys.get('key-2', now + 3660)
+        self.assertEqual(len(self.fetches), 3)
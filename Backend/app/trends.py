@@ -0,0 +1,245 @@
+"""
+Spending trends for the analysis dashboard.
+
+A user's transactions are read with one query into columns: NumPy arrays of
+dates (days since 1970-01-01), amounts, debit/credit flags and category
+codes. Every series is then computed with array operations, never a Python
+loop over transactions or another query: monthly credited/debited totals
+with a rolling average of spending, the month-over-month change per
+category, recurring payments and a forecast of next month's spending.
+"""
+import datetime
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .analysis import filter_window
+from .models import Transaction
+from .rollups import month_range
+
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+UNCATEGORIZED = 'Uncategorized'
+ROLLING_MONTHS = 3
+FORECAST_MONTHS = 6
+
+# (name, typical days between payments, allowed drift in days)
+PERIODS = (
+    ('weekly', 7, 1.5),
+    ('monthly', 30.44, 3.5),
+    ('quarterly', 91.31, 7),
+    ('yearly', 365.25, 10),
+)
+
+
+class TransactionColumns:
+    """
+    A user's transactions as parallel arrays in date order. `categories`
+    holds the name of each category code; `descriptions` is indexed like the
+    arrays but only read for the few rows that end up in a result.
+    """
+
+    def __init__(self, days, amounts, debits, credits, category_codes, categories, descriptions):
+        self.days = days
+        # Months since January 1970
+        self.months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+        self.amounts = amounts
+        self.debits = debits
+        self.credits = credits
+        self.category_codes = category_codes
+        self.categories = categories
+        self.descriptions = descriptions
+
+    def __len__(self):
+        return len(self.days)
+
+
+def load_columns(user_id, start=None, end=None):
+    """The user's transactions dated in [start, end) as TransactionColumns."""
+    rows = list(filter_window(Transaction.objects.filter(user_id=user_id), start, end)
+                .order_by('date', 'id')
+                .values_list('date', 'amount', 'transaction_type', 'category', 'description'))
+    if not rows:
+        empty = np.zeros(0, dtype=bool)
+        return TransactionColumns(np.zeros(0, dtype=np.int32), np.zeros(0), empty, empty,
+                                  np.zeros(0, dtype=np.int32), [], [])
+    dates, amounts, types, categories, descriptions = zip(*rows)
+    types = np.array(types, dtype=object)
+    index = {}
+    codes = np.fromiter((index.setdefault(category, len(index)) for category in categories), np.int32, len(rows))
+    return TransactionColumns(
+        days=np.fromiter(map(datetime.date.toordinal, dates), np.int32, len(rows)) - EPOCH,
+        amounts=np.array(amounts, dtype=np.float64),
+        debits=types == 'debited',
+        credits=types == 'credited',
+        category_codes=codes,
+        categories=[category or UNCATEGORIZED for category in index],
+        descriptions=descriptions,
+    )
+
+
+def month_number(date):
+    return (date.year - 1970) * 12 + date.month - 1
+
+
+def month_label(month):
+    return f'{1970 + month // 12}-{month % 12 + 1:02d}'
+
+
+def _date(day):
+    return datetime.date.fromordinal(int(day) + EPOCH)
+
+
+def monthly_totals(columns, first, last):
+    """(credited, debited): arrays of the totals of each month from `first` to `last` inclusive."""
+    months = last - first + 1
+    index = columns.months - first
+    credited = np.bincount(index, weights=np.where(columns.credits, columns.amounts, 0), minlength=months)
+    debited = np.bincount(index, weights=np.where(columns.debits, columns.amounts, 0), minlength=months)
+    return credited[:months], debited[:months]
+
+
+def rolling_mean(values, window=ROLLING_MONTHS):
+    """The mean of each value and up to `window` - 1 before it."""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def category_changes(columns, first, month):
+    """Debits per category in `month` and the month before it, largest change first."""
+    previous = month - 1
+    n_categories = len(columns.categories)
+    index = columns.months - first
+    in_range = columns.debits & (index >= previous - first) & (index <= month - first)
+    totals = np.bincount((index[in_range] - (previous - first)) * n_categories + columns.category_codes[in_range],
+                         weights=columns.amounts[in_range], minlength=2 * n_categories).reshape(2, n_categories)
+    change = totals[1] - totals[0]
+    changes = []
+    for code in np.argsort(-np.abs(change), kind='stable'):
+        before, now = totals[0, code], totals[1, code]
+        if not before and not now:
+            continue
+        changes.append({
+            'category': columns.categories[code],
+            'current': round(float(now), 2),
+            'previous': round(float(before), 2),
+            'change': round(float(change[code]), 2),
+            'change_pct': round(float(change[code] / before * 100), 1) if before else None,
+        })
+    return changes
+
+
+def recurring_payments(columns, as_of, min_occurrences=3):
+    """
+    Debits repeated for the same amount in the same category at a steady
+    weekly, monthly, quarterly or yearly rhythm, and not lapsed as of the day
+    `as_of` (days since 1970-01-01). Largest amounts first.
+    """
+    rows = np.flatnonzero(columns.debits)
+    if not len(rows):
+        return []
+    paise = np.rint(columns.amounts[rows] * 100).astype(np.int64)
+    keys = columns.category_codes[rows].astype(np.int64) << 40 | paise
+    order = np.lexsort((columns.days[rows], keys))
+    rows, keys, days = rows[order], keys[order], columns.days[rows][order]
+
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.concatenate((starts, [len(keys)])))
+    group = np.repeat(np.arange(len(starts)), counts)
+    same = group[1:] == group[:-1]
+    gaps, gap_group = np.diff(days)[same].astype(np.float64), group[1:][same]
+    n_gaps = np.bincount(gap_group, minlength=len(starts))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(gap_group, weights=gaps, minlength=len(starts)) / n_gaps
+        spread = np.sqrt(np.maximum(np.bincount(gap_group, weights=gaps * gaps, minlength=len(starts)) / n_gaps
+                                    - mean * mean, 0))
+    lasts = starts + counts - 1
+
+    payments = []
+    for name, period, drift in PERIODS:
+        matches = np.flatnonzero((counts >= min_occurrences) & (np.abs(mean - period) <= drift)
+                                 & (spread <= drift) & (days[lasts] >= as_of - 2 * period))
+        for g in matches:
+            row, last = rows[lasts[g]], days[lasts[g]]
+            payments.append({
+                'description': columns.descriptions[row],
+                'category': columns.categories[columns.category_codes[row]],
+                'amount': round(float(columns.amounts[row]), 2),
+                'frequency': name,
+                'occurrences': int(counts[g]),
+                'last_date': _date(last),
+                'next_date': _date(last + round(mean[g])),
+            })
+    payments.sort(key=lambda payment: -payment['amount'])
+    return payments
+
+
+def forecast(debited, months=FORECAST_MONTHS):
+    """
+    Next month's spending from the last `months` monthly totals: a least
+    squares trend line extended by a month, or their mean with fewer than
+    three months. Never negative.
+    """
+    recent = debited[-months:]
+    if not len(recent):
+        return 0.0
+    if len(recent) < 3:
+        return float(recent.mean())
+    slope, intercept = np.polyfit(np.arange(len(recent)), recent, 1)
+    return max(0.0, float(slope * len(recent) + intercept))
+
+
+def month_window(end=None, months=None, today=None):
+    """
+    The (first, last) month numbers of the `months` calendar months (default
+    ANALYTICS_MONTHS) ending with the one before `end`, or with the current
+    month when `end` is None.
+    """
+    months = months or settings.ANALYTICS_MONTHS
+    today = today or timezone.localdate()
+    last = month_number(min(end - datetime.timedelta(days=1), today) if end else today)
+    return last - months + 1, last
+
+
+def compute_trends(columns, first, last, today):
+    """
+    The dashboard trends of `columns` for months `first` to `last`. A month
+    still in progress on `today` is shown in the series but left out of
+    category changes and the forecast.
+    """
+    end_date = month_range(1970 + last // 12, last % 12 + 1)[1]
+    credited, debited = monthly_totals(columns, first, last)
+    average = rolling_mean(debited)
+    complete = last if end_date <= today else last - 1
+    complete_debits = debited[:complete - first + 1]
+    return {
+        'months': [
+            {'month': month_label(first + i), 'credited': c, 'debited': d, 'net': n, 'debited_average': a}
+            for i, (c, d, n, a) in enumerate(zip(
+                np.round(credited, 2).tolist(), np.round(debited, 2).tolist(),
+                np.round(credited - debited, 2).tolist(), np.round(average, 2).tolist(),
+            ))
+        ],
+        'category_changes': {
+            'month': month_label(complete),
+            'previous_month': month_label(complete - 1),
+            'categories': category_changes(columns, first, complete) if complete > first else [],
+        },
+        'recurring': recurring_payments(columns, min(end_date, today).toordinal() - EPOCH),
+        'forecast': {
+            'month': month_label(complete + 1),
+            'debited': round(forecast(complete_debits), 2),
+            'based_on_months': min(len(complete_debits), FORECAST_MONTHS),
+        },
+    }
+
+
+def summarize_trends(user_id, end=None, months=None, today=None):
+    """The user's dashboard trends over month_window(end, months)."""
+    today = today or timezone.localdate()
+    first, last = month_window(end, months, today)
+    columns = load_columns(user_id, month_range(1970 + first // 12, first % 12 + 1)[0],
+                           month_range(1970 + last // 12, last % 12 + 1)[1])
+    return compute_trends(columns, first, last, today)
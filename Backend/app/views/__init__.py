@@ -0,0 +1,16 @@
+"""
+The app's views, one module per concern. Each module imports only what its
+own views need, and the Google and Gemini client libraries are imported on
+first use (see app.gmail_client and app.gemini), so loading the URLconf
+stays cheap for every worker and management command.
+"""
+from .analysis import get_ai_insights, get_financial_analysis
+from .google import connect_google, google_callback, google_state
+from .metrics import metrics
+from .profile import get_user, register_user
+from .sync import async_sync, manual_sync, sync_status
+
+__all__ = [
+    'async_sync', 'connect_google', 'get_ai_insights', 'get_financial_analysis', 'get_user', 'google_callback',
+    'google_state', 'manual_sync', 'metrics', 'register_user', 'sync_status',
+]
@@ -0,0 +1,155 @@
+import datetime
+import json
+
+from django.core import signing
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from ..analysis import filter_window, parse_limit, parse_window, transaction_page
+from ..categorization import categorize_transactions
+from ..conditional import not_modified, set_validators, user_version
+from ..firebase_auth import request_profile, request_uid
+from ..insights import build_prompt as build_insights_prompt, get_insights, poll_insights, poll_token
+from ..instrumentation import span
+from ..models import BasicInfo, Transaction
+from ..responses import JsonResponse
+from ..rollups import summarize as summarize_reports
+from ..routers import replica_reads
+from ..trends import summarize_trends
+
+
+@csrf_exempt
+def get_financial_analysis(request):
+    """
+    Performs AI-powered categorization and generates financial insights 
+    for a window of the user's transaction history.
+
+    The window and the page of transactions are selected as described in
+    app.analysis; `category` narrows the transaction list. Requests with a
+    `cursor` only fetch the next page of transactions.
+
+    Parameters come in a JSON POST body or, cacheably, in a GET query
+    string: GET responses carry an ETag of the user's data version (see
+    app.conditional) and a matching If-None-Match gets a 304 before any
+    other work. Responses whose insights are still being generated get no
+    ETag, and an `ai_insights_poll` token for get_ai_insights instead.
+
+    The user is the signed-in one (see app.firebase_auth); reads go to the
+    read replica, if there is one (see app.routers).
+    """
+    if request.method not in ('GET', 'POST'):
+        return JsonResponse({'error': 'Only GET and POST requests are allowed'}, status=405)
+
+    version = None
+    try:
+        data = request.GET.dict() if request.method == 'GET' else json.loads(request.body)
+        uid = request_uid(request, data)
+        if not uid:
+            return JsonResponse({'error': 'UID is required.'}, status=400)
+        start, end = parse_window(data)
+        limit = parse_limit(data.get('limit'))
+
+        if request.method == 'GET':
+            # The response also depends on the date: `daily`, the current month.
+            params = (sorted(data.items()), timezone.localdate().isoformat())
+            version = user_version(uid)
+            if version is not None:
+                response = not_modified(request, version.etag(*params), version.last_modified)
+                if response is not None:
+                    return response
+
+        def respond(payload, cacheable=True):
+            response = JsonResponse(payload, safe=False)
+            if version is not None and cacheable:
+                set_validators(response, version.etag(*params), version.last_modified)
+            return response
+
+        user = request_profile(request, uid)
+        reads = replica_reads(user)
+        transactions = Transaction.objects.filter(user=user)
+        page = filter_window(transactions, start, end, data.get('category'))
+
+        if data.get('cursor'):
+            with reads:
+                rows, next_cursor = transaction_page(page, data['cursor'], limit)
+            return respond({'transactions': rows, 'next_cursor': next_cursor})
+
+        with reads:
+            has_transactions = transactions.exists()
+        if not has_transactions:
+            return respond({
+                'message': 'No transactions found. Sync your emails to get started!',
+                'transactions': [],
+                'next_cursor': None,
+                'ai_insights': "I can't provide any analysis without transaction data. Please sync your emails to get started."
+            })
+
+    except BasicInfo.DoesNotExist:
+        return JsonResponse({'error': 'User not found.'}, status=404)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    with reads:
+        # --- Step 1: Categorize Uncategorized Transactions ---
+        categorized = categorize_transactions(transactions.filter(category__isnull=True))
+        if version is not None and categorized:
+            # Tag the response with the version after categorizing, which the
+            # next request will see.
+            version = user_version(uid)
+
+        # --- Step 2: Aggregate Data for Charts (from the monthly rollups) ---
+        pie_data, category_spending = summarize_reports(user.pk, start, end)
+        rows, next_cursor = transaction_page(page, limit=limit)
+        with span('trends'):
+            trends = summarize_trends(user.pk, end)
+
+    # --- Step 3: AI Insights (cached by prompt, generated in the background) ---
+    prompt = build_insights_prompt(user.salary, pie_data.get('total_credited') or 0,
+                                   pie_data.get('total_debited') or 0, category_spending)
+    latest_key = f'insights:latest:{user.pk}:{start}:{end}'
+    ai_insights, ai_insights_status = get_insights(prompt, latest_key)
+    in_progress = ai_insights_status in ('pending', 'stale')
+
+    # --- Step 4: Consolidate and Respond ---
+    return respond({
+        'window': {
+            'start_date': start,
+            'end_date': end and end - datetime.timedelta(days=1),
+        },
+        'pie_chart_data': {
+            'credited': pie_data.get('total_credited') or 0,
+            'debited': pie_data.get('total_debited') or 0,
+        },
+        'bar_chart_data': list(category_spending),
+        'trends': trends,
+        'transactions': rows,
+        'next_cursor': next_cursor,
+        'ai_insights': ai_insights,
+        'ai_insights_status': ai_insights_status,
+        'ai_insights_poll': poll_token(uid, prompt, latest_key) if in_progress else None,
+    }, cacheable=ai_insights_status == 'ready')
+
+
+def get_ai_insights(request):
+    """
+    The dashboard's poll for insights still being generated: answers the
+    `ai_insights_poll` token of an analysis response with the same
+    `ai_insights`, `ai_insights_status` and `ai_insights_poll` fields, from
+    the insights cache alone.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET requests are allowed'}, status=405)
+    uid = request_uid(request, request.GET)
+    if not uid or not request.GET.get('token'):
+        return JsonResponse({'error': 'UID and token are required.'}, status=400)
+    try:
+        text, status = poll_insights(uid, request.GET['token'])
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Invalid or expired token.'}, status=400)
+    return JsonResponse({
+        'ai_insights': text,
+        'ai_insights_status': status,
+        'ai_insights_poll': request.GET['token'] if status in ('pending', 'stale') else None,
+    })
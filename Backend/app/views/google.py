@@ -0,0 +1,139 @@
+import datetime
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.shortcuts import redirect
+
+from ..firebase_auth import request_profile, request_uid
+from ..gmail_client import credential_cache, gmail_service_for, oauth_flow
+from ..models import BasicInfo
+from ..responses import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+STATE_SALT = 'app.views.google.oauth-state'
+
+
+def frontend_redirect(path='/', **params):
+    """Redirects the browser to `path` of the React app (FRONTEND_URL) with `params` in the query string."""
+    query = f'?{urlencode(params)}' if params else ''
+    return redirect(f'{settings.FRONTEND_URL}{path}{query}')
+
+
+def state_uid(state):
+    """The Firebase UID signed into an OAuth state by google_state, or None if it is forged or expired."""
+    try:
+        return signing.loads(state or '', salt=STATE_SALT, max_age=settings.GOOGLE_OAUTH_STATE_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def google_state(request):
+    """
+    Returns an OAuth state for the signed-in user: their Firebase UID, signed
+    and valid for GOOGLE_OAUTH_STATE_MAX_AGE seconds. The browser navigates
+    to connect_google without an ID token, so the UID the callback saves
+    Google's tokens for comes from this authenticated API call.
+    """
+    if request.method != 'GET':
+        return JsonResponse({"status": "error", "message": "Invalid request method."}, status=405)
+    firebase_uid = request_uid(request, request.GET)
+    if not firebase_uid:
+        return JsonResponse({"status": "error", "message": "Firebase UID is required"}, status=400)
+    try:
+        request_profile(request, firebase_uid)
+    except BasicInfo.DoesNotExist:
+        return JsonResponse({"status": "error", "message": "User not found."}, status=404)
+    return JsonResponse({"state": signing.dumps(firebase_uid, salt=STATE_SALT)})
+
+
+def connect_google(request):
+    """
+    Initiates the Google OAuth flow with the state from google_state.
+    """
+    state = request.GET.get('state')
+    firebase_uid = state_uid(state)
+    if not firebase_uid:
+        return JsonResponse({"status": "error", "message": "A valid state from the state endpoint is required"},
+                            status=400)
+
+    flow = oauth_flow()
+
+    # Google hands the state back to the callback unchanged
+    auth_url, _ = flow.authorization_url(
+        access_type='offline',
+        prompt='consent',
+        state=state,
+        include_granted_scopes='true'
+    )
+
+    logger.debug("Initiating Google OAuth", extra={'uid': firebase_uid})
+    return redirect(auth_url)
+
+
+def google_callback(request):
+    """
+    Handles the callback from Google, exchanges the code for tokens,
+    and saves them to the user's profile using the Firebase UID signed
+    into the state.
+    """
+    code = request.GET.get("code")
+    firebase_uid = state_uid(request.GET.get("state"))
+
+    if not code:
+        logger.error("No code parameter in Google callback")
+        return frontend_redirect(error='no_code')
+
+    if not firebase_uid:
+        logger.warning("Invalid or expired state in Google callback")
+        return frontend_redirect(error='invalid_state')
+
+    try:
+        # Initialize the OAuth flow
+        flow = oauth_flow()
+
+        # Exchange the authorization code for tokens
+        flow.fetch_token(code=code)
+        credentials = flow.credentials
+
+        if not credentials or not credentials.token:
+            logger.error("Failed to obtain access token", extra={'uid': firebase_uid})
+            return frontend_redirect(error='token_failure')
+
+        # Get user's email from Google to identify them in our database
+        gmail_service = gmail_service_for(credentials)
+        profile = gmail_service.users().getProfile(userId='me').execute()
+        email = profile['emailAddress']
+
+        # Try to find the user by Firebase UID
+        try:
+            user = BasicInfo.objects.get(firebase_uid=firebase_uid)
+
+            # Update user's tokens, email, and sync time
+            user.google_access_token = credentials.token
+            user.google_refresh_token = credentials.refresh_token
+            user.google_token_expiry = credentials.expiry and credentials.expiry.replace(tzinfo=datetime.timezone.utc)
+            user.email = email  # Update email in case it changed
+            user.last_email_sync = datetime.datetime.now(datetime.timezone.utc)
+            user.save(update_fields=[
+                'google_access_token',
+                'google_refresh_token',
+                'google_token_expiry',
+                'email',
+                'last_email_sync',
+                'updated_at',
+            ])
+            credential_cache.forget(user.pk)
+
+            logger.info("Updated user tokens and sync time", extra={'uid': firebase_uid})
+            return frontend_redirect(google_connected=1)
+
+        except BasicInfo.DoesNotExist:
+            logger.warning("No user for Google callback", extra={'uid': firebase_uid})
+            return frontend_redirect('/register', error='user_not_found')
+
+    except Exception as e:
+        logger.exception("Google callback error", extra={'uid': firebase_uid})
+        return frontend_redirect(error='auth_failed', details=str(e))
@@ -0,0 +1,10 @@
+from django.http import Http404, HttpResponse
+
+from ..instrumentation import enabled as metrics_enabled, render as render_metrics
+
+
+def metrics(request):
+    """This process's metrics in the Prometheus text exposition format."""
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,82 @@
+import json
+
+from django.views.decorators.csrf import csrf_exempt
+
+from ..conditional import not_modified, set_validators, user_version
+from ..firebase_auth import request_profile, request_uid
+from ..models import BasicInfo
+from ..responses import JsonResponse
+
+
+@csrf_exempt
+def register_user(request):
+    """
+    Creates a user profile in the database after successful 
+    Firebase registration on the frontend.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        # Ensure UID is present
+        firebase_uid = request_uid(request, data, 'firebase_uid')
+        if not firebase_uid:
+            return JsonResponse({'status': 'error', 'message': 'Firebase UID is required.'}, status=400)
+
+        # Create the user profile
+        BasicInfo.objects.create(
+            firebase_uid=firebase_uid,
+            full_name=data.get('full_name'),
+            email=data.get('email'),
+            occupation=data.get('occupation'),
+            salary=data.get('salary'),
+            marital_status=data.get('marital_status'),
+            gender=data.get('gender'),
+        )
+        return JsonResponse({"status": "success", "message": "Profile created successfully."})
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+
+@csrf_exempt
+def get_user(request):
+    """
+    Retrieves user profile details from the database.
+
+    The UID comes in a JSON POST body or in a GET query string; GET
+    responses carry an ETag, and a matching If-None-Match gets a 304
+    (see app.conditional).
+    """
+    if request.method not in ('GET', 'POST'):
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+    
+    try:
+        data = request.GET.dict() if request.method == 'GET' else json.loads(request.body)
+        uid = request_uid(request, data)
+        if not uid:
+            return JsonResponse({'status': 'error', 'message': 'User UID is required.'}, status=400)
+
+        version = user_version(uid) if request.method == 'GET' else None
+        if version is not None:
+            response = not_modified(request, version.etag('profile'), version.last_modified)
+            if response is not None:
+                return response
+
+        user = request_profile(request, uid)
+        response = JsonResponse({
+            'full_name': user.full_name,
+            'email': user.email,
+            'gender': user.gender,
+            'occupation': user.occupation,
+            'salary': user.salary,
+            'marital_status': user.marital_status,
+            'google_access_token': user.google_access_token
+        })
+        if version is not None:
+            set_validators(response, version.etag('profile'), version.last_modified)
+        return response
+    except BasicInfo.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'User not found.'}, status=404)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
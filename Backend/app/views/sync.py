@@ -0,0 +1,126 @@
+import json
+import logging
+
+from django.views.decorators.csrf import csrf_exempt
+
+from ..firebase_auth import request_profile, request_uid
+from ..jobs import enqueue_sync
+from ..models import BasicInfo, SyncJob
+from ..responses import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+
+@csrf_exempt
+def manual_sync(request):
+    """
+    Queues a transactional email sync for the logged-in user.
+    The sync itself runs in the background worker (manage.py run_sync_worker);
+    poll the sync status endpoint with the returned job ID for progress.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        uid = request_uid(request, data)
+        if not uid:
+            return JsonResponse({'status': 'error', 'message': 'User UID is required.'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON data'}, status=400)
+
+    try:
+        user = request_profile(request, uid)
+    except BasicInfo.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'User not found.'}, status=404)
+
+    if not user.google_access_token or not user.google_refresh_token:
+        return JsonResponse({
+            'status': 'error', 
+            'message': 'Google account not connected. Please connect your account first.'
+        }, status=400)
+
+    job = enqueue_sync(user)
+    logger.info("Sync job queued", extra={'job_id': job.pk, 'job_status': job.status, 'uid': uid})
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Sync started. New transactions will appear shortly.',
+        'job_id': job.pk,
+        'job_status': job.status,
+    }, status=202)
+
+
+@csrf_exempt
+async def async_sync(request):
+    """
+    Runs a Gmail sync for the user inside the request and returns its stats.
+    Served by the ASGI application: the sync awaits Gmail and the database
+    on the event loop instead of holding a worker thread.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+        uid = request_uid(request, data)
+        if not uid:
+            return JsonResponse({'status': 'error', 'message': 'User UID is required.'}, status=400)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON data'}, status=400)
+
+    try:
+        user = await BasicInfo.objects.aget(firebase_uid=uid)
+    except BasicInfo.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'User not found.'}, status=404)
+
+    if not user.google_access_token or not user.google_refresh_token:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Google account not connected. Please connect your account first.'
+        }, status=400)
+
+    from ..async_sync import SyncInProgress, sync_user
+
+    try:
+        stats = await sync_user(user)
+    except SyncInProgress:
+        return JsonResponse({'status': 'error', 'message': 'A sync is already running for this account.'},
+                            status=409)
+    except Exception as e:
+        logger.exception("Async sync failed", extra={'uid': uid})
+        return JsonResponse({'status': 'error', 'message': f'Sync failed: {str(e)}'}, status=500)
+
+    return JsonResponse({'status': 'success', 'message': 'Sync completed.', 'stats': stats})
+
+
+def sync_status(request, job_id):
+    """
+    Returns the status and progress of one of the user's sync jobs.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method.'}, status=405)
+
+    uid = request_uid(request, request.GET)
+    if not uid:
+        return JsonResponse({'status': 'error', 'message': 'User UID is required.'}, status=400)
+
+    try:
+        job = SyncJob.objects.get(pk=job_id, user__firebase_uid=uid)
+    except SyncJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Sync job not found.'}, status=404)
+
+    progress = job.progress or {}
+    response = {
+        'job_id': job.pk,
+        'job_status': job.status,
+        'progress': progress,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == SyncJob.SUCCEEDED:
+        response['message'] = f"Sync complete. Found {progress.get('saved', 0)} new transaction(s)."
+    elif job.status == SyncJob.FAILED:
+        response['message'] = 'An unexpected error occurred during sync.'
+        response['details'] = job.error
+    return JsonResponse(response)
@@ -0,0 +1,5 @@
+"""
+Stand-ins for Gmail and Gemini and synthetic data for the test suite and
+`manage.py benchmark`. Kept out of the app package: nothing the server runs
+imports it.
+"""
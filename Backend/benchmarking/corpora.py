@@ -0,0 +1,282 @@
+"""
+Synthetic mail and transaction descriptions for the test suite and the
+benchmarks, plus the extractor and body decoder as they were before
+app.extraction and app.mime, kept as references to check and time the
+current ones against.
+"""
+import base64
+import datetime
+import json
+import os
+import random
+import re
+
+from .fake_gmail import make_message
+
+LABELED_DESCRIPTIONS = os.path.join(os.path.dirname(__file__), 'labeled_descriptions.json')
+
+
+def synthetic_alert_messages(count, prefix='bench'):
+    """Bank alert emails with distinct amounts spread over the last year."""
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    messages = []
+    for i in range(count):
+        sent = start + datetime.timedelta(hours=8 * i)
+        messages.append(make_message(
+            f'{prefix}{i}',
+            f'Dear Customer, Rs. {100 + i}.50 has been debited from your account via UPI.',
+            subject='Transaction alert',
+            sender='alerts@hdfcbank.net',
+            internal_date=int(sent.timestamp() * 1000),
+        ))
+    return messages
+
+
+BANK_ALERT_TEMPLATES = (
+    "Dear Customer, Rs.{amount} has been debited from account **{acct} to VPA {vpa} on {dmy}. "
+    "UPI Ref No {ref}. Not you? Call 18002586161 to report.",
+    "INR {amount} credited to your A/c XX{acct} on {dmy_dash} by UPI/{ref}/{vpa}. Avl Bal INR {balance}.",
+    "Your A/c no. XXXXXXXX{acct} is debited for Rs {amount} on {dmy_dot} and credited to {vpa} (UPI Ref no {ref}) -SBI",
+    "Paid ₹{amount} to {merchant}\nPaytm Wallet\nTransaction ID: {ref}\nDate: {day_words}",
+    "Received ₹{amount} from {name}\nPhonePe transaction successful on {day_words}.",
+    "Thank you for your order!\nOrder Total: ₹{amount}\nYour order {ref} will be delivered by {day_words}.",
+    "Hi {name},\nYour bill payment of Amount: {amount} for Electricity was successful on {dmy_short}.",
+    "REFUND PROCESSED\nA refund of INR {amount} for order {ref} has been initiated to your card ending {acct}.",
+    "Cashback of Rs. {amount} credited to your wallet. Keep shopping with {merchant}!",
+    "Big Diwali Sale!\nFlat 50% off on electronics, fashion and more at {merchant}. Shop now.",
+    "Hi {name}, your weekly digest: 12 new posts from people you follow. See what you missed.",
+    "Statement for your credit card ending {acct} is ready.\nTotal due: {amount}\nMinimum due: {small}",
+)
+MERCHANTS = ('Swiggy', 'Zomato', 'Amazon', 'Flipkart', 'Uber', 'BigBasket', 'Myntra', 'BookMyShow')
+NAMES = ('Rahul Sharma', 'Priya Nair', 'Amit Verma', 'Sneha Iyer')
+MONTH_NAMES = ('January', 'Feb', 'March', 'Apr', 'May', 'June', 'Jul', 'August', 'Sept', 'Oct', 'November', 'Dec')
+
+
+def synthetic_bank_emails(count, seed=0):
+    """
+    Returns (body, internalDate) pairs resembling Indian bank, UPI, wallet
+    and shopping alerts, mixed with promotional and social mail.
+    """
+    rng = random.Random(seed)
+    emails = []
+    for _ in range(count):
+        day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.choice((2024, 2025))
+        amount = f"{rng.randint(1, 99999):,}.{rng.randint(0, 99):02d}" if rng.random() < 0.7 else str(rng.randint(1, 5000))
+        suffix = rng.choice(('st', 'nd', 'th', ''))
+        body = rng.choice(BANK_ALERT_TEMPLATES).format(
+            amount=amount,
+            small=rng.randint(100, 999),
+            balance=f"{rng.randint(1000, 500000):,}.00",
+            acct=rng.randint(1000, 9999),
+            ref=rng.randint(10 ** 11, 10 ** 12 - 1),
+            vpa=f"{rng.choice(MERCHANTS).lower()}@ok{rng.choice(('icici', 'hdfcbank', 'axis'))}",
+            merchant=rng.choice(MERCHANTS),
+            name=rng.choice(NAMES),
+            dmy=f"{day:02d}/{month:02d}/{year}",
+            dmy_dash=f"{day:02d}-{month:02d}-{year % 100:02d}",
+            dmy_dot=f"{day}.{month}.{year}",
+            dmy_short=f"{day}/{month}/{year % 100}",
+            day_words=f"{day}{suffix} {MONTH_NAMES[month - 1]} {year}",
+        )
+        if rng.random() < 0.3:
+            body = body.upper() if rng.random() < 0.5 else body.title()
+        sent = datetime.datetime(year, month, day, rng.randint(0, 23), tzinfo=datetime.timezone.utc)
+        emails.append((body, str(int(sent.timestamp() * 1000))))
+    return emails
+
+
+INBOX_SENDERS = (
+    ('Swiggy <noreply@swiggy.in>', 'Your weekend treats are here', 'Get up to 60% off on your favourite restaurants.'),
+    ('LinkedIn <messages-noreply@linkedin.com>', 'You appeared in 9 searches this week', 'See who is looking at your profile.'),
+    ('Medium Daily Digest <noreply@medium.com>', 'Stories for you', 'Ten things I learned building a startup.'),
+    ('Myntra <updates@myntra.com>', 'End of season sale starts now', 'Flat 50-80% off on top brands. Shop now.'),
+    ('GitHub <notifications@github.com>', 'Re: Fix flaky test', 'LGTM, merging once CI is green.'),
+)
+
+
+def synthetic_inbox(count, transactional_share=0.1, body_size=40000, seed=0):
+    """
+    Gmail messages resembling a typical inbox: a `transactional_share` of
+    bank alerts; the rest newsletters, social and promotional mail with
+    `body_size`-character HTML bodies.
+    """
+    rng = random.Random(seed)
+    alerts = iter(synthetic_alert_messages(count, prefix='inbox-alert'))
+    messages = []
+    for i in range(count):
+        if rng.random() < transactional_share:
+            messages.append(next(alerts))
+            continue
+        sender, subject, teaser = rng.choice(INBOX_SENDERS)
+        filler = '<p>' + ' '.join(rng.choice(('latest', 'picks', 'trending', 'deals', 'read', 'more')) for _ in range(body_size // 7)) + '</p>'
+        messages.append(make_message(f'inbox{i}', f'{teaser}\n{filler}'[:body_size], subject=subject,
+                                     sender=sender, mime_type='text/html'))
+    return messages
+
+
+CATEGORY_VOCABULARY = {
+    'Food & Dining': (('Swiggy', 'Zomato', 'Dominos', 'McDonalds', 'Pizza Hut', 'Empire Restaurant', 'Cafe Coffee Day',
+                       'Subway', 'Burger King', 'Biryani Blues'), ('restaurant', 'cafe', 'food order', 'dining', 'coffee')),
+    'Transport': (('Uber', 'Ola', 'Rapido', 'IRCTC', 'IndiGo', 'Air India', 'RedBus', 'Indian Oil', 'Shell'),
+                  ('ride', 'trip', 'fuel', 'cab', 'train ticket', 'flight', 'toll', 'metro')),
+    'Shopping': (('Amazon', 'Flipkart', 'Myntra', 'Ajio', 'Nykaa', 'Tata Cliq', 'Reliance Digital', 'Lifestyle'),
+                 ('order', 'purchase', 'store', 'fashion', 'electronics')),
+    'Bills & Utilities': (('BESCOM', 'Tata Power', 'Airtel', 'Jio', 'BSNL', 'Hathway', 'Indane Gas', 'Adani Electricity'),
+                          ('bill', 'recharge', 'electricity', 'broadband', 'postpaid', 'gas bill', 'water bill', 'premium')),
+    'Entertainment': (('BookMyShow', 'Netflix', 'Spotify', 'Hotstar', 'PVR', 'Prime Video', 'Zee5', 'Gaana'),
+                      ('movie tickets', 'subscription', 'show', 'concert', 'game', 'membership')),
+    'Health & Wellness': (('Apollo Pharmacy', 'PharmEasy', 'Practo', 'Manipal Hospital', 'MedPlus', 'Cult Fit', 'Thyrocare'),
+                          ('pharmacy', 'medicines', 'clinic', 'hospital', 'gym', 'lab test', 'consultation')),
+    'Groceries': (('BigBasket', 'Blinkit', 'Zepto', 'DMart', 'JioMart', 'Star Bazaar', 'Ratnadeep'),
+                  ('grocery', 'supermarket', 'vegetables', 'fruits', 'kirana', 'mart')),
+    'Income': (('Salary', 'Employer Payroll', 'Savings Interest', 'Dividend', 'Cashback', 'Refund'),
+               ('credited', 'received', 'salary credit', 'interest credited', 'payout')),
+    'Transfers': (('Rahul', 'Priya', 'Amit', 'Sneha', 'Vikram', 'Anjali', 'Self'),
+                  ('neft transfer to', 'imps to', 'upi transfer to', 'sent to', 'fund transfer', 'rtgs to')),
+    'Other': (('ATM', 'Charity Trust', 'Temple', 'Govt Fees', 'Courier', 'Salon'),
+              ('cash withdrawal', 'donation', 'offering', 'fee', 'charges', 'service')),
+}
+DESCRIPTION_TEMPLATES = (
+    "Paid Rs.{amount} to {merchant} {word}",
+    "UPI/{ref}/{merchant}/{word}",
+    "POS {card} {merchant} {word} INR {amount}",
+    "{merchant} {word} Rs {amount}",
+    "Your card ending {card} was used at {merchant} for {word} Rs.{amount}",
+    "{word} {merchant} Rs.{amount} on {day}/{month}",
+)
+
+
+def synthetic_categorized_descriptions(count, seed=0):
+    """Returns (description, category) pairs drawn from CATEGORY_VOCABULARY."""
+    rng = random.Random(seed)
+    categories = list(CATEGORY_VOCABULARY)
+    pairs = []
+    for _ in range(count):
+        category = rng.choice(categories)
+        merchants, words = CATEGORY_VOCABULARY[category]
+        description = rng.choice(DESCRIPTION_TEMPLATES).format(
+            merchant=rng.choice(merchants), word=rng.choice(words), amount=rng.randint(10, 20000),
+            ref=rng.randint(10 ** 11, 10 ** 12 - 1), card=rng.randint(1000, 9999),
+            day=rng.randint(1, 28), month=rng.randint(1, 12),
+        )
+        pairs.append((description, category))
+    return pairs
+
+
+def labeled_descriptions():
+    """The hand-labeled (description, category) fixture used for accuracy reports."""
+    with open(LABELED_DESCRIPTIONS) as f:
+        return [(row['description'], row['category']) for row in json.load(f)]
+
+
+def legacy_extract_transaction_details(email_body, msg_data):
+    """
+    The extractor as it was before app.extraction, kept as the reference
+    for the extraction benchmark and equivalence tests.
+    """
+    if not email_body:
+        return None
+    email_lower = email_body.lower()
+    financial_keywords = [
+        'paid', 'payment', 'received', 'sent', 'transfer', 'transaction',
+        'invoice', 'bill', 'receipt', 'statement', 'purchase', 'order',
+        'refund', 'cashback', 'reward', 'cash', 'rs.', 'inr', '₹', 'debit', 'credit',
+        'bank', 'upi', 'card', 'wallet', 'payment', 'settlement', 'clear'
+    ]
+    if not any(keyword in email_lower for keyword in financial_keywords):
+        return None
+    debit_indicators = ['debited', 'spent', 'paid', 'sent', 'purchase', 'withdrawn']
+    credit_indicators = ['credited', 'received', 'refund', 'deposit', 'cashback', 'reward']
+    transaction_type = 'debited' if any(k in email_lower for k in debit_indicators) else 'credited'
+    if any(k in email_lower for k in credit_indicators):
+        transaction_type = 'credited'
+    amount = None
+    amount_patterns = [
+        r'(?:rs\.?|inr|₹)\s*([\d,]+(?:\.\d{1,2})?)',
+        r'amount\s*[\:\-]?\s*(?:rs\.?|inr|₹)?\s*([\d,]+(?:\.\d{1,2})?)',
+        r'total\s*[\:\-]?\s*(?:rs\.?|inr|₹)?\s*([\d,]+(?:\.\d{1,2})?)',
+        r'(?:rs\.?|inr|₹)\s*([\d,]+(?:\.\d{1,2})?)\s*(?:only|rs\.?|inr|₹)?',
+    ]
+    for pattern in amount_patterns:
+        match = re.search(pattern, email_lower, re.IGNORECASE)
+        if match:
+            try:
+                amount = float(match.group(1).replace(',', ''))
+                break
+            except (ValueError, AttributeError):
+                continue
+    if amount is None:
+        return None
+    transaction_date = datetime.datetime.fromtimestamp(int(msg_data['internalDate']) / 1000, tz=datetime.timezone.utc)
+    date_patterns = [
+        r'(?:date|on)\s*[\:\-]?\s*(\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4})',
+        r'(\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+\d{4})',
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, email_body, re.IGNORECASE)
+        if match:
+            try:
+                from dateutil import parser
+                parsed_date = parser.parse(match.group(1), dayfirst=True)
+                if parsed_date:
+                    transaction_date = parsed_date.replace(tzinfo=datetime.timezone.utc)
+                    break
+            except:
+                continue
+    description = email_body.split('\n')[0][:255]
+    return {'type': transaction_type, 'amount': amount, 'date': transaction_date, 'description': description}
+
+
+def legacy_get_email_body(payload):
+    """get_email_body as it was before app.mime: decodes whole parts, keeps HTML markup."""
+    if 'parts' in payload:
+        for part in payload['parts']:
+            if part['mimeType'].startswith('multipart/'):
+                result = legacy_get_email_body(part)
+                if result:
+                    return result
+            elif part['mimeType'] == 'text/plain':
+                data = part['body'].get('data', '')
+                if data:
+                    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+        for part in payload['parts']:
+            if part['mimeType'] == 'text/html':
+                data = part['body'].get('data', '')
+                if data:
+                    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+    if 'body' in payload and 'data' in payload['body'] and payload['body']['data']:
+        return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
+    return ""
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def promotional_payload(size=1024 * 1024, seed=0):
+    """
+    A multipart/mixed payload of about `size` bytes of HTML (inline styles,
+    tracking pixels, product grids) plus an attachment of the same size.
+    """
+    rng = random.Random(seed)
+    head = '<html><head><style>' + '.c{color:#333;margin:0 auto;}' * 200 + '</style></head><body>'
+    head += '<p>Flat 50% off &amp; free delivery. Order total from Rs. 499 only!</p>'
+    cells, length = [], len(head)
+    while length < size:
+        cell = (f'<td style="padding:8px;font-family:Arial,sans-serif"><a href="https://shop.example/p/{rng.randint(1, 10 ** 9)}">'
+                f'<img src="https://cdn.example/{rng.randint(1, 10 ** 9)}.jpg" width="120"></a>'
+                f'<div>Product {rng.randint(1, 999)} &ndash; &#8377;{rng.randint(99, 9999)}</div></td>')
+        cells.append(cell)
+        length += len(cell)
+    markup = head + '<table><tr>' + ''.join(cells) + '</tr></table></body></html>'
+    return {
+        'mimeType': 'multipart/mixed',
+        'body': {'size': 0},
+        'parts': [
+            {'mimeType': 'multipart/alternative', 'body': {'size': 0}, 'parts': [
+                {'mimeType': 'text/html', 'body': {'size': len(markup), 'data': _encode(markup)}},
+            ]},
+            {'mimeType': 'application/pdf', 'filename': 'catalogue.pdf',
+             'body': {'size': size, 'data': _encode('%PDF' + 'x' * size)}},
+        ],
+    }
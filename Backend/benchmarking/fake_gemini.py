@@ -0,0 +1,53 @@
+"""
+Local stand-in for google.generativeai.GenerativeModel, for tests and
+benchmarks.
+
+Categorization prompts (see app.categorization.build_prompt) are answered
+with a JSON list of {id, category} objects chosen by keyword; any other
+prompt gets `text` back. Every prompt is recorded in `prompts`.
+"""
+import json
+
+KEYWORD_CATEGORIES = (
+    (('swiggy', 'zomato', 'restaurant', 'cafe', 'dominos'), 'Food & Dining'),
+    (('uber', 'ola', 'metro', 'irctc', 'fuel', 'petrol'), 'Transport'),
+    (('amazon', 'flipkart', 'myntra', 'order'), 'Shopping'),
+    (('electricity', 'bill', 'recharge', 'broadband'), 'Bills & Utilities'),
+    (('bookmyshow', 'netflix', 'spotify'), 'Entertainment'),
+    (('pharmacy', 'apollo', 'hospital'), 'Health & Wellness'),
+    (('bigbasket', 'blinkit', 'grocer'), 'Groceries'),
+    (('salary', 'credited', 'refund', 'cashback', 'received'), 'Income'),
+    (('upi', 'transfer', 'neft', 'imps'), 'Transfers'),
+)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name='gemini-1.5-flash', text='Keep tracking your spending.', fail=False):
+        self.model_name = model_name
+        self.text = text
+        self.fail = fail
+        self.prompts = []
+
+    def generate_content(self, prompt, generation_config=None):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError('model unavailable')
+        marker = 'Transactions:\n'
+        if marker not in prompt:
+            return FakeResponse(self.text)
+        items = json.loads(prompt.split(marker, 1)[1])
+        return FakeResponse(json.dumps([
+            {'id': item['id'], 'category': self.categorize(item['description'])} for item in items
+        ]))
+
+    @staticmethod
+    def categorize(description):
+        for keywords, category in KEYWORD_CATEGORIES:
+            if any(keyword in description for keyword in keywords):
+                return category
+        return 'Other'
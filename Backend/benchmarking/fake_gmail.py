@@ -0,0 +1,303 @@
+"""
+A small in-process stand-in for the Gmail REST API.
+
+Serves messages.list, messages.get, history.list, getProfile and the batch
+endpoint over real HTTP so
+that the sync code can be exercised (and timed) without a Google account.
+Used by the test suite and the benchmarks.
+"""
+import base64
+import json
+import re
+import threading
+import time
+import urllib.parse
+from email.parser import FeedParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MESSAGE_PATH = re.compile(r'^/gmail/v1/users/me/messages/([^/?]+)$')
+LIST_PATH = '/gmail/v1/users/me/messages'
+HISTORY_PATH = '/gmail/v1/users/me/history'
+PROFILE_PATH = '/gmail/v1/users/me/profile'
+
+
+def make_message(msg_id, body, subject='', sender='', internal_date=None, mime_type='text/plain'):
+    """
+    Builds a Gmail `format=full` message resource with a single text part.
+    """
+    if internal_date is None:
+        internal_date = int(time.time() * 1000)
+    headers = [
+        {'name': 'From', 'value': sender},
+        {'name': 'Subject', 'value': subject},
+    ]
+    data = base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')
+    return {
+        'id': msg_id,
+        'threadId': msg_id,
+        'internalDate': str(internal_date),
+        'snippet': body[:100],
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': headers,
+            'body': {'size': 0},
+            'parts': [
+                {'mimeType': mime_type, 'headers': [], 'body': {'size': len(body), 'data': data}},
+            ],
+        },
+    }
+
+
+def _metadata_view(message, header_names):
+    wanted = {name.lower() for name in header_names}
+    headers = [h for h in message['payload'].get('headers', [])
+               if not wanted or h['name'].lower() in wanted]
+    view = {k: v for k, v in message.items() if k != 'payload'}
+    view['payload'] = {'mimeType': message['payload'].get('mimeType'), 'headers': headers}
+    return view
+
+
+class FakeGmailServer:
+    """
+    Threaded HTTP server holding an in-memory mailbox.
+
+    `latency` adds a fixed delay to every HTTP round-trip, which makes the cost
+    of sequential requests visible in wall-time measurements. `fail_once` maps
+    message IDs to an HTTP status returned the first time they are requested;
+    `missing` IDs always answer 404. Every HTTP round-trip is counted in
+    `round_trips` and every response body in `bytes_sent`; IDs downloaded
+    with `format=full` are recorded in `full_requested` and list queries in
+    `queries`. `peak_in_flight` is the most requests handled at once.
+
+    Each added message gets a new mailbox history ID; `expire_history()`
+    makes all current history IDs answer 404 the way Gmail does once its
+    history retention has passed.
+    """
+
+    def __init__(self, messages=(), latency=0.0, page_size=100):
+        self.messages = {}
+        self.order = []
+        self.history = []
+        self.history_id = 1000
+        self.oldest_history_id = self.history_id
+        self.latency = latency
+        self.page_size = page_size
+        self.fail_once = {}
+        self.fail_batches = 0
+        self.missing = set()
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.requested = []
+        self.full_requested = []
+        self.queries = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+        for message in messages:
+            self.add(message)
+
+    # --- Lifecycle ---
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def root_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/"
+
+    def build_service(self, http=None):
+        """
+        Returns a googleapiclient Gmail service whose requests, including
+        batches, are sent to this server.
+        """
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc('gmail', 'v1'))
+        document['rootUrl'] = self.root_url
+        return build_from_document(document, http=http or httplib2.Http())
+
+    def add(self, message):
+        with self._lock:
+            self.messages[message['id']] = message
+            self.order.append(message['id'])
+            self.history_id += 1
+            self.history.append((self.history_id, message['id']))
+
+    def expire_history(self):
+        with self._lock:
+            self.oldest_history_id = self.history_id + 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.bytes_sent = 0
+            self.requested = []
+            self.full_requested = []
+            self.queries = []
+            self.peak_in_flight = 0
+
+    # --- Request handling ---
+
+    def _count(self):
+        with self._lock:
+            self.round_trips += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        if self.latency:
+            time.sleep(self.latency)
+
+
+    def handle_get(self, path, query):
+        """Returns (status, json-serialisable body) for a single API call."""
+        if path == LIST_PATH:
+            return 200, self._list(query)
+        if path == HISTORY_PATH:
+            return self._history(query)
+        if path == PROFILE_PATH:
+            return 200, {'emailAddress': 'user@example.com', 'messagesTotal': len(self.order),
+                         'historyId': str(self.history_id)}
+
+        match = MESSAGE_PATH.match(path)
+        if match:
+            msg_id = urllib.parse.unquote(match.group(1))
+            with self._lock:
+                self.requested.append(msg_id)
+                status = self.fail_once.pop(msg_id, None)
+            if status:
+                return status, {'error': {'code': status, 'message': 'Injected failure'}}
+            if msg_id in self.missing or msg_id not in self.messages:
+                return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}
+            message = self.messages[msg_id]
+            if query.get('format', ['full'])[0] == 'metadata':
+                return 200, _metadata_view(message, query.get('metadataHeaders', []))
+            with self._lock:
+                self.full_requested.append(msg_id)
+            return 200, message
+
+        return 404, {'error': {'code': 404, 'message': f'Unknown path {path}'}}
+
+    def _list(self, query):
+        with self._lock:
+            self.queries.append(query.get('q', [''])[0])
+        page_size = min(int(query.get('maxResults', [self.page_size])[0]), self.page_size)
+        start = int(query.get('pageToken', ['0'])[0])
+        ids = self.order[start:start + page_size]
+        body = {
+            'messages': [{'id': i, 'threadId': i} for i in ids],
+            'resultSizeEstimate': len(self.order),
+        }
+        if start + page_size < len(self.order):
+            body['nextPageToken'] = str(start + page_size)
+        return body
+
+    def _history(self, query):
+        start_id = int(query['startHistoryId'][0])
+        if start_id < self.oldest_history_id:
+            return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}
+        page_size = min(int(query.get('maxResults', [self.page_size])[0]), self.page_size)
+        offset = int(query.get('pageToken', ['0'])[0])
+        records = [(hid, msg_id) for hid, msg_id in self.history if hid > start_id]
+        page = records[offset:offset + page_size]
+        body = {
+            'history': [
+                {'id': str(hid), 'messagesAdded': [{'message': {'id': msg_id, 'threadId': msg_id,
+                                                                'labelIds': ['INBOX']}}]}
+                for hid, msg_id in page
+            ],
+            'historyId': str(self.history_id),
+        }
+        if offset + page_size < len(records):
+            body['nextPageToken'] = str(offset + page_size)
+        return 200, body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.fake._lock:
+            self.fake.bytes_sent += len(body)
+            self.fake.in_flight -= 1
+
+    def do_GET(self):
+        self.fake._count()
+        parsed = urllib.parse.urlparse(self.path)
+        status, body = self.fake.handle_get(parsed.path, urllib.parse.parse_qs(parsed.query))
+        self._send(status, body)
+
+    def do_POST(self):
+        self.fake._count()
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length).decode('utf-8')
+        if urllib.parse.urlparse(self.path).path != '/batch':
+            self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+
+        with self.fake._lock:
+            failing = self.fake.fail_batches > 0
+            if failing:
+                self.fake.fail_batches -= 1
+        if failing:
+            self._send(503, {'error': {'code': 503, 'message': 'Backend Error'}})
+            return
+
+        parser = FeedParser()
+        parser.feed(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n{raw}")
+        request = parser.close()
+
+        boundary = 'batch_fake_gmail_boundary'
+        out = []
+        for part in request.get_payload():
+            content_id = part['Content-ID'][1:-1]
+            request_line = part.get_payload().split('\n', 1)[0]
+            _, target, _ = request_line.split(' ', 2)
+            parsed = urllib.parse.urlparse(target)
+            status, body = self.fake.handle_get(parsed.path, urllib.parse.parse_qs(parsed.query))
+            out.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(body)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._send(200, ''.join(out).encode('utf-8'), f'multipart/mixed; boundary={boundary}')
@@ -1,8 +1,15 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { authHeaders, connectGoogle } from '../firebase';
 import axios from 'axios';
 import { useNavigate, Link } from 'react-router-dom';
 
+// Sync status is polled every SYNC_POLL_INTERVAL_MS for at most
+// SYNC_POLL_ATTEMPTS tries (3 minutes); a job still queued by then most
+// likely has no worker to run it yet, and the user can check back later.
+const SYNC_POLL_INTERVAL_MS = 2000;
+const SYNC_POLL_ATTEMPTS = 90;
+
 export default function Account() {
     const { currentUser } = useAuth();
     const navigate = useNavigate();
@@ -10,10 +17,46 @@ export default function Account() {
     const [error, setError] = useState(null);
     const [syncMessage, setSyncMessage] = useState('');
     const [loading, setLoading] = useState(true);
+    // Aborts the sync status polling when the page is left.
+    const pollController = useRef(null);
+
+    useEffect(() => () => pollController.current?.abort(), []);
 
-    const handleConnectGoogle = () => {
+    const handleConnectGoogle = async () => {
         if (!currentUser?.uid) return;
-        window.location.href = `http://localhost:8000/app/google/connect/?uid=${currentUser.uid}`;
+        try {
+            await connectGoogle(currentUser);
+        } catch (err) {
+            setError(err.message);
+        }
+    };
+
+    // The finished job, the job as last seen if it is still queued or running
+    // after SYNC_POLL_ATTEMPTS, or null if the page was left meanwhile.
+    const waitForSyncJob = async (jobId) => {
+        pollController.current?.abort();
+        const controller = new AbortController();
+        pollController.current = controller;
+        let job = null;
+        for (let attempt = 0; attempt < SYNC_POLL_ATTEMPTS; attempt++) {
+            await new Promise((resolve) => setTimeout(resolve, SYNC_POLL_INTERVAL_MS));
+            if (controller.signal.aborted) return null;
+            try {
+                const response = await axios.get(`http://127.0.0.1:8000/app/api/sync-status/${jobId}/`, {
+                    params: { uid: currentUser.uid },
+                    headers: await authHeaders(currentUser),
+                    signal: controller.signal,
+                });
+                job = response.data;
+            } catch (err) {
+                if (controller.signal.aborted) return null;
+                throw err;
+            }
+            if (job.job_status === 'succeeded' || job.job_status === 'failed') {
+                return job;
+            }
+        }
+        return job;
     };
 
     const handleSync = async () => {
@@ -25,11 +68,19 @@ export default function Account() {
             const response = await axios.post('http://127.0.0.1:8000/app/api/manual-sync/', { 
                 uid: currentUser.uid 
             }, {
-                headers: { 'Content-Type': 'application/json' }
+                headers: { 'Content-Type': 'application/json', ...(await authHeaders(currentUser)) }
             });
             
             if (response.data.status === 'success') {
                 setSyncMessage(response.data.message);
+                // The sync runs in the background; poll until the job finishes
+                const job = await waitForSyncJob(response.data.job_id);
+                if (!job) return;
+                if (job.job_status === 'queued' || job.job_status === 'running') {
+                    setSyncMessage(`Your sync is still ${job.job_status}. Check back in a few minutes.`);
+                    return;
+                }
+                setSyncMessage(job.job_status === 'failed' ? `Error: ${job.message}` : job.message);
                 // Refresh user data to update last_sync time and connection status
                 await fetchUserData();
             } else {
@@ -46,8 +97,9 @@ export default function Account() {
         if (!currentUser) return;
         setLoading(true);
         try {
-            const response = await axios.post('http://localhost:8000/app/api/get-user', {
-                uid: currentUser.uid,
+            const response = await axios.get('http://localhost:8000/app/api/get-user', {
+                params: { uid: currentUser.uid },
+                headers: await authHeaders(currentUser),
             });
             setUserData(response.data);
             setError(null);
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
+import { authHeaders } from '../firebase';
 import { PieChart, Pie, Cell, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, LineChart, Line } from 'recharts';
 
 // --- Chart Colors ---
@@ -11,6 +12,7 @@ const Analysis = () => {
     const [analysisData, setAnalysisData] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
+    const [loadingMore, setLoadingMore] = useState(false);
 
     
     const [selectedDate, setSelectedDate] = useState({
@@ -34,15 +36,15 @@ const Analysis = () => {
                     throw new Error('User not authenticated');
                 }
                 
-                const response = await fetch('http://127.0.0.1:8000/app/api/get-analysis/', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ 
-                        uid: currentUser.uid,
-                        email: currentUser.email,
-                        month: selectedDate.month,
-                        year: selectedDate.year,
-                    }),
+                // A GET, so the browser can revalidate its cached copy (ETag)
+                // instead of the server recomputing an unchanged analysis.
+                const params = new URLSearchParams({
+                    uid: currentUser.uid,
+                    month: selectedDate.month,
+                    year: selectedDate.year,
+                });
+                const response = await fetch(`http://127.0.0.1:8000/app/api/get-analysis/?${params}`, {
+                    headers: await authHeaders(currentUser),
                 });
 
                 if (!response.ok) {
@@ -64,6 +66,66 @@ const Analysis = () => {
     // Re-run the effect whenever the selectedDate changes
     }, [navigate, selectedDate]);
 
+    // Insights not generated yet come back as 'pending' (or 'stale', the previous
+    // text) with a poll token; ask the insights endpoint, which doesn't redo the
+    // analysis, a few times until the fresh text is ready or unavailable.
+    useEffect(() => {
+        const token = analysisData?.ai_insights_poll;
+        if (!currentUser || !token) return;
+        if ((analysisData.insightPolls || 0) >= 5) return;
+
+        const timer = setTimeout(async () => {
+            try {
+                const params = new URLSearchParams({ uid: currentUser.uid, token });
+                const response = await fetch(`http://127.0.0.1:8000/app/api/ai-insights/?${params}`, {
+                    headers: await authHeaders(currentUser),
+                });
+                if (!response.ok) return;
+                const data = await response.json();
+                setAnalysisData(prev => prev && prev.ai_insights_poll === token && ({
+                    ...prev,
+                    ai_insights: data.ai_insights,
+                    ai_insights_status: data.ai_insights_status,
+                    ai_insights_poll: data.ai_insights_poll,
+                    insightPolls: (prev.insightPolls || 0) + 1,
+                }) || prev);
+            } catch (err) {
+                console.error('Failed to refresh insights:', err);
+            }
+        }, 3000);
+        return () => clearTimeout(timer);
+    }, [analysisData, currentUser]);
+
+    const loadMoreTransactions = async () => {
+        if (!analysisData?.next_cursor) return;
+        try {
+            setLoadingMore(true);
+            const params = new URLSearchParams({
+                uid: currentUser.uid,
+                month: selectedDate.month,
+                year: selectedDate.year,
+                cursor: analysisData.next_cursor,
+            });
+            const response = await fetch(`http://127.0.0.1:8000/app/api/get-analysis/?${params}`, {
+                headers: await authHeaders(currentUser),
+            });
+            if (!response.ok) {
+                const errData = await response.json();
+                throw new Error(errData.error || 'Failed to load more transactions.');
+            }
+            const page = await response.json();
+            setAnalysisData(prev => ({
+                ...prev,
+                transactions: [...prev.transactions, ...page.transactions],
+                next_cursor: page.next_cursor,
+            }));
+        } catch (err) {
+            setError(err.message);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleDateChange = (e) => {
         const { name, value } = e.target;
         setSelectedDate(prev => ({ ...prev, [name]: parseInt(value) }));
@@ -133,6 +195,44 @@ const Analysis = () => {
                     </div>
                 </div>
 
+                {/* Trends Section */}
+                {analysisData.trends && (
+                    <div className="grid grid-cols-1 lg:grid-cols-3 gap-8 mb-8">
+                        <div className="bg-white p-6 rounded-2xl shadow-lg lg:col-span-2">
+                            <h3 className="font-semibold mb-4">Monthly Trend</h3>
+                            <ResponsiveContainer width="100%" height={300}>
+                                <LineChart data={analysisData.trends.months} margin={{ top: 5, right: 20, left: 10, bottom: 5 }}>
+                                    <CartesianGrid strokeDasharray="3 3" />
+                                    <XAxis dataKey="month" />
+                                    <YAxis tickFormatter={(value) => `₹${value/1000}k`} />
+                                    <Tooltip formatter={(value) => `₹${value.toLocaleString()}`} />
+                                    <Legend />
+                                    <Line type="monotone" dataKey="credited" name="Credited" stroke={COLORS[1]} />
+                                    <Line type="monotone" dataKey="debited" name="Debited" stroke={COLORS[3]} />
+                                    <Line type="monotone" dataKey="debited_average" name="Spending (3-month avg)" stroke={COLORS[0]} strokeDasharray="5 5" dot={false} />
+                                </LineChart>
+                            </ResponsiveContainer>
+                        </div>
+                        <div className="bg-white p-6 rounded-2xl shadow-lg">
+                            <h3 className="font-semibold mb-2">Forecast for {analysisData.trends.forecast.month}</h3>
+                            <p className="text-2xl font-bold text-gray-800 mb-6">₹{analysisData.trends.forecast.debited.toLocaleString()}</p>
+                            <h3 className="font-semibold mb-2">Recurring Payments</h3>
+                            {analysisData.trends.recurring.length === 0 ? (
+                                <p className="text-sm text-gray-500">None detected.</p>
+                            ) : (
+                                <ul className="text-sm text-gray-600 space-y-2">
+                                    {analysisData.trends.recurring.map((payment) => (
+                                        <li key={`${payment.category}-${payment.amount}`} className="flex justify-between">
+                                            <span>{(payment.description || payment.category).substring(0, 30)} ({payment.frequency})</span>
+                                            <span className="font-medium">₹{payment.amount.toLocaleString()}</span>
+                                        </li>
+                                    ))}
+                                </ul>
+                            )}
+                        </div>
+                    </div>
+                )}
+
                 {/* Transaction History */}
                 <div className="bg-white p-6 rounded-2xl shadow-lg">
                     <h3 className="font-semibold mb-4">Transaction History for Selected Period</h3>
@@ -160,6 +260,17 @@ const Analysis = () => {
                             </tbody>
                         </table>
                     </div>
+                    {analysisData.next_cursor && (
+                        <div className="mt-4 text-center">
+                            <button
+                                onClick={loadMoreTransactions}
+                                disabled={loadingMore}
+                                className="px-4 py-2 text-sm font-medium text-blue-600 hover:text-blue-800 disabled:text-gray-400"
+                            >
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        </div>
+                    )}
                 </div>
             </>
         );
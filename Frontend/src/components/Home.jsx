@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { useAuth } from "../context/AuthContext"; // Use our robust auth hook
+import { authHeaders, connectGoogle } from "../firebase";
 import {
   TrendingUp, Shield, Zap, PieChart, Smartphone, Users,
   ArrowRight, DollarSign, BarChart3, Wallet
@@ -27,16 +28,14 @@ function Home() {
       
       try {
         const today = new Date();
-        const response = await fetch('http://127.0.0.1:8000/app/api/get-analysis/', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ 
-            uid: currentUser.uid,
-            email: currentUser.email,
-            month: today.getMonth() + 1,
-            year: today.getFullYear(),
-            daily: true
-          }),
+        const params = new URLSearchParams({
+          uid: currentUser.uid,
+          month: today.getMonth() + 1,
+          year: today.getFullYear(),
+          daily: true
+        });
+        const response = await fetch(`http://127.0.0.1:8000/app/api/get-analysis/?${params}`, {
+          headers: await authHeaders(currentUser),
         });
 
         if (!response.ok) {
@@ -55,9 +54,16 @@ function Home() {
     fetchTodaysAnalysis();
   }, [isGoogleConnected, currentUser]);
 
-  const handleConnect = () => {
-    // Correct backend URL for connecting to Google
-    window.location.href = "http://localhost:8000/app/google/connect/";
+  const handleConnect = async () => {
+    if (!currentUser) {
+      navigate("/login");
+      return;
+    }
+    try {
+      await connectGoogle(currentUser);
+    } catch (err) {
+      setError(err.message);
+    }
   };
 
   const handleGetStarted = () => {
@@ -134,13 +140,9 @@ function Home() {
       );
     }
 
-    const totalCredits = todayData.transactions
-      .filter(tx => tx.transaction_type === 'credited')
-      .reduce((sum, tx) => sum + parseFloat(tx.amount), 0);
-      
-    const totalDebits = todayData.transactions
-      .filter(tx => tx.transaction_type === 'debited')
-      .reduce((sum, tx) => sum + parseFloat(tx.amount), 0);
+    // Totals cover the whole day; the transaction list is only its first page.
+    const totalCredits = todayData.pie_chart_data.credited;
+    const totalDebits = todayData.pie_chart_data.debited;
 
     return (
       <div className="max-w-6xl mx-auto p-4 sm:p-6">
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { createUserWithEmailAndPassword } from 'firebase/auth';
-import { auth } from '../firebase';
+import { auth, authHeaders } from '../firebase';
 import { User, Mail, Lock, Briefcase, DollarSign, Heart, User as GenderIcon } from 'lucide-react';
 import { motion } from 'framer-motion';
 
@@ -42,7 +42,7 @@ const Register = () => {
 
             const backendResponse = await fetch('http://127.0.0.1:8000/app/api/create-profile/', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...(await authHeaders(user)) },
                 body: JSON.stringify({
                     firebase_uid: user.uid,
                     full_name: formData.fullName,
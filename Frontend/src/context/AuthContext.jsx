@@ -1,6 +1,6 @@
 import { createContext, useState, useEffect, useMemo, useContext } from "react";
 import { onAuthStateChanged } from "firebase/auth";
-import { auth } from "../firebase";
+import { auth, authHeaders } from "../firebase";
 import axios from "axios";
 
 const AuthContext = createContext(null); // No longer exported
@@ -16,8 +16,9 @@ export const AuthContextProvider = ({ children }) => {
       
       if (user) {
         try {
-          const response = await axios.post('http://localhost:8000/app/api/get-user', {
-            uid: user.uid,
+          const response = await axios.get('http://localhost:8000/app/api/get-user', {
+            params: { uid: user.uid },
+            headers: await authHeaders(user),
           });
           setBackendUserData(response.data);
         } catch (error) {
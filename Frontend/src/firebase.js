@@ -20,4 +20,24 @@ const firebaseConfig = {
 // Initialize Firebase
 const app = initializeApp(firebaseConfig);
 const analytics = getAnalytics(app);
-export const auth = getAuth(app);
\ No newline at end of file
+export const auth = getAuth(app);
+
+// Headers authenticating a backend API request as the signed-in user. The SDK
+// reuses the ID token until shortly before it expires.
+export async function authHeaders(user = auth.currentUser) {
+  return user ? { Authorization: `Bearer ${await user.getIdToken()}` } : {};
+}
+
+// Sends the browser through Google's consent screen to connect Gmail. The
+// backend only accepts a short-lived state signed for the signed-in user.
+export async function connectGoogle(user = auth.currentUser) {
+  const params = new URLSearchParams({ uid: user.uid });
+  const response = await fetch(`http://localhost:8000/app/api/google/state/?${params}`, {
+    headers: await authHeaders(user),
+  });
+  if (!response.ok) {
+    throw new Error(`Could not start connecting Google (${response.status})`);
+  }
+  const { state } = await response.json();
+  window.location.href = `http://localhost:8000/app/google/connect/?state=${encodeURIComponent(state)}`;
+}
\ No newline at end of file